@@ -0,0 +1,141 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import json
+import tempfile
+import threading
+import zlib
+
+
+# The resource fields tasks look at. Everything else stays in the packed
+# body until somebody asks for it.
+KEPT_FIELDS = ('id', 'name', 'network_id', 'subnet_id', 'tenant_id',
+               'device_id', 'cidr', 'ip_version', 'fixed_ips', 'address',
+               'port_ids', 'status')
+
+
+class Artifact(object):
+    """Compact record of something a task stored.
+
+    Only the commonly used fields are kept in memory. The full body is
+    packed (compressed, or appended to a spill file) and decoded again on
+    each access to body.
+    """
+    __slots__ = ('key', 'resource', 'id', 'name', 'task', 'fields', '_store',
+                 '_packed')
+
+    def __init__(self, store, key, body, task=None):
+        self._store = store
+        self.key = key
+        self.task = task
+        self.resource = None
+        inner = body
+        if isinstance(body, dict) and len(body) == 1:
+            self.resource = list(body)[0]
+            inner = body[self.resource]
+        self.fields = {}
+        if isinstance(inner, dict):
+            self.fields = dict((f, inner[f]) for f in KEPT_FIELDS
+                               if f in inner)
+        self.id = self.fields.get('id')
+        self.name = self.fields.get('name')
+        self._packed = store._pack(body)
+
+    @property
+    def body(self):
+        return self._store._unpack(self._packed)
+
+    def __repr__(self):
+        return "<Artifact %s id=%s name=%s>" % (self.key, self.id, self.name)
+
+
+class ArtifactStore(object):
+    """Artifacts indexed by key, resource id, name and producing task.
+
+    With a spill_dir the packed bodies go to a temporary file there rather
+    than staying in memory.
+    """
+
+    def __init__(self, spill_dir=None):
+        self.lock = threading.RLock()
+        self.spill_dir = spill_dir
+        self.spill = None
+        self.by_key = {}
+        self.by_id = {}
+        self.by_name = {}
+        self.by_task = {}
+
+    def _pack(self, body):
+        data = zlib.compress(json.dumps(body).encode('utf-8'))
+        if self.spill_dir is None:
+            return data
+        with self.lock:
+            if self.spill is None:
+                self.spill = tempfile.TemporaryFile(dir=self.spill_dir,
+                                                    prefix='sail-artifacts-')
+            self.spill.seek(0, 2)
+            offset = self.spill.tell()
+            self.spill.write(data)
+            return (offset, len(data))
+
+    def _unpack(self, packed):
+        if isinstance(packed, tuple):
+            offset, length = packed
+            with self.lock:
+                self.spill.seek(offset)
+                packed = self.spill.read(length)
+        return json.loads(zlib.decompress(packed).decode('utf-8'))
+
+    def add(self, key, body, task=None):
+        artifact = Artifact(self, key, body, task)
+        with self.lock:
+            self.by_key.setdefault(key, []).append(artifact)
+            if artifact.id is not None:
+                self.by_id[artifact.id] = artifact
+            if artifact.name is not None:
+                self.by_name.setdefault(artifact.name, []).append(artifact)
+            if task is not None:
+                self.by_task.setdefault(task, []).append(artifact)
+        return artifact
+
+    def __contains__(self, key):
+        return key in self.by_key
+
+    def get(self, key, producer=None):
+        """Returns the artifacts stored under key, optionally only those
+        stored by the producer task.
+        """
+        with self.lock:
+            if producer is not None:
+                return [a for a in self.by_task.get(producer, [])
+                        if a.key == key]
+            return list(self.by_key.get(key, []))
+
+    def by_resource_id(self, id):
+        return self.by_id.get(id)
+
+    def named(self, name):
+        with self.lock:
+            return list(self.by_name.get(name, []))
+
+    def produced_by(self, task):
+        with self.lock:
+            return list(self.by_task.get(task, []))
+
+    def close(self):
+        with self.lock:
+            if self.spill is not None:
+                self.spill.close()
+                self.spill = None
@@ -0,0 +1,367 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import fnmatch
+import gc
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from sail.cassette import Cassette
+from sail.cassette import Replayer
+from sail.context import set_current_context
+from sail import log
+from sail.services.network import NetworkService
+from sail.session import Session
+import sail.tasks.network as net
+from sail.tasks.task import Task
+from sail.utils.auth import AuthResponse
+from sail.utils.generators import ArtifactGenerator
+from sail.utils.generators import NetworkGenerator
+
+
+BASELINE_VERSION = 1
+DEFAULT_BASELINE = os.path.join('~', '.sail', 'bench_baseline.json')
+
+NETWORK_ID = '5c8a1f0e-6d2b-4c3e-9f1a-2b7d8e9c0a11'
+NETWORK = {"network": {
+    "id": NETWORK_ID,
+    "name": "sail_network_1",
+    "tenant_id": "123456",
+    "status": "ACTIVE",
+    "admin_state_up": True,
+    "shared": False,
+    "subnets": ["a0304c3a-4f08-4c43-88af-d796509c97d2"]}}
+PORT = {"port": {
+    "id": "8c2e1e9b-6a1f-4e3c-bb0e-3d1f2a9c7e55",
+    "name": "sail_port_1",
+    "network_id": NETWORK_ID,
+    "tenant_id": "123456",
+    "device_id": "b6f1b7a1-8c5e-4d8f-9e0e-0c6d1a7e2f33",
+    "device_owner": "compute:None",
+    "mac_address": "fa:16:3e:5d:7b:2e",
+    "admin_state_up": True,
+    "status": "ACTIVE",
+    "fixed_ips": [{"subnet_id": "a0304c3a-4f08-4c43-88af-d796509c97d2",
+                   "ip_address": "192.168.0.10"},
+                  {"subnet_id": "e1f7a5b2-3c4d-4e6f-8a9b-0c1d2e3f4a5b",
+                   "ip_address": "fd00::10"}],
+    "security_groups": ["c3b4d5e6-f7a8-4b9c-8d0e-1f2a3b4c5d6e"]}}
+IDENTITY = {"access": {"token": {"id": "bench-token",
+                                 "tenant": {"id": "123456"}},
+                       "serviceCatalog": []}}
+
+MEASURED = ('ops', 'seconds', 'ops_per_sec', 'usec_per_op')
+
+# What the CLI may cost before it has anything to do, and the modules it
+# must not have loaded by then.
+STARTUP_BUDGET = 0.1
+HEAVY_MODULES = ('requests', 'urllib3', 'ijson', 'sail.services.network',
+                 'sail.tasks.network', 'sail.cassette')
+
+_PROBE = """
+import json, sys, time
+start = time.time()
+try:
+    from sail.executable import run_sail
+    run_sail(args=json.loads(sys.argv[1]), prog_name='sail')
+except BaseException:
+    pass
+sys.stderr.write('SAIL_STARTUP ' + json.dumps({
+    'seconds': time.time() - start,
+    'modules': [m for m, v in sys.modules.items() if v is not None]}) + '\\n')
+"""
+
+BENCHMARKS = []
+
+
+def benchmark(name, ops):
+    """Registers a benchmark that runs ops operations per round.
+
+    The decorated function does the setup and returns the operation to
+    time, or an (operation, teardown) pair.
+    """
+    def register(setup):
+        BENCHMARKS.append((name, ops, setup))
+        return setup
+    return register
+
+
+class _Fixture(object):
+    """A context with the network service for benchmarks to work in."""
+
+    def __init__(self, service=None):
+        self.session = Session(log_level=log.ERROR, log_history=1)
+        self.service = service or _OfflineService()
+        self.context = None
+
+    def open(self):
+        self.context = self.session.new_context(AuthResponse(IDENTITY),
+                                                [self.service])
+        set_current_context(self.context)
+        return self.context
+
+    def close(self):
+        set_current_context(None)
+        self.context.tasks = []
+        self.context.artifacts.close()
+        self.session.close()
+
+
+class _OfflineService(object):
+    name = 'network'
+
+
+@benchmark('task.construct', 20000)
+def bench_task_construct():
+    fixture = _Fixture()
+    fixture.open()
+    return net.CreateNetwork, fixture.close
+
+
+@benchmark('task.dependencies', 20)
+def bench_task_dependencies():
+    fixture = _Fixture()
+    context = fixture.open()
+    for _ in range(100):
+        create = net.CreateNetwork()
+        net.DeleteNetwork(notify_success=[create])
+    tasks = list(context.tasks)
+
+    def resolve():
+        for task in tasks:
+            task.dependencies_in(tasks)
+    return resolve, fixture.close
+
+
+@benchmark('artifact.store', 20000)
+def bench_artifact_store():
+    fixture = _Fixture()
+    context = fixture.open()
+    task = Task()
+    return (lambda: context.add_artifact('port', PORT, task)), fixture.close
+
+
+@benchmark('artifact.retrieve', 20000)
+def bench_artifact_retrieve():
+    fixture = _Fixture()
+    context = fixture.open()
+    tasks = [Task() for _ in range(1000)]
+    for task in tasks:
+        context.add_artifact('port', PORT, task)
+    producers = itertools.cycle(tasks)
+
+    def retrieve():
+        for artifact in context.find_artifacts('port', next(producers)):
+            artifact.body
+    return retrieve, fixture.close
+
+
+@benchmark('generator.network', 50000)
+def bench_generator():
+    generator = ArtifactGenerator()
+    generator.register_generator(NetworkGenerator())
+    return lambda: generator.generate('network')
+
+
+@benchmark('json.encode.network', 20000)
+def bench_encode_network():
+    return lambda: json.dumps(NETWORK)
+
+
+@benchmark('json.decode.network', 20000)
+def bench_decode_network():
+    raw = json.dumps(NETWORK)
+    return lambda: json.loads(raw)
+
+
+@benchmark('json.encode.port', 20000)
+def bench_encode_port():
+    return lambda: json.dumps(PORT)
+
+
+@benchmark('json.decode.port', 20000)
+def bench_decode_port():
+    raw = json.dumps(PORT)
+    return lambda: json.loads(raw)
+
+
+@benchmark('e2e.create_delete', 200)
+def bench_create_delete():
+    """A create and delete of a network against a local stub endpoint."""
+    cassette = Cassette([
+        {'key': 'POST /v2.0/networks', 'status': 201,
+         'headers': {'Content-Type': 'application/json'},
+         'body': json.dumps(NETWORK)},
+        {'key': 'DELETE /v2.0/networks/%s' % NETWORK_ID, 'status': 204,
+         'headers': {}, 'body': ''}])
+    replayer = Replayer(cassette).start()
+    service = NetworkService({'network': {'endpoint': replayer.url,
+                                          'version': 'v2.0'}})
+    fixture = _Fixture(service)
+
+    def cycle():
+        context = fixture.open()
+        with context:
+            create = net.CreateNetwork()
+            create()
+            net.DeleteNetwork(notify_success=[create])()
+
+    def teardown():
+        fixture.close()
+        service.close()
+        replayer.stop()
+    return cycle, teardown
+
+
+def _time(op, ops):
+    gcold = gc.isenabled()
+    gc.disable()
+    try:
+        start = time.time()
+        for _ in range(ops):
+            op()
+        return time.time() - start
+    finally:
+        if gcold:
+            gc.enable()
+
+
+def run_benchmarks(pattern='*', repeat=3, scale=1.0):
+    """Runs the matching benchmarks, keeping the best of repeat rounds."""
+    results = {}
+    for name, ops, setup in BENCHMARKS:
+        if not fnmatch.fnmatch(name, pattern):
+            continue
+        ops = max(1, int(ops * scale))
+        best = None
+        for _ in range(repeat):
+            op = setup()
+            teardown = None
+            if isinstance(op, tuple):
+                op, teardown = op
+            try:
+                elapsed = _time(op, ops)
+            finally:
+                if teardown is not None:
+                    teardown()
+            if best is None or elapsed < best:
+                best = elapsed
+        best = best or 1e-9
+        results[name] = {'ops': ops,
+                         'seconds': best,
+                         'ops_per_sec': ops / best,
+                         'usec_per_op': best * 1e6 / ops}
+    return results
+
+
+def load_baseline(path):
+    path = os.path.expanduser(path)
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if data.get('version') != BASELINE_VERSION:
+        return None
+    return data.get('results')
+
+
+def save_baseline(path, results):
+    """Stores results as the baseline, keeping benchmarks not rerun."""
+    merged = load_baseline(path) or {}
+    for name, result in results.items():
+        merged[name] = dict((k, result[k]) for k in MEASURED)
+    path = os.path.expanduser(path)
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory, 0o700)
+    with open(path, 'w') as f:
+        json.dump({'version': BASELINE_VERSION,
+                   'python': platform.python_version(),
+                   'created': time.time(),
+                   'results': merged}, f, indent=2, sort_keys=True)
+
+
+def compare(results, baseline, tolerance=0.2):
+    """Annotates results with their change against the baseline.
+
+    A benchmark regressed when its throughput dropped by more than
+    tolerance, and improved when it rose by more than that.
+    """
+    for name, result in results.items():
+        base = (baseline or {}).get(name)
+        if base is None:
+            result['status'] = 'new'
+            continue
+        change = result['ops_per_sec'] / base['ops_per_sec'] - 1.0
+        result['baseline_ops_per_sec'] = base['ops_per_sec']
+        result['change'] = change
+        if change < -tolerance:
+            result['status'] = 'regressed'
+        elif change > tolerance:
+            result['status'] = 'improved'
+        else:
+            result['status'] = 'ok'
+    return [n for n, r in results.items() if r['status'] == 'regressed']
+
+
+def _probe(args):
+    proc = subprocess.Popen([sys.executable, '-c', _PROBE, json.dumps(args)],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, err = proc.communicate()
+    for line in err.decode('utf-8', 'replace').splitlines():
+        if line.startswith('SAIL_STARTUP '):
+            return json.loads(line[len('SAIL_STARTUP '):])
+    raise RuntimeError("Startup probe failed: %s" % err)
+
+
+def run_startup(repeat=3, budget=STARTUP_BUDGET):
+    """Times the CLI up to --help and up to rejecting a bad config.
+
+    Each probe is a fresh interpreter, so nothing is already imported. A
+    check fails when its fastest round is over budget or it loaded any of
+    HEAVY_MODULES.
+    """
+    fd, conf = tempfile.mkstemp(suffix='.conf')
+    os.write(fd, b"[nothing]\n")
+    os.close(fd)
+    checks = [('startup.help', ['--help']),
+              ('startup.validate', ['--auth-config-file', conf])]
+    results = {}
+    try:
+        for name, args in checks:
+            best = None
+            for _ in range(repeat):
+                probe = _probe(args)
+                if best is None or probe['seconds'] < best['seconds']:
+                    best = probe
+            heavy = sorted(m for m in best['modules']
+                           if any(m == h or m.startswith(h + '.')
+                                  for h in HEAVY_MODULES))
+            results[name] = {'seconds': best['seconds'],
+                             'budget': budget,
+                             'modules': len(best['modules']),
+                             'heavy': heavy,
+                             'status': ('over_budget' if heavy or
+                                        best['seconds'] > budget else 'ok')}
+    finally:
+        os.unlink(conf)
+    return results
@@ -0,0 +1,256 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import gzip
+import json
+import random
+import re
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler
+    from http.server import HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qsl
+    from urllib.parse import urlencode
+    from urllib.parse import urlsplit
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    from BaseHTTPServer import HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib import urlencode
+    from urlparse import parse_qsl
+    from urlparse import urlsplit
+
+import sail.exceptions.common as exc
+
+
+CASSETTE_VERSION = 1
+KEPT_HEADERS = ('Content-Type', 'Retry-After', 'ETag')
+UUID_RE = re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-'
+                     r'[0-9a-fA-F]{4}-[0-9a-fA-F]{12}')
+REPLAYED_TOKEN = 'replayed-token'
+
+
+def request_key(method, url):
+    """Method, path and sorted query of a request, the key replay matches."""
+    parts = urlsplit(url)
+    key = "%s %s" % (method.upper(), parts.path)
+    if parts.query:
+        key += "?" + urlencode(sorted(parse_qsl(parts.query)))
+    return key
+
+
+def template_key(key):
+    """The key with resource ids blanked, for requests naming new ids."""
+    return UUID_RE.sub('{id}', key)
+
+
+def _scrub(body):
+    """Drops the secrets of an identity response before it is written.
+
+    The token is replaced and its expiry removed, so a replayed token never
+    looks stale and the cassette is safe to share.
+    """
+    try:
+        data = json.loads(body)
+        token = data['access']['token']
+    except (ValueError, KeyError, TypeError):
+        return body
+    token['id'] = REPLAYED_TOKEN
+    token.pop('expires', None)
+    return json.dumps(data)
+
+
+class Cassette(object):
+    """Recorded request/response pairs, stored as gzipped JSON.
+
+    Request bodies and headers are not kept; replay only matches on the
+    method, path and query.
+    """
+
+    def __init__(self, interactions=None):
+        self.interactions = interactions or []
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with gzip.open(path, 'rb') as f:
+                data = json.loads(f.read().decode('utf-8'))
+        except (IOError, OSError, ValueError) as e:
+            raise exc.ParsingError("Could not read cassette %s: %s" %
+                                   (path, e))
+        if data.get('version') != CASSETTE_VERSION:
+            raise exc.ParsingError("Unsupported cassette version %s" %
+                                   data.get('version'))
+        return cls(data['interactions'])
+
+    def save(self, path):
+        with self.lock:
+            data = {'version': CASSETTE_VERSION,
+                    'interactions': self.interactions}
+        with gzip.open(path, 'wb') as f:
+            f.write(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+
+    def record(self, r, *args, **kwargs):
+        """Response hook for requests; reads and keeps the whole body."""
+        body = r.text
+        if r.request.method == 'POST' and '"access"' in body:
+            body = _scrub(body)
+        headers = dict((h, r.headers[h]) for h in KEPT_HEADERS
+                       if h in r.headers)
+        with self.lock:
+            self.interactions.append({
+                'key': request_key(r.request.method, r.url),
+                'status': r.status_code,
+                'headers': headers,
+                'body': body,
+                'elapsed': r.elapsed.total_seconds()})
+        return r
+
+    def hooks(self):
+        return {'response': self.record}
+
+
+class _ReplayServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+    allow_reuse_address = True
+
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; with Nagle on, each
+    # response would wait on the client's delayed ACK.
+    disable_nagle_algorithm = True
+
+    def _replay(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        interaction = self.server.replayer.next(self.command, self.path)
+        if interaction is None:
+            status, headers = 404, {'Content-Type': 'application/json'}
+            body = json.dumps({'message': "No recorded response for %s %s" %
+                               (self.command, self.path)})
+        else:
+            status = interaction['status']
+            headers = interaction['headers']
+            body = interaction['body']
+            delay = self.server.replayer.delay(interaction)
+            if delay > 0:
+                time.sleep(delay)
+        data = body.encode('utf-8')
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _replay
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Replayer(object):
+    """Serves a cassette from an HTTP server in this process.
+
+    Responses recorded for the same request are handed out in order and
+    start over once exhausted, so a short recording can back a long load
+    run. A request that was never recorded exactly is matched with its ids
+    blanked. latency adds a fixed delay to every response, or reuses the
+    recorded response times when it is 'recorded'; jitter adds up to that
+    many more seconds at random.
+    """
+
+    def __init__(self, cassette, latency=0.0, jitter=0.0, host='127.0.0.1',
+                 port=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.lock = threading.Lock()
+        self.cursors = {}
+        self.exact = {}
+        self.templates = {}
+        for interaction in cassette.interactions:
+            key = interaction['key']
+            self.exact.setdefault(key, []).append(interaction)
+            self.templates.setdefault(template_key(key), []).append(
+                interaction)
+        self.server = _ReplayServer((host, port), _ReplayHandler)
+        self.server.replayer = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return "http://%s:%d" % (host, port)
+
+    def rewrite(self, endpoint):
+        """Points an endpoint URL at the replay server, keeping its path."""
+        parts = urlsplit(endpoint)
+        url = self.url + parts.path
+        if parts.query:
+            url += "?" + parts.query
+        return url
+
+    def next(self, method, path):
+        key = request_key(method, path)
+        with self.lock:
+            candidates = self.exact.get(key)
+            if candidates is None:
+                key = template_key(key)
+                candidates = self.templates.get(key)
+            if not candidates:
+                return None
+            cursor = self.cursors.get(key, 0)
+            self.cursors[key] = cursor + 1
+        return candidates[cursor % len(candidates)]
+
+    def delay(self, interaction):
+        if self.latency == 'recorded':
+            delay = interaction.get('elapsed', 0.0)
+        else:
+            delay = self.latency or 0.0
+        if self.jitter:
+            delay += random.uniform(0, self.jitter)
+        return delay
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.thread is not None:
+            self.server.shutdown()
+            self.thread.join()
+            self.thread = None
+        self.server.server_close()
+
+
+def parse_latency(value):
+    """Accepts a number of seconds or 'recorded'."""
+    if value is None or value == 'recorded':
+        return value
+    try:
+        return float(value)
+    except ValueError:
+        raise exc.DataFormatError("Latency must be seconds or 'recorded', "
+                                  "not %s" % value)
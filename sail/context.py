@@ -13,10 +13,47 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 #
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from sail.artifacts import ArtifactStore
+import sail.exceptions.common as exc
+from sail import log
+from sail.utils.deadline import Deadline
+from sail.utils.pool import WorkerPool
+
+
+_local = threading.local()
+
+
+def current_context():
+    """Returns the context set up by the calling thread, if any."""
+    return getattr(_local, 'context', None)
+
+
+def set_current_context(context):
+    _local.context = context
 
 
 class BaseContext(object):
-    def __init__(self, auth_info, services):
+    """Holds what a run shares and undoes its tasks when it ends.
+
+    run_budget bounds the whole run from entering the context, and
+    task_deadline each task unless it sets its own. Once the run ends,
+    or its budget runs out, teardown starts with a budget of its own,
+    teardown_budget. Undos it has no time left for are counted in
+    undo_timeouts and left to the journal. Teardown first deletes what
+    creates that timed out made after all, counted in reaped.
+    """
+
+    def __init__(self, auth_info, services, undo_workers=1,
+                 artifact_spill_dir=None, run_budget=None,
+                 teardown_budget=None, task_deadline=None):
         self.service_list = {}
         for service in services:
             if not hasattr(service, 'name'):
@@ -26,44 +63,220 @@ class BaseContext(object):
         self.session = None
         self.auth_info = auth_info
         self.state = "Do"
-        self.artifacts = {}
+        self.artifacts = ArtifactStore(spill_dir=artifact_spill_dir)
+        self.lock = threading.RLock()
+        self.undo_workers = undo_workers
+        self.undone = 0
+        self.undo_failures = []
+        self.undo_timeouts = []
+        self.unsure = []
+        self.reaped = 0
+        self.run_budget = run_budget
+        self.teardown_budget = teardown_budget
+        self.task_deadline = task_deadline
+        self.budget = Deadline()
 
-    def add_artifact(self, key, artifact):
-        if key not in self.artifacts:
-            self.artifacts[key] = []
-        self.artifacts[key].append(artifact) 
+    def add_artifact(self, key, artifact, task=None):
+        return self.artifacts.add(key, artifact, task)
 
     def get_artifacts(self, key):
         if key not in self.artifacts:
             return None
-        return self.artifacts[key]
+        return [a.body for a in self.artifacts.get(key)]
+
+    def find_artifacts(self, key, producer=None):
+        return self.artifacts.get(key, producer)
 
     def log(self, msg):
-        self.session.log("[%s%s" % (self.state, msg))
+        self.session.log(msg, state=self.state,
+                         source=self.__class__.__name__)
+
+    def emit(self, level, source, tag, fmt, *args):
+        self.session.logger.log(level, self.state, source, tag, fmt, *args)
 
     def set_session(self, session):
         self.session = session
 
     def register(self, task):
-        self.tasks.append(task)
+        with self.lock:
+            self.tasks.append(task)
 
     def request_service(self, service_name):
         return self.service_list.get(service_name)
 
+    def record_call(self, service, verb, resource, stats):
+        if self.session is not None:
+            self.session.metrics.observe((service, verb, resource), stats)
+
+    def record_converge(self, service, resource, seconds):
+        if self.session is not None:
+            self.session.metrics.observe_converge((service, resource),
+                                                  seconds)
+
+    def record_change(self, op, service, resource, ids):
+        journal = getattr(self.session, 'journal', None)
+        if journal is not None:
+            journal.record(op, service.name, service.endpoint, resource, ids)
+
+    def record_unsure(self, service, resource, names):
+        """Notes the names of a create that timed out."""
+        if names:
+            with self.lock:
+                self.unsure.append((service, resource, names))
+
+    def deadline(self, seconds=None):
+        """A deadline for one task, within the budget of the run."""
+        if seconds is None:
+            seconds = self.task_deadline
+        return self.budget.child(seconds)
+
     def __enter__(self):
         self.state = "Do"
+        self.budget = Deadline(self.run_budget)
 
     def __exit__(self, type, value, tb):
+        if type is not None:
+            # Whatever is still running stops at its next call.
+            self.budget.cancel()
         self.state = "Undo"
+        self.budget = Deadline(self.teardown_budget)
+        with self.budget:
+            self._reap_unsure()
+            if self.undo_workers > 1:
+                self._parallel_undo()
+            else:
+                self._serial_undo()
+        self.artifacts.close()
+        return False
+
+    def _reap_unsure(self):
+        """Deletes what creates that timed out made after all.
+
+        Generated names carry the run, so listing by them only finds what
+        this run made. Nothing can have been made on those resources, so
+        they go before the tasks are undone.
+        """
+        with self.lock:
+            unsure, self.unsure = self.unsure, []
+        name = self.__class__.__name__
+        for service, resource, names in reversed(unsure):
+            try:
+                listed = getattr(service, 'iter_%s' % resource)
+                ids = [item['id'] for item in listed(self, name=names)]
+                if not ids:
+                    continue
+                delete = getattr(service, 'delete_%s' % resource)
+                self.reaped += sum(1 for r in delete(self, ids)
+                                   if r.success)
+            except Exception as e:
+                self.emit(log.WARNING, name, "EXCEPT(ignored)", "%s", e)
+        if self.reaped:
+            self.emit(log.INFO, name, "SUMMARY", "deleted %d resources "
+                      "made by creates that timed out", self.reaped)
+
+    def _serial_undo(self):
         while self.tasks:
             task = self.tasks.pop()
-            task.undo()
+            if self.budget.expired():
+                self.undo_timeouts.append(task.__class__.__name__)
+                continue
+            try:
+                if not self._undo_task(task):
+                    self.undo_failures.append(task.__class__.__name__)
+            except exc.TimedOut as e:
+                task.log_timeout("Undo: %s", e)
+                self.undo_timeouts.append(task.__class__.__name__)
+                continue
+            self.undone += 1
+
+    def _undo_task(self, task):
+        was_successful = task.was_successful()
+        task.undo()
+        if not was_successful or task.was_successful():
+            return True
+        if self.budget.expired():
+            raise exc.TimedOut("Teardown is out of time")
         return False
 
+    def _parallel_undo(self):
+        """Undoes tasks concurrently, leaving dependents' undo to go first.
+
+        A task is only undone once every later task that depends on it (for
+        example ports on the network they were created in) has been undone.
+        """
+        with self.lock:
+            tasks = self.tasks
+            self.tasks = []
+        blockers = dict((t, 0) for t in tasks)
+        parents = {}
+        for index, task in enumerate(tasks):
+            parents[task] = task.dependencies_in(tasks[:index])
+            for parent in parents[task]:
+                blockers[parent] += 1
+
+        start = time.time()
+        finished = queue.Queue()
+        failures = []
+        timeouts = []
+        settled = set()
+        outstanding = 0
+        pool = WorkerPool(self.undo_workers)
+        try:
+            ready = [t for t in reversed(tasks) if not blockers[t]]
+            while ready or outstanding:
+                if self.budget.expired():
+                    ready = []
+                for task in ready:
+                    future = pool.submit(self._undo_task, task)
+                    future.add_done_callback(
+                        lambda f, task=task: finished.put((task, f)))
+                    outstanding += 1
+                ready = []
+                if not outstanding:
+                    break
+                task, future = finished.get()
+                outstanding -= 1
+                settled.add(task)
+                error = future.exception()
+                if isinstance(error, exc.TimedOut):
+                    task.log_timeout("Undo: %s", error)
+                    timeouts.append(task)
+                elif error is not None:
+                    task.log_ignored_exception(error)
+                    failures.append(task)
+                elif not future.result():
+                    failures.append(task)
+                for parent in parents[task]:
+                    blockers[parent] -= 1
+                    if not blockers[parent]:
+                        ready.append(parent)
+        finally:
+            pool.shutdown()
+        undone = len(settled) - len(timeouts)
+        # Undos the budget ran out before.
+        timeouts.extend(t for t in tasks if t not in settled)
+        self._log_undo_summary(undone, failures, timeouts,
+                               time.time() - start)
+
+    def _log_undo_summary(self, count, failures, timeouts, elapsed):
+        self.undone += count
+        self.undo_failures.extend(t.__class__.__name__ for t in failures)
+        self.undo_timeouts.extend(t.__class__.__name__ for t in timeouts)
+        name = self.__class__.__name__
+        self.emit(log.INFO, name, "SUMMARY",
+                  "undid %d tasks in %.3fs, %d failed, %d timed out", count,
+                  elapsed, len(failures), len(timeouts))
+        for task in failures:
+            self.emit(log.ERROR, name, "FAILED", "%s",
+                      task.__class__.__name__)
+        for task in timeouts:
+            self.emit(log.ERROR, name, "TIMEOUT", "%s",
+                      task.__class__.__name__)
+
 
 class SetupContext(BaseContext):
-    def __init__(self, auth_info, services):
-        super(SetupContext, self).__init__(auth_info, services)
+    def __init__(self, auth_info, services, **kwargs):
+        super(SetupContext, self).__init__(auth_info, services, **kwargs)
         self.ignore_errors = False
 
     def __enter__(self):
@@ -27,3 +27,21 @@ class DataFormatError(FatalException):
 
 class MissingRequiredInformation(FatalException):
     pass
+
+
+class DependencyCycle(FatalException):
+    pass
+
+
+class ResourceExhausted(FatalException):
+    pass
+
+
+class ServiceError(FatalException):
+    def __init__(self, msg, response=None):
+        super(ServiceError, self).__init__(msg)
+        self.response = response
+
+
+class TimedOut(FatalException):
+    pass
@@ -13,15 +13,18 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 #
+import json
+
 import click
-import configobj
 
-import sail.tasks.network as net
-from sail.services.network import NetworkService
-import sail.session as session
-import sail.utils.auth as auth
+from sail import log
+from sail import metrics
+from sail.services import SERVICES
 import sail.exceptions.common as exc
 
+# Everything else is imported by the commands that need it, so --help and
+# runs that stop at config validation never load requests or the tasks.
+
 
 command_settings = {
     'ignore_unknown_options': True,
@@ -29,6 +32,7 @@ command_settings = {
 
 
 def _load_config(file):
+    import configobj
     try:
         config = configobj.ConfigObj(file, raise_errors=True)
         return config
@@ -36,35 +40,187 @@ def _load_config(file):
         raise exc.ParsingError(e)
 
 
-@click.command(context_settings=command_settings)
+def _scenario(opts):
+    """Compiles the scenario file, or the built-in scenario without one."""
+    from sail import scenario
+    if opts['scenario'] is None:
+        return scenario.default_plan()
+    return scenario.load_scenario(opts['scenario'])
+
+
+def _runner(plan, workers):
+    def run():
+        plan.run(workers)
+    return run
+
+
+def _journal_dir(path):
+    from sail import journal
+    return path or journal.DEFAULT_JOURNAL_DIR
+
+
+def _connect(ctx):
+    """Authenticates and builds the services for the invocation."""
+    opts = ctx.find_root().obj
+    if 'services' in opts:
+        return opts['auth_info'], opts['services']
+    #TODO(roaet): push all the conf loading into the session
+    import sail.utils.auth as auth
+    recorder = replayer = None
+    if opts['record'] is not None:
+        from sail import cassette
+        recorder = opts['recorder'] = cassette.Cassette()
+    elif opts['replay'] is not None:
+        from sail import cassette
+        replayer = cassette.Replayer(cassette.Cassette.load(opts['replay']),
+                                     latency=cassette.parse_latency(
+                                         opts['replay_latency']),
+                                     jitter=opts['replay_jitter'])
+        opts['replayer'] = replayer.start()
+
+    conf = None
+    if opts['auth_config_file'] is not None:
+        conf = _load_config(opts['auth_config_file'])
+    if (recorder or replayer) and conf is not None and 'auth' in conf:
+        # Cached tokens would keep the identity exchange off the cassette
+        # and replayed tokens out of the cache.
+        conf['auth']['cache_token'] = False
+        if replayer is not None and 'endpoint' in conf['auth']:
+            conf['auth']['endpoint'] = replayer.rewrite(
+                conf['auth']['endpoint'])
+    auth_info = auth.do_auth(ctx, conf, recorder)
+
+    if opts['verbose']:
+        click.echo("Auth token: %s" % auth_info.token)
+
+    conf = None
+    if opts['net_config_file'] is not None:
+        conf = _load_config(opts['net_config_file'])
+    if (replayer is not None and conf is not None and 'network' in conf and
+            'endpoint' in conf['network']):
+        conf['network']['endpoint'] = replayer.rewrite(
+            conf['network']['endpoint'])
+    net_srv = SERVICES.get('network')(conf)
+    net_srv.recorder = recorder
+    opts['auth_info'] = auth_info
+    opts['services'] = [net_srv]
+    return auth_info, opts['services']
+
+
+def _finish(ctx, sess, services):
+    opts = ctx.find_root().obj
+    for service in services:
+        service.close()
+    if opts.get('recorder') is not None:
+        opts['recorder'].save(opts['record'])
+    if opts.get('replayer') is not None:
+        opts['replayer'].stop()
+    if opts['metrics_file'] is not None:
+        sess.export_metrics(opts['metrics_file'], opts['metrics_format'])
+    sess.close()
+
+
+@click.group(context_settings=command_settings, invoke_without_command=True)
 @click.option('--auth-config-file', default=None, is_flag=False,
               type=click.File('rb'),
               help="Authentication configuration file")
 @click.option('--net-config-file', default=None, is_flag=False,
               type=click.File('rb'),
               help="Network service configuration file")
+@click.option('--scenario', 'scenario_file', default=None,
+              type=click.Path(exists=True, dir_okay=False),
+              help="Scenario file to run instead of the built-in one")
+@click.option('--plan', default=False, is_flag=True,
+              help="Print the compiled scenario plan and exit")
+@click.option('--workers', default=8, type=int,
+              help="Number of tasks allowed to run concurrently")
+@click.option('--undo-workers', default=1, type=int,
+              help="Number of concurrent undos during teardown")
+@click.option('--run-budget', default=None, type=float,
+              help="Seconds the run may take before outstanding work is "
+                   "cancelled and teardown starts")
+@click.option('--teardown-budget', default=None, type=float,
+              help="Seconds teardown may take; undos left over stay in "
+                   "the journal")
+@click.option('--task-deadline', default=None, type=float,
+              help="Seconds any one task may take")
+@click.option('--artifact-spill-dir', default=None,
+              type=click.Path(file_okay=False),
+              help="Keep packed artifact bodies in a file in this directory")
+@click.option('--metrics-file', default=None, type=click.Path(),
+              help="Write request metrics to this file at the end")
+@click.option('--metrics-format', default='json',
+              type=click.Choice(sorted(metrics.EXPORTERS)),
+              help="Format of the metrics file")
+@click.option('--log-file', default=None, type=click.Path(dir_okay=False),
+              help="Also stream log records to this file as JSON lines")
+@click.option('--log-history', default=1000, type=int,
+              help="Number of log records kept in memory")
+@click.option('--journal-dir', default=None,
+              type=click.Path(file_okay=False),
+              help="Directory of the undo journals (default: "
+                   "~/.sail/journal)")
+@click.option('--no-journal', default=False, is_flag=True,
+              help="Do not journal created resources")
+@click.option('--supernet', default='10.0.0.0/8',
+              help="Range generated subnet CIDRs are carved out of")
+@click.option('--subnet-prefix', default=24, type=int,
+              help="Prefix length of generated subnets")
+@click.option('--record', default=None, type=click.Path(dir_okay=False),
+              help="Record every request and response to this cassette")
+@click.option('--replay', default=None,
+              type=click.Path(exists=True, dir_okay=False),
+              help="Serve responses from this cassette instead of the cloud")
+@click.option('--replay-latency', default='0',
+              help="Seconds added to each replayed response, or 'recorded'")
+@click.option('--replay-jitter', default=0.0, type=float,
+              help="Up to this many more seconds added at random")
 @click.option('--verbose', default=False, is_flag=True,
               help="Toggle verbosity of output")
 @click.pass_context
-def run_sail(ctx, auth_config_file, net_config_file, verbose):
-    if verbose:
-        ctx.verbose = True
-    #TODO(roaet): push all the conf loading into the session
-    conf = None
-    if auth_config_file is not None:
-        conf = _load_config(auth_config_file)
-    auth_info = auth.do_auth(ctx, conf)
-    ctx.auth_info = auth_info
-
-    if ctx.verbose:
-        click.echo("Auth token: %s" % auth_info.token)
-
-    conf = None
-    if net_config_file is not None:
-        conf = _load_config(net_config_file)
-    net_srv = NetworkService(conf)
-
-    ctx.session = session.Session()
+def run_sail(ctx, auth_config_file, net_config_file, scenario_file, plan,
+             workers, undo_workers, run_budget, teardown_budget,
+             task_deadline, artifact_spill_dir, metrics_file,
+             metrics_format, log_file, log_history, journal_dir, no_journal,
+             supernet, subnet_prefix, record, replay, replay_latency,
+             replay_jitter, verbose):
+    if record is not None and replay is not None:
+        raise click.UsageError("--record and --replay cannot be combined")
+    log_level = log.DEBUG if verbose else log.INFO
+    ctx.obj = {'auth_config_file': auth_config_file,
+               'net_config_file': net_config_file,
+               'scenario': scenario_file,
+               'workers': workers,
+               'context_args': {'undo_workers': undo_workers,
+                                'artifact_spill_dir': artifact_spill_dir,
+                                'run_budget': run_budget,
+                                'teardown_budget': teardown_budget,
+                                'task_deadline': task_deadline},
+               'metrics_file': metrics_file,
+               'metrics_format': metrics_format,
+               'session_args': {'log_level': log_level,
+                                'log_history': log_history,
+                                'log_file': log_file,
+                                'journal_dir': (None if no_journal else
+                                                _journal_dir(journal_dir)),
+                                'supernet': supernet,
+                                'subnet_prefixlen': subnet_prefix},
+               'journal_dir': _journal_dir(journal_dir),
+               'record': record,
+               'replay': replay,
+               'replay_latency': replay_latency,
+               'replay_jitter': replay_jitter,
+               'verbose': verbose}
+    if plan:
+        for line in _scenario(ctx.obj).lines():
+            click.echo(line)
+        ctx.exit(0)
+    if ctx.invoked_subcommand is not None:
+        return
+    compiled = _scenario(ctx.obj)
+    auth_info, services = _connect(ctx)
+    import sail.session as session
+    ctx.session = session.Session(**ctx.obj['session_args'])
 
     """
     Some defaults for giggles
@@ -77,8 +233,249 @@ def run_sail(ctx, auth_config_file, net_config_file, verbose):
     ip_info = {"ip_address": {"network_id": net_id, "version": 4,
                               "port_ids": [port_id1, port_id2]}}
     """
-    with ctx.session.setUp(auth_info, [net_srv]):
-        net.GetNetworks()()
-        create = net.CreateNetwork()()
-        net.DeleteNetwork(notify_success=[create])()
+    try:
+        with ctx.session.setUp(auth_info, services,
+                               **ctx.obj['context_args']):
+            compiled.run(workers)
+    finally:
+        _finish(ctx, ctx.session, services)
     ctx.exit(0)
+
+
+@run_sail.command('load')
+@click.option('--concurrency', default=1, type=int,
+              help="Number of scenario iterations in flight at once")
+@click.option('--iteration-rate', default=None, type=float,
+              help="Target scenario iterations started per second (each "
+                   "iteration sends all of the scenario's requests)")
+@click.option('--duration', default=None, type=float,
+              help="Seconds to keep generating load")
+@click.option('--iterations', default=None, type=int,
+              help="Total number of scenario iterations to run")
+@click.option('--ramp-up', default=0.0, type=float,
+              help="Seconds over which to ramp up to the full load")
+@click.pass_context
+def load(ctx, concurrency, iteration_rate, duration, iterations, ramp_up):
+    """Runs the scenario repeatedly and reports latency per call."""
+    from sail.load import LoadRunner
+    import sail.session as session
+    opts = ctx.find_root().obj
+    plan = _scenario(opts)
+    auth_info, services = _connect(ctx)
+    sess = session.Session(**opts['session_args'])
+    try:
+        runner = LoadRunner(sess, auth_info, services,
+                            _runner(plan, opts['workers']),
+                            concurrency=concurrency,
+                            iteration_rate=iteration_rate,
+                            duration=duration, iterations=iterations,
+                            ramp_up=ramp_up, **opts['context_args'])
+        report = runner.run()
+        for line in report.lines():
+            click.echo(line)
+    finally:
+        _finish(ctx, sess, services)
+    ctx.exit(0 if not report.failures and not report.timeouts else 1)
+
+
+@run_sail.command('sweep')
+@click.option('--prefix', default=None,
+              help="Name prefix of resources to sweep (default: sail_)")
+@click.option('--older-than', default=None, type=float,
+              help="Only sweep resources created this many seconds ago")
+@click.option('--concurrency', default=16, type=int,
+              help="Number of deletes in flight at once")
+@click.option('--page-size', default=None, type=int,
+              help="Resources fetched per listing request")
+@click.option('--dry-run', default=False, is_flag=True,
+              help="Only report what would be deleted")
+@click.pass_context
+def run_sweep(ctx, prefix, older_than, concurrency, page_size, dry_run):
+    """Deletes resources leaked by interrupted runs."""
+    import sail.session as session
+    from sail import sweep
+    opts = ctx.find_root().obj
+    auth_info, services = _connect(ctx)
+    sess = session.Session(**opts['session_args'])
+    try:
+        context = sess.new_context(auth_info, services)
+        sweeper = sweep.Sweeper(context, context.request_service('network'),
+                                prefix=prefix, older_than=older_than,
+                                workers=concurrency, page_size=page_size,
+                                dry_run=dry_run)
+        report = sweeper.sweep()
+        for line in report.lines():
+            click.echo(line)
+    finally:
+        _finish(ctx, sess, services)
+    ctx.exit(1 if report.failures() else 0)
+
+
+@run_sail.command('resume-undo')
+@click.option('--concurrency', default=16, type=int,
+              help="Number of deletes in flight at once")
+@click.option('--force', default=False, is_flag=True,
+              help="Also resume journals of runs that still seem alive")
+@click.pass_context
+def resume_undo(ctx, concurrency, force):
+    """Deletes what interrupted runs left behind, from their journals."""
+    from sail import journal
+    import sail.session as session
+    opts = ctx.find_root().obj
+    auth_info, services = _connect(ctx)
+    sess = session.Session(**dict(opts['session_args'], journal_dir=None))
+    try:
+        context = sess.new_context(auth_info, services)
+        resumer = journal.Resumer(context, opts['journal_dir'],
+                                  workers=concurrency, force=force)
+        report = resumer.resume()
+        for line in report.lines():
+            click.echo(line)
+    finally:
+        _finish(ctx, sess, services)
+    ctx.exit(1 if report.failures else 0)
+
+
+@run_sail.command('topology')
+@click.argument('shape')
+@click.option('--chunk-size', default=None, type=int,
+              help="Resources per bulk create request")
+@click.option('--wait', default=None, type=float,
+              help="Seconds each level may take to become ready before "
+                   "the next one is built on it")
+@click.option('--dry-run', default=False, is_flag=True,
+              help="Only print how many resources the shape makes")
+@click.pass_context
+def run_topology(ctx, shape, chunk_size, wait, dry_run):
+    """Builds a topology such as 10x4x8: networks x subnets x ports
+    (x IP addresses), then tears it down.
+    """
+    from sail.topology import Topology
+    opts = ctx.find_root().obj
+    topology = Topology(shape, chunk_size=chunk_size,
+                        workers=opts['workers'], wait=wait)
+    for line in topology.lines():
+        click.echo(line)
+    if dry_run:
+        ctx.exit(0)
+    auth_info, services = _connect(ctx)
+    import sail.session as session
+    sess = session.Session(**opts['session_args'])
+    context = sess.setUp(auth_info, services, **opts['context_args'])
+    made = {}
+    scheduler = None
+    try:
+        with context:
+            try:
+                scheduler = topology.run()
+            finally:
+                for resource, _, _ in topology.totals():
+                    made[resource] = len(context.find_artifacts(resource))
+    finally:
+        for resource, total, _ in topology.totals():
+            click.echo("%-12s %8d of %d created" %
+                       (resource, made.get(resource, 0), total))
+        if scheduler is not None and (scheduler.timed_out or
+                                      scheduler.cancelled):
+            click.echo("%d tasks timed out, %d cancelled" %
+                       (len(scheduler.timed_out), len(scheduler.cancelled)))
+        click.echo("undid %d tasks, %d failed, %d timed out" %
+                   (context.undone, len(context.undo_failures),
+                    len(context.undo_timeouts)))
+        _finish(ctx, sess, services)
+    missing = any(made.get(r, 0) < t for r, t, _ in topology.totals())
+    ctx.exit(1 if missing or context.undo_failures or context.undo_timeouts
+             else 0)
+
+
+@run_sail.command('supervise')
+@click.option('--processes', default=None, type=int,
+              help="Worker processes to start (default: one per core)")
+@click.option('--tenant-config', 'tenant_configs', multiple=True,
+              type=click.Path(exists=True, dir_okay=False),
+              help="Auth configuration of a tenant; workers take turns "
+                   "with each one given")
+@click.option('--replicate', default=False, is_flag=True,
+              help="Run the whole scenario in every worker instead of "
+                   "splitting its counts between them")
+@click.pass_context
+def supervise(ctx, processes, tenant_configs, replicate):
+    """Runs the scenario in several worker processes at once."""
+    import multiprocessing
+    import sail.utils.auth as auth
+    from sail import supervisor
+    opts = ctx.find_root().obj
+    if opts['record'] is not None or opts['replay'] is not None:
+        raise click.UsageError("supervise cannot record or replay")
+    plan = _scenario(opts)
+    processes = processes or multiprocessing.cpu_count()
+    tenants = list(tenant_configs)
+    confs = [_load_config(path) for path in tenants]
+    if not confs:
+        tenants = ['default']
+        confs = [_load_config(opts['auth_config_file'])
+                 if opts['auth_config_file'] is not None else None]
+    # Authenticate once per tenant here rather than once per worker.
+    auth_infos = [auth.do_auth(ctx, conf) for conf in confs]
+    net_conf = None
+    if opts['net_config_file'] is not None:
+        net_conf = _load_config(opts['net_config_file'])
+    specs = []
+    for index in range(processes):
+        part = plan if replicate else plan.slice(index, processes)
+        if not part.steps:
+            continue
+        tenant = index % len(confs)
+        specs.append(supervisor.WorkerSpec(
+            index, part, tenants[tenant], auth_infos[tenant], net_conf,
+            session_args=opts['session_args'],
+            context_args=opts['context_args'], workers=opts['workers']))
+    report = supervisor.Supervisor(specs).run()
+    for line in report.lines():
+        click.echo(line)
+    if opts['metrics_file'] is not None:
+        metrics.export(report.metrics, opts['metrics_file'],
+                       opts['metrics_format'])
+    ctx.exit(1 if report.failures() else 0)
+
+
+@run_sail.command('bench')
+@click.option('--filter', 'pattern', default='*',
+              help="Only run benchmarks whose name matches this glob")
+@click.option('--repeat', default=3, type=int,
+              help="Rounds per benchmark; the fastest one is reported")
+@click.option('--scale', default=1.0, type=float,
+              help="Multiplier for the operations run per round")
+@click.option('--baseline', default=None, type=click.Path(dir_okay=False),
+              help="Baseline file to compare against (default: "
+                   "~/.sail/bench_baseline.json)")
+@click.option('--save-baseline', default=False, is_flag=True,
+              help="Store these results as the new baseline")
+@click.option('--tolerance', default=0.2, type=float,
+              help="Throughput change that counts as a regression")
+@click.option('--startup', default=False, is_flag=True,
+              help="Check CLI startup time against a budget instead")
+@click.option('--budget', default=None, type=float,
+              help="Seconds startup may take (default: 0.1)")
+@click.pass_context
+def run_bench(ctx, pattern, repeat, scale, baseline, save_baseline,
+              tolerance, startup, budget):
+    """Benchmarks sail's own hot paths and prints results as JSON lines."""
+    from sail import bench
+    if startup:
+        results = bench.run_startup(repeat, budget or bench.STARTUP_BUDGET)
+        for name in sorted(results):
+            click.echo(json.dumps(dict(results[name], name=name),
+                                  sort_keys=True))
+        ctx.exit(1 if any(r['status'] != 'ok' for r in results.values())
+                 else 0)
+    baseline = baseline or bench.DEFAULT_BASELINE
+    results = bench.run_benchmarks(pattern, repeat, scale)
+    regressed = bench.compare(results, bench.load_baseline(baseline),
+                              tolerance)
+    for name in sorted(results):
+        result = dict(results[name], name=name)
+        click.echo(json.dumps(result, sort_keys=True))
+    if save_baseline:
+        bench.save_baseline(baseline, results)
+    ctx.exit(1 if regressed and not save_baseline else 0)
@@ -0,0 +1,273 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import errno
+import json
+import os
+import threading
+import time
+import uuid
+
+import sail.exceptions.common as exc
+from sail.sweep import TIERS
+from sail.utils.pool import WorkerPool
+
+
+DEFAULT_JOURNAL_DIR = os.path.join('~', '.sail', 'journal')
+CREATE = 'create'
+DELETE = 'delete'
+
+
+class UndoJournal(object):
+    """Append-only record of the resources a run created and deleted.
+
+    Every run writes its own file, named after its process id. Each event is
+    one JSON line appended with a single write, and a background thread
+    fsyncs at most every sync_interval seconds so a burst of creates costs
+    one sync. A torn last line from a crash is ignored when reading. The
+    file is removed on close once nothing it created is left outstanding.
+    """
+
+    def __init__(self, path, sync_interval=0.1):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                          0o600)
+        self.outstanding = set()
+        for entry in read_journal(path):
+            self.outstanding.add(_key(entry))
+        self.cond = threading.Condition()
+        self.dirty = False
+        self.closed = False
+        self.syncer = threading.Thread(target=self._sync_loop)
+        self.syncer.daemon = True
+        self.syncer.start()
+
+    @classmethod
+    def create(cls, directory=DEFAULT_JOURNAL_DIR, **kwargs):
+        directory = os.path.expanduser(directory)
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        name = "%d-%d-%s.jsonl" % (time.time(), os.getpid(),
+                                   uuid.uuid4().hex[:8])
+        return cls(os.path.join(directory, name), **kwargs)
+
+    def record(self, op, service, endpoint, resource, ids):
+        now = time.time()
+        data = "".join(json.dumps({'op': op, 'service': service,
+                                   'endpoint': endpoint,
+                                   'resource': resource, 'id': id,
+                                   'ts': now}) + "\n"
+                       for id in ids).encode('utf-8')
+        with self.cond:
+            if self.closed:
+                return
+            while data:
+                data = data[os.write(self.fd, data):]
+            for id in ids:
+                key = (endpoint, resource, id)
+                if op == CREATE:
+                    self.outstanding.add(key)
+                else:
+                    self.outstanding.discard(key)
+            if not self.dirty:
+                self.dirty = True
+                self.cond.notify()
+
+    def _sync_loop(self):
+        while True:
+            with self.cond:
+                while not self.dirty and not self.closed:
+                    self.cond.wait()
+                if self.closed:
+                    return
+            # Let more events pile up behind this one before syncing.
+            time.sleep(self.sync_interval)
+            with self.cond:
+                self.dirty = False
+                if self.closed:
+                    return
+                fd = self.fd
+            os.fsync(fd)
+
+    def close(self, remove_if_settled=True):
+        with self.cond:
+            if self.closed:
+                return
+            self.closed = True
+            self.cond.notify()
+        self.syncer.join()
+        os.fsync(self.fd)
+        os.close(self.fd)
+        if remove_if_settled and not self.outstanding:
+            os.unlink(self.path)
+
+
+def _key(entry):
+    return (entry.get('endpoint'), entry['resource'], entry['id'])
+
+
+def read_journal(path):
+    """Returns the create events of a journal that were never undone."""
+    outstanding = {}
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                key = _key(entry)
+            except (ValueError, KeyError, TypeError):
+                continue
+            if entry.get('op') == CREATE:
+                outstanding[key] = entry
+            else:
+                outstanding.pop(key, None)
+    return sorted(outstanding.values(), key=lambda e: e.get('ts', 0))
+
+
+def _owner_alive(path):
+    try:
+        pid = int(os.path.basename(path).split('-')[1])
+    except (IndexError, ValueError):
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def journal_files(directory=DEFAULT_JOURNAL_DIR):
+    directory = os.path.expanduser(directory)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, name)
+                  for name in os.listdir(directory)
+                  if name.endswith('.jsonl'))
+
+
+class ResumeReport(object):
+    def __init__(self):
+        self.journals = 0
+        self.busy = []
+        self.outstanding = 0
+        self.deleted = 0
+        self.gone = 0
+        self.skipped = 0
+        self.failures = []
+        self.elapsed = 0.0
+
+    def lines(self, max_failures=20):
+        lines = ["%d journals (%d still in use), %d outstanding resources" %
+                 (self.journals, len(self.busy), self.outstanding)]
+        elapsed = self.elapsed or 1e-9
+        lines.append("deleted %d, already gone %d, skipped %d, failed %d "
+                     "in %.2fs: %.1f/s" %
+                     (self.deleted, self.gone, self.skipped,
+                      len(self.failures), self.elapsed,
+                      self.deleted / elapsed))
+        for path in self.busy:
+            lines.append("IN USE %s" % path)
+        for resource, id, reason in self.failures[:max_failures]:
+            lines.append("FAILED %s %s: %s" % (resource, id, reason))
+        if len(self.failures) > max_failures:
+            lines.append("... and %d more failures" %
+                         (len(self.failures) - max_failures))
+        return lines
+
+
+class Resumer(object):
+    """Deletes what interrupted runs left behind, as their journals say.
+
+    Resources are deleted dependents first, concurrently within each kind,
+    and each successful delete is appended to the journal it came from.
+    Entries for another endpoint than the configured service are skipped.
+    Journals of runs that are still alive are left alone unless forced.
+    """
+
+    def __init__(self, context, directory=DEFAULT_JOURNAL_DIR, workers=16,
+                 force=False):
+        self.context = context
+        self.directory = directory
+        self.workers = workers
+        self.force = force
+        self.lock = threading.Lock()
+
+    def _delete(self, journal, service, entry, report):
+        method = dict(TIERS)[entry['resource']]
+        resp = getattr(service, method)(self.context, entry['id'])
+        with self.lock:
+            if resp.success or resp.status == 404:
+                if resp.success:
+                    report.deleted += 1
+                else:
+                    report.gone += 1
+                journal.record(DELETE, entry['service'], entry['endpoint'],
+                               entry['resource'], [entry['id']])
+            else:
+                report.failures.append((entry['resource'], entry['id'],
+                                        "%s %s" % (resp.status, resp.raw)))
+
+    def _failed(self, report, entry):
+        def done(future):
+            error = future.exception()
+            if error is not None:
+                with self.lock:
+                    report.failures.append((entry['resource'], entry['id'],
+                                            error))
+        return done
+
+    def _resume(self, path, report):
+        entries = read_journal(path)
+        report.outstanding += len(entries)
+        journal = UndoJournal(path)
+        try:
+            for resource, _ in TIERS:
+                pool = WorkerPool(self.workers)
+                try:
+                    for entry in entries:
+                        if entry['resource'] != resource:
+                            continue
+                        service = self.context.request_service(
+                            entry.get('service'))
+                        if (service is None or
+                                service.endpoint != entry.get('endpoint')):
+                            report.skipped += 1
+                            continue
+                        future = pool.submit(self._delete, journal, service,
+                                             entry, report)
+                        future.add_done_callback(self._failed(report, entry))
+                finally:
+                    pool.shutdown()
+            known = dict(TIERS)
+            report.skipped += len([e for e in entries
+                                   if e['resource'] not in known])
+        finally:
+            journal.close()
+
+    def resume(self):
+        report = ResumeReport()
+        start = time.time()
+        for path in journal_files(self.directory):
+            report.journals += 1
+            if not self.force and _owner_alive(path):
+                report.busy.append(path)
+                continue
+            try:
+                self._resume(path, report)
+            except (IOError, OSError) as e:
+                raise exc.FatalException("Could not resume %s: %s" %
+                                         (path, e))
+        report.elapsed = time.time() - start
+        return report
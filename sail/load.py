@@ -0,0 +1,172 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import math
+import threading
+import time
+
+from sail.context import set_current_context
+import sail.exceptions.common as exc
+from sail import log
+
+
+class LoadReport(object):
+    def __init__(self, iterations, failures, elapsed, calls, timeouts=0,
+                 iteration_rate=None):
+        self.iterations = iterations
+        self.iteration_rate = iteration_rate
+        self.failures = failures
+        self.timeouts = timeouts
+        self.elapsed = elapsed
+        self.calls = calls
+
+    def requests(self):
+        return sum(c['count'] for c in self.calls.values())
+
+    def lines(self):
+        elapsed = self.elapsed or 1e-9
+        lines = ["%d iterations (%d failed, %d timed out) in %.2fs: %.2f "
+                 "it/s, %.2f req/s" %
+                 (self.iterations, self.failures, self.timeouts,
+                  self.elapsed, self.iterations / elapsed,
+                  self.requests() / elapsed)]
+        if self.iteration_rate:
+            # The pacing is per iteration, so the request rate follows from
+            # how many calls each iteration makes.
+            lines[0] += " (target %.2f it/s)" % self.iteration_rate
+        lines.append("%-32s %8s %10s %10s %10s %12s" %
+                     ("call", "count", "p50(ms)", "p95(ms)", "p99(ms)",
+                      "wait95(ms)"))
+        for key in sorted(self.calls):
+            call = self.calls[key]
+            lines.append("%-32s %8d %10.1f %10.1f %10.1f %12.1f" %
+                         (" ".join(key), call['count'], call['p50'] * 1000,
+                          call['p95'] * 1000, call['p99'] * 1000,
+                          call['queue_wait']['p95'] * 1000))
+        return lines
+
+
+class LoadRunner(object):
+    """Runs a scenario over and over to put load on the services.
+
+    Each iteration gets its own context, so the resources it creates are
+    undone when it finishes. iteration_rate is the target number of
+    iterations started per second, not of requests sent; without it,
+    concurrency workers run back to back. ramp_up spreads the start over
+    that many seconds, either by raising the rate linearly or by staggering
+    the workers.
+    """
+
+    def __init__(self, session, auth_info, services, scenario, concurrency=1,
+                 iteration_rate=None, duration=None, iterations=None,
+                 ramp_up=0.0,
+                 **context_args):
+        if duration is None and iterations is None:
+            raise exc.MissingRequiredInformation("Load runs need a duration "
+                                                 "or an iteration count")
+        self.session = session
+        self.auth_info = auth_info
+        self.services = services
+        self.scenario = scenario
+        self.concurrency = max(1, concurrency)
+        self.iteration_rate = iteration_rate
+        self.duration = duration
+        self.iterations = iterations
+        self.ramp_up = ramp_up or 0.0
+        self.context_args = context_args
+        self.lock = threading.Lock()
+        self.started = 0
+        self.completed = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.start = None
+
+    def _offset(self, n):
+        """Seconds after the start at which iteration n should begin."""
+        rate, ramp = self.iteration_rate, self.ramp_up
+        ramped = rate * ramp / 2.0
+        if ramp and n < ramped:
+            return math.sqrt(2.0 * ramp * n / rate)
+        if ramp:
+            return ramp + (n - ramped) / rate
+        return n / float(rate)
+
+    def _next_slot(self):
+        with self.lock:
+            if (self.iterations is not None and
+                    self.started >= self.iterations):
+                return None
+            now = time.time()
+            slot = now
+            if self.iteration_rate:
+                slot = self.start + self._offset(self.started)
+            if (self.duration is not None and
+                    max(slot, now) >= self.start + self.duration):
+                return None
+            self.started += 1
+            return slot
+
+    def _iterate(self):
+        context = self.session.new_context(self.auth_info, self.services,
+                                           **self.context_args)
+        set_current_context(context)
+        success = True
+        timed_out = False
+        try:
+            with context:
+                self.scenario()
+                success = all(t.was_successful() for t in context.tasks)
+                timed_out = any(t.timed_out for t in context.tasks)
+        except Exception as e:
+            context.emit(log.WARNING, "LoadRunner", "EXCEPT(ignored)", "%s", e)
+            success = False
+        with self.lock:
+            self.completed += 1
+            if timed_out:
+                self.timeouts += 1
+            elif not success:
+                self.failures += 1
+
+    def _worker(self, delay):
+        if delay:
+            time.sleep(delay)
+        while True:
+            slot = self._next_slot()
+            if slot is None:
+                return
+            wait = slot - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            self._iterate()
+
+    def run(self):
+        self.start = time.time()
+        threads = []
+        for index in range(self.concurrency):
+            delay = 0
+            if self.ramp_up and not self.iteration_rate:
+                delay = self.ramp_up * index / self.concurrency
+            thread = threading.Thread(target=self._worker, args=(delay,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            # join with a timeout so Ctrl-C still reaches the main thread
+            while thread.is_alive():
+                thread.join(0.5)
+        return LoadReport(self.completed, self.failures,
+                          time.time() - self.start,
+                          self.session.metrics.summary(), self.timeouts,
+                          self.iteration_rate)
@@ -0,0 +1,177 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import atexit
+import collections
+import json
+import sys
+import threading
+import time
+import weakref
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVEL_NAMES = {
+    DEBUG: 'DEBUG',
+    INFO: 'INFO',
+    WARNING: 'WARNING',
+    ERROR: 'ERROR',
+}
+
+# Loggers still open, flushed by a single hook when the process exits.
+_open_loggers = weakref.WeakSet()
+
+
+def _flush_open_loggers():
+    for logger in list(_open_loggers):
+        logger.flush()
+
+
+atexit.register(_flush_open_loggers)
+
+
+class LogRecord(object):
+    """A log line whose text is only built when something reads it."""
+    __slots__ = ('created', 'level', 'state', 'source', 'tag', 'fmt', 'args',
+                 '_message')
+
+    def __init__(self, level, state, source, tag, fmt, args):
+        self.created = time.time()
+        self.level = level
+        self.state = state
+        self.source = source
+        self.tag = tag
+        self.fmt = fmt
+        self.args = args
+        self._message = None
+
+    @property
+    def message(self):
+        if self._message is None:
+            self._message = self.fmt % self.args if self.args else self.fmt
+            self.args = None
+        return self._message
+
+    def __str__(self):
+        line = "[%s%s]" % (self.state or '', self.source or '')
+        if self.tag:
+            line += "%s: " % self.tag
+        return line + self.message
+
+    def as_dict(self):
+        return {'ts': self.created,
+                'level': LEVEL_NAMES.get(self.level, self.level),
+                'state': self.state,
+                'source': self.source,
+                'tag': self.tag,
+                'message': self.message}
+
+
+class SessionLogger(object):
+    """Leveled logger that writes from a background thread in batches.
+
+    Records below the level are dropped before any formatting happens.
+    The most recent history records are kept in a ring buffer, and when
+    json_path is given every record is also streamed there as a JSON line.
+    A record that cannot be written is reported on stderr and dropped; the
+    writer carries on with the rest.
+    """
+
+    def __init__(self, level=INFO, history=1000, stream=None, json_path=None,
+                 batch_size=256):
+        self.level = level
+        self.history = collections.deque(maxlen=history)
+        self.stream = stream if stream is not None else sys.stdout
+        self.json_file = open(json_path, 'a') if json_path else None
+        self.batch_size = batch_size
+        self.pending = queue.Queue()
+        self.closed = False
+        self.writer = threading.Thread(target=self._write_loop)
+        self.writer.daemon = True
+        self.writer.start()
+        _open_loggers.add(self)
+
+    def enabled(self, level):
+        return level >= self.level
+
+    def log(self, level, state, source, tag, fmt, *args):
+        if level < self.level:
+            return
+        record = LogRecord(level, state, source, tag, fmt, args)
+        self.history.append(record)
+        if not self.closed:
+            self.pending.put(record)
+
+    def _write_loop(self):
+        while True:
+            batch = [self.pending.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception:
+                self._write_each(batch)
+            finally:
+                for _ in batch:
+                    self.pending.task_done()
+            if None in batch:
+                return
+
+    def _write_each(self, batch):
+        # Only the records that cannot be written are dropped.
+        for record in batch:
+            try:
+                self._write([record])
+            except Exception as e:
+                sys.stderr.write("sail: dropped log record: %s: %s\n" %
+                                 (e.__class__.__name__, e))
+
+    def _write(self, batch):
+        records = [r for r in batch if r is not None]
+        if not records:
+            return
+        if self.stream is not None:
+            self.stream.write("\n".join(str(r) for r in records) + "\n")
+            self.stream.flush()
+        if self.json_file is not None:
+            self.json_file.write("".join(json.dumps(r.as_dict()) + "\n"
+                                         for r in records))
+            self.json_file.flush()
+
+    def flush(self):
+        self.pending.join()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.pending.put(None)
+        self.writer.join()
+        _open_loggers.discard(self)
+        if self.json_file is not None:
+            self.json_file.close()
+            self.json_file = None
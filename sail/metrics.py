@@ -0,0 +1,277 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import bisect
+import json
+import threading
+
+
+def exponential_bounds(start, factor, count):
+    bounds = []
+    value = start
+    for _ in range(count):
+        bounds.append(value)
+        value *= factor
+    return bounds
+
+
+# 0.5ms up to roughly two minutes, about 10% apart.
+LATENCY_BOUNDS = exponential_bounds(0.0005, 1.1, 131)
+# 64 bytes up to 512MB, doubling.
+SIZE_BOUNDS = exponential_bounds(64, 2, 24)
+
+
+class Histogram(object):
+    """Fixed-bucket histogram, so memory stays flat however long a run is.
+
+    Percentiles are read off the bucket bounds and are accurate to the
+    bucket width.
+    """
+
+    def __init__(self, bounds=None):
+        self.bounds = bounds or LATENCY_BOUNDS
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """Adds in the observations of a histogram with the same bounds."""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+        if other.min is not None and (self.min is None or
+                                      other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or
+                                      other.max > self.max):
+            self.max = other.max
+
+    def percentile(self, pct):
+        if not self.count:
+            return None
+        rank = pct / 100.0 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                if index >= len(self.bounds):
+                    return self.max
+                return min(self.bounds[index], self.max)
+        return self.max
+
+    def mean(self):
+        if not self.count:
+            return None
+        return self.sum / self.count
+
+    def summary(self):
+        return {'count': self.count,
+                'sum': self.sum,
+                'min': self.min,
+                'max': self.max,
+                'mean': self.mean(),
+                'p50': self.percentile(50),
+                'p95': self.percentile(95),
+                'p99': self.percentile(99)}
+
+
+class CallMetrics(object):
+    """Aggregates of every request made for one service/verb/resource."""
+
+    def __init__(self):
+        self.wall = Histogram()
+        self.queue_wait = Histogram()
+        self.ttfb = Histogram()
+        self.size = Histogram(SIZE_BOUNDS)
+        self.retries = 0
+
+    def observe(self, stats):
+        self.wall.observe(stats.elapsed)
+        self.queue_wait.observe(stats.queue_wait)
+        if stats.ttfb is not None:
+            self.ttfb.observe(stats.ttfb)
+        self.size.observe(stats.size)
+        self.retries += stats.retries
+
+    def merge(self, other):
+        self.wall.merge(other.wall)
+        self.queue_wait.merge(other.queue_wait)
+        self.ttfb.merge(other.ttfb)
+        self.size.merge(other.size)
+        self.retries += other.retries
+
+    def summary(self):
+        summary = self.wall.summary()
+        summary['queue_wait'] = self.queue_wait.summary()
+        summary['ttfb'] = self.ttfb.summary()
+        summary['size'] = self.size.summary()
+        summary['retries'] = self.retries
+        return summary
+
+
+class MetricsRegistry(object):
+    """Thread-safe collection of call metrics keyed by
+    (service, verb, resource).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        # Time for created resources to become ready, by (service,
+        # resource).
+        self.converge = {}
+
+    def observe(self, key, stats):
+        with self.lock:
+            metrics = self.calls.get(key)
+            if metrics is None:
+                metrics = self.calls[key] = CallMetrics()
+            metrics.observe(stats)
+
+    def observe_converge(self, key, seconds):
+        with self.lock:
+            histogram = self.converge.get(key)
+            if histogram is None:
+                histogram = self.converge[key] = Histogram()
+            histogram.observe(seconds)
+
+    def merge(self, calls, converge=None):
+        """Adds in the calls of another registry, e.g. one from a worker
+        process.
+        """
+        with self.lock:
+            for key, other in calls.items():
+                metrics = self.calls.get(key)
+                if metrics is None:
+                    metrics = self.calls[key] = CallMetrics()
+                metrics.merge(other)
+            for key, other in (converge or {}).items():
+                histogram = self.converge.get(key)
+                if histogram is None:
+                    histogram = self.converge[key] = Histogram()
+                histogram.merge(other)
+
+    def summary(self):
+        with self.lock:
+            return dict((key, m.summary()) for key, m in self.calls.items())
+
+    def converge_summary(self):
+        with self.lock:
+            return dict((key, h.summary())
+                        for key, h in self.converge.items())
+
+
+def _labels(key, **extra):
+    service, verb, resource = key
+    labels = [('service', service), ('verb', verb), ('resource', resource)]
+    labels.extend(sorted(extra.items()))
+    return ",".join('%s="%s"' % label for label in labels)
+
+
+def _prometheus_histogram(lines, name, help, histograms):
+    lines.append("# HELP %s %s" % (name, help))
+    lines.append("# TYPE %s histogram" % name)
+    for key, histogram in histograms:
+        seen = 0
+        for bound, count in zip(histogram.bounds, histogram.counts):
+            seen += count
+            lines.append("%s_bucket{%s} %d" %
+                         (name, _labels(key, le=repr(bound)), seen))
+        lines.append("%s_bucket{%s} %d" %
+                     (name, _labels(key, le="+Inf"), histogram.count))
+        lines.append("%s_sum{%s} %r" % (name, _labels(key), histogram.sum))
+        lines.append("%s_count{%s} %d" %
+                     (name, _labels(key), histogram.count))
+
+
+def to_prometheus(registry):
+    """Renders the registry in the Prometheus text exposition format."""
+    with registry.lock:
+        calls = sorted(registry.calls.items())
+        lines = []
+        _prometheus_histogram(lines, "sail_request_duration_seconds",
+                              "Wall time of service requests",
+                              [(k, m.wall) for k, m in calls])
+        _prometheus_histogram(lines, "sail_request_queue_wait_seconds",
+                              "Time requests waited for rate limits",
+                              [(k, m.queue_wait) for k, m in calls])
+        _prometheus_histogram(lines, "sail_request_ttfb_seconds",
+                              "Time to first byte of service requests",
+                              [(k, m.ttfb) for k, m in calls])
+        _prometheus_histogram(lines, "sail_response_size_bytes",
+                              "Size of service responses",
+                              [(k, m.size) for k, m in calls])
+        converge = sorted(registry.converge.items())
+        if converge:
+            lines.append("# HELP sail_resource_converge_seconds Time for "
+                         "created resources to become ready")
+            lines.append("# TYPE sail_resource_converge_seconds histogram")
+            for (service, resource), histogram in converge:
+                labels = 'service="%s",resource="%s"' % (service, resource)
+                seen = 0
+                for bound, count in zip(histogram.bounds, histogram.counts):
+                    seen += count
+                    lines.append('sail_resource_converge_seconds_bucket{%s,'
+                                 'le="%r"} %d' % (labels, bound, seen))
+                lines.append('sail_resource_converge_seconds_bucket{%s,'
+                             'le="+Inf"} %d' % (labels, histogram.count))
+                lines.append("sail_resource_converge_seconds_sum{%s} %r" %
+                             (labels, histogram.sum))
+                lines.append("sail_resource_converge_seconds_count{%s} %d" %
+                             (labels, histogram.count))
+        lines.append("# HELP sail_request_retries_total Retried requests")
+        lines.append("# TYPE sail_request_retries_total counter")
+        for key, metrics in calls:
+            lines.append("sail_request_retries_total{%s} %d" %
+                         (_labels(key), metrics.retries))
+    return "\n".join(lines) + "\n"
+
+
+def to_json(registry):
+    calls = []
+    for key, summary in sorted(registry.summary().items()):
+        service, verb, resource = key
+        summary.update({'service': service, 'verb': verb,
+                        'resource': resource})
+        calls.append(summary)
+    converge = []
+    for (service, resource), summary in sorted(
+            registry.converge_summary().items()):
+        summary.update({'service': service, 'resource': resource})
+        converge.append(summary)
+    return json.dumps({'calls': calls, 'converge': converge}, indent=2,
+                      sort_keys=True)
+
+
+EXPORTERS = {
+    'json': to_json,
+    'prometheus': to_prometheus,
+}
+
+
+def export(registry, path, fmt='json'):
+    with open(path, 'w') as f:
+        f.write(EXPORTERS[fmt](registry))
@@ -0,0 +1,466 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+"""Scenario files and the execution plans compiled from them.
+
+A scenario is a configobj file with a [steps] section. Every subsection
+is a step:
+
+    [steps]
+        [[nets]]
+        task = CreateNetwork
+        count = 10
+
+        [[cleanup]]
+        task = DeleteNetwork
+        from = nets
+
+task names a step type. count asks for that many resources (or runs, for
+reads), from names the step whose resources this step acts on (a create
+spreads its resources evenly over the networks, subnets or ports that
+step makes), after lists steps that have to finish first, chunk_size
+and status are passed to the task, wait makes a create wait up to that
+many seconds for its resources to become ready and an [[[args]]]
+subsection holds the call arguments, with JSON values decoded.
+"""
+import json
+import math
+
+import configobj
+
+import sail.exceptions.common as exc
+from sail.tasks.scheduler import Scheduler
+from sail.utils.registry import load_object
+
+
+DEFAULT_CHUNK_SIZE = 100
+STEP_KEYS = ('task', 'count', 'from', 'after', 'chunk_size', 'status',
+             'wait', 'args')
+
+
+class StepType(object):
+    """How a step name maps onto task classes.
+
+    kind is 'list', 'create' or 'delete'. Creates and deletes of more than
+    one resource compile to the bulk class when there is one. Classes are
+    given as dotted paths and only imported when a plan runs. A bulk create
+    that is not chunked sends one request per resource.
+    """
+
+    def __init__(self, kind, resource, single=None, bulk=None, chunked=True):
+        self.kind = kind
+        self.resource = resource
+        self.single = single
+        self.bulk = bulk
+        self.chunked = chunked
+
+    def task_path(self, count):
+        if self.single is None or (count > 1 and self.bulk is not None):
+            return self.bulk
+        return self.single
+
+
+TASKS = 'sail.tasks.network.'
+STEP_TYPES = {
+    'GetNetworks': StepType('list', 'network', TASKS + 'GetNetworks'),
+    'CreateNetwork': StepType('create', 'network', TASKS + 'CreateNetwork',
+                              TASKS + 'BulkCreateNetworks'),
+    'DeleteNetwork': StepType('delete', 'network', TASKS + 'DeleteNetwork',
+                              TASKS + 'BulkDeleteNetworks'),
+    'CreateNetworks': StepType('create', 'network',
+                               bulk=TASKS + 'BulkCreateNetworks'),
+    'DeleteNetworks': StepType('delete', 'network',
+                               bulk=TASKS + 'BulkDeleteNetworks'),
+    'CreateSubnets': StepType('create', 'subnet',
+                              bulk=TASKS + 'BulkCreateSubnets'),
+    'DeleteSubnets': StepType('delete', 'subnet',
+                              bulk=TASKS + 'BulkDeleteSubnets'),
+    'CreatePorts': StepType('create', 'port', bulk=TASKS + 'BulkCreatePorts'),
+    'DeletePorts': StepType('delete', 'port', bulk=TASKS + 'BulkDeletePorts'),
+    'GetSubnets': StepType('list', 'subnet', TASKS + 'GetSubnets'),
+    'CreateSubnet': StepType('create', 'subnet', TASKS + 'CreateSubnet',
+                             TASKS + 'BulkCreateSubnets'),
+    'DeleteSubnet': StepType('delete', 'subnet', TASKS + 'DeleteSubnet',
+                             TASKS + 'BulkDeleteSubnets'),
+    'GetPorts': StepType('list', 'port', TASKS + 'GetPorts'),
+    'CreatePort': StepType('create', 'port', TASKS + 'CreatePort',
+                           TASKS + 'BulkCreatePorts'),
+    'DeletePort': StepType('delete', 'port', TASKS + 'DeletePort',
+                           TASKS + 'BulkDeletePorts'),
+    'GetIPAddresses': StepType('list', 'ip_address',
+                               TASKS + 'GetIPAddresses'),
+    'CreateIPAddress': StepType('create', 'ip_address',
+                                TASKS + 'CreateIPAddress',
+                                TASKS + 'BulkCreateIPAddresses',
+                                chunked=False),
+    'DeleteIPAddress': StepType('delete', 'ip_address',
+                                TASKS + 'DeleteIPAddress',
+                                TASKS + 'BulkDeleteIPAddresses'),
+}
+
+VERBS = {'list': 'GET', 'create': 'POST', 'delete': 'DELETE'}
+
+# The resource each resource is made on, for creates with a from.
+PARENTS = {'subnet': 'network', 'port': 'subnet', 'ip_address': 'port'}
+
+DEFAULT_SCENARIO = """
+[steps]
+    [[list]]
+    task = GetNetworks
+    [[create]]
+    task = CreateNetwork
+    [[delete]]
+    task = DeleteNetwork
+    from = create
+"""
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [v.strip() for v in value.split(',') if v.strip()]
+
+
+def _decode(value):
+    if isinstance(value, (list, tuple)):
+        return [_decode(v) for v in value]
+    try:
+        return json.loads(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def _shares(count, parts):
+    """count split as evenly as possible into parts, largest first."""
+    return [count // parts + (i < count % parts) for i in range(parts)]
+
+
+def _int(step, conf, key, default):
+    try:
+        return int(conf.get(key, default))
+    except (TypeError, ValueError):
+        raise exc.DataFormatError("Expected integer for %s in step %s, got "
+                                  "%s" % (key, step, conf[key]))
+
+
+def _float(step, conf, key, default):
+    try:
+        return float(conf.get(key, default))
+    except (TypeError, ValueError):
+        raise exc.DataFormatError("Expected number for %s in step %s, got "
+                                  "%s" % (key, step, conf[key]))
+
+
+class PlanStep(object):
+    def __init__(self, name, step_type, count, source, after, chunk_size,
+                 status, args, wait=None):
+        self.name = name
+        self.type = step_type
+        self.count = count
+        self.source = source
+        self.after = after
+        self.chunk_size = chunk_size
+        self.status = status
+        self.args = args
+        self.wait = wait
+        self.deps = []
+        # Resources the source makes, for a create spread over them.
+        self.parents = None
+        self.select_task()
+
+    def select_task(self):
+        self.task_path = self.type.task_path(self.count)
+        self.task_name = self.task_path.rsplit('.', 1)[-1]
+        self.bulk = self.task_path == self.type.bulk
+
+    @property
+    def task_class(self):
+        return load_object(self.task_path)
+
+    def targets(self, steps):
+        """The create steps whose resources this step deletes."""
+        if self.type.kind != 'delete':
+            return []
+        if self.source is not None:
+            return [steps[self.source]]
+        return [s for s in steps.values() if s.type.kind == 'create' and
+                s.type.resource == self.type.resource]
+
+    def calls(self):
+        """Estimated number of requests the step sends."""
+        kind = self.type.kind
+        if kind == 'list':
+            return self.count
+        if kind == 'create':
+            if not self.bulk:
+                return 1
+            if not self.type.chunked:
+                return self.count
+            chunk = self.chunk_size or DEFAULT_CHUNK_SIZE
+            shares = _shares(self.count, self.parents or 1)
+            return sum(int(math.ceil(share / float(chunk)))
+                       for share in shares)
+        return self.count
+
+
+class Plan(object):
+    """A scenario compiled into stages of steps that can run together."""
+
+    def __init__(self, name, steps, workers=None):
+        self.name = name
+        self.steps = steps
+        self.order = [s.name for s in steps]
+        self.by_name = dict((s.name, s) for s in steps)
+        self.workers = workers
+        for step in steps:
+            self._resolve(step)
+        self.stages = self._stages()
+
+    def _resolve(self, step):
+        for dep in step.after + ([step.source] if step.source else []):
+            if dep not in self.by_name:
+                raise exc.ParsingError("Step %s refers to unknown step %s" %
+                                       (step.name, dep))
+            if dep not in step.deps:
+                step.deps.append(dep)
+        if step.source is not None and step.type.kind == 'delete':
+            source = self.by_name[step.source]
+            if (source.type.kind != 'create' or
+                    source.type.resource != step.type.resource):
+                raise exc.ParsingError("Step %s cannot delete what step %s "
+                                       "makes" % (step.name, step.source))
+        if step.source is not None and step.type.kind == 'create':
+            source = self.by_name[step.source]
+            if (source.type.kind != 'create' or
+                    source.type.resource !=
+                    PARENTS.get(step.type.resource)):
+                raise exc.ParsingError("Step %s cannot be made on what step "
+                                       "%s makes" % (step.name, step.source))
+            step.parents = source.count
+        # The scheduler orders a consumer after every producer of the
+        # same artifact; the plan mirrors that.
+        if step.type.kind == 'delete':
+            for other in self.steps:
+                if (other.type.kind == 'create' and
+                        other.type.resource == step.type.resource and
+                        other.name not in step.deps):
+                    step.deps.append(other.name)
+            targets = step.targets(self.by_name)
+            if targets:
+                step.count = sum(t.count for t in targets)
+                step.select_task()
+
+    def _stages(self):
+        remaining = dict((s.name, set(s.deps)) for s in self.steps)
+        stages = []
+        while remaining:
+            ready = [n for n in self.order
+                     if n in remaining and not remaining[n]]
+            if not ready:
+                raise exc.DependencyCycle("Scenario step cycle: %s" %
+                                          ", ".join(sorted(remaining)))
+            for name in ready:
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+            stages.append([self.by_name[n] for n in ready])
+        return stages
+
+    def _ordered(self):
+        # Steps after the ones they depend on.
+        return [step for stage in self.stages for step in stage]
+
+    def estimate(self):
+        """Estimated requests per verb, and the deletes left to undo."""
+        calls = {}
+        for step in self.steps:
+            verb = VERBS[step.type.kind]
+            calls[verb] = calls.get(verb, 0) + step.calls()
+        deleted = set()
+        for step in self.steps:
+            deleted.update(t.name for t in step.targets(self.by_name))
+        undo = sum(s.count for s in self.steps
+                   if s.type.kind == 'create' and s.name not in deleted)
+        return calls, undo
+
+    def lines(self):
+        lines = ["plan %s: %d steps in %d stages" %
+                 (self.name, len(self.steps), len(self.stages))]
+        for index, stage in enumerate(self.stages):
+            lines.append("stage %d:" % (index + 1))
+            for step in stage:
+                detail = "x%d" % step.count if step.count > 1 else ""
+                lines.append("  %-20s %-20s %-6s %5d %s" %
+                             (step.name, step.task_name, detail,
+                              step.calls(),
+                              VERBS[step.type.kind]))
+        calls, undo = self.estimate()
+        summary = ", ".join("%d %s" % (calls[v], v) for v in sorted(calls))
+        lines.append("estimated calls: %s (+1 auth), %d DELETE on undo" %
+                     (summary or "none", undo))
+        return lines
+
+    def _task(self, step, tasks, **kwargs):
+        kwargs['depends_on'] = [t for d in step.after for t in tasks[d]]
+        if step.status is not None:
+            kwargs['status'] = step.status
+        if step.bulk and step.type.kind == 'create':
+            kwargs['chunk_size'] = step.chunk_size
+        if step.wait and step.type.kind == 'create':
+            kwargs['wait'] = True
+            kwargs['wait_timeout'] = step.wait
+        if step.type.kind == 'delete' and 'notify_success' not in kwargs:
+            # Without a source the step deletes what every create of its
+            # resource made, so none of them is left to undo.
+            kwargs['notify_success'] = [t for target in
+                                        step.targets(self.by_name)
+                                        for t in tasks[target.name]]
+        return step.task_class(**kwargs)
+
+    def _add(self, scheduler, step, tasks, count=None, **kwargs):
+        args = dict(step.args)
+        if step.bulk and step.type.kind == 'create':
+            args.setdefault('count', step.count if count is None else count)
+        task = self._task(step, tasks, **kwargs)
+        scheduler.add(task, **args)
+        tasks.setdefault(step.name, []).append(task)
+        return task
+
+    def schedule(self, scheduler):
+        """Builds the tasks of the plan in the current context.
+
+        Returns the tasks of every step. A create with a source gets one
+        task per resource of the source that any of it goes on, and a
+        delete with a source one task per task of the source.
+        """
+        tasks = {}
+        # (task, index) of every resource each create step makes.
+        made = {}
+        for step in self._ordered():
+            kind = step.type.kind
+            if kind == 'create' and step.source is not None:
+                parents = made[step.source]
+                made[step.name] = []
+                for (parent, index), share in zip(
+                        parents, _shares(step.count, len(parents))):
+                    if not share:
+                        continue
+                    task = self._add(scheduler, step, tasks, share,
+                                     parent=parent, parent_index=index)
+                    made[step.name].extend((task, i) for i in range(share))
+            elif kind == 'create':
+                task = self._add(scheduler, step, tasks)
+                made[step.name] = [(task, i) for i in range(step.count)]
+            elif kind == 'delete' and step.source is not None:
+                for producer in tasks[step.source]:
+                    self._add(scheduler, step, tasks,
+                              notify_success=[producer])
+            else:
+                self._add(scheduler, step, tasks)
+                # Further reads are independent copies of the first.
+                if kind == 'list':
+                    for _ in range(step.count - 1):
+                        self._add(scheduler, step, tasks)
+        return tasks
+
+    def slice(self, index, total):
+        """The share of the plan that worker index of total runs.
+
+        Counts are split as evenly as possible. A step left with nothing to
+        do is dropped, and so is a delete of what only dropped steps make.
+        A create with a source is only split over the workers that make
+        some of the source's resources.
+        """
+        steps = []
+        kept = set()
+        # How many workers each step is split over.
+        parts = {}
+        for step in self._ordered():
+            split = total
+            if step.type.kind == 'create' and step.source is not None:
+                split = parts[step.source]
+            parts[step.name] = min(split, step.count)
+            count = _shares(step.count, split)[index] if index < split else 0
+            targets = [t.name for t in step.targets(self.by_name)]
+            if targets:
+                if not kept.intersection(targets):
+                    continue
+                count = 1
+            elif not count:
+                continue
+            kept.add(step.name)
+            steps.append(PlanStep(step.name, step.type, count, step.source,
+                                  [a for a in step.after if a in kept],
+                                  step.chunk_size, step.status, step.args,
+                                  step.wait))
+        return Plan("%s[%d/%d]" % (self.name, index + 1, total), steps,
+                    self.workers)
+
+    def run(self, workers=8):
+        scheduler = Scheduler(workers=self.workers or workers)
+        self.schedule(scheduler)
+        return scheduler.run()
+
+
+def compile_scenario(conf, name='scenario'):
+    """Checks a loaded scenario and compiles it into a Plan."""
+    if 'steps' not in conf or not conf['steps'].sections:
+        raise exc.MissingRequiredInformation("Missing [steps] section in "
+                                             "scenario")
+    options = conf.get('scenario', {})
+    workers = _int('scenario', options, 'workers', 0) or None
+    steps = []
+    for step_name in conf['steps'].sections:
+        section = conf['steps'][step_name]
+        unknown = [k for k in section if k not in STEP_KEYS]
+        if unknown:
+            raise exc.ParsingError("Unknown keys in step %s: %s" %
+                                   (step_name, ", ".join(unknown)))
+        if 'task' not in section:
+            raise exc.MissingRequiredInformation("Missing task in step %s" %
+                                                 step_name)
+        step_type = STEP_TYPES.get(section['task'])
+        if step_type is None:
+            raise exc.ParsingError("Unknown task %s in step %s" %
+                                   (section['task'], step_name))
+        status = section.get('status')
+        if status is not None:
+            status = _int(step_name, section, 'status', None)
+        args = dict((k, _decode(v))
+                    for k, v in section.get('args', {}).items())
+        steps.append(PlanStep(step_name, step_type,
+                              max(1, _int(step_name, section, 'count', 1)),
+                              section.get('from'),
+                              _as_list(section.get('after')),
+                              _int(step_name, section, 'chunk_size', 0) or
+                              None, status, args,
+                              _float(step_name, section, 'wait', 0) or None))
+    return Plan(options.get('name', name), steps, workers)
+
+
+def default_plan():
+    conf = configobj.ConfigObj(DEFAULT_SCENARIO.splitlines())
+    return compile_scenario(conf, name='default')
+
+
+def load_scenario(path):
+    try:
+        conf = configobj.ConfigObj(path, raise_errors=True,
+                                   file_error=True)
+    except (configobj.ParseError, IOError) as e:
+        raise exc.ParsingError(e)
+    return compile_scenario(conf, name=path)
@@ -13,19 +13,146 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 #
+import decimal
 import json
+import threading
+import time
 
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from urlparse import parse_qs, urlsplit
+except ImportError:
+    from urllib.parse import parse_qs, urlsplit
+
+try:
+    import ijson
+    import ijson.common
+    # use_float only exists from ijson 3.1 on; older backends choke on it.
+    IJSON_ARGS = {}
+    if tuple(int(v) for v in ijson.__version__.split('.')[:2]) >= (3, 1):
+        IJSON_ARGS['use_float'] = True
+except ImportError:
+    ijson = None
+
+import sail.exceptions.common as exc
+from sail.services.cache import ReadCache
+from sail.services.poller import StatusPoller
+from sail.services.retry import RetryPolicy
+import sail.utils.conf as conf_util
+import sail.utils.deadline as deadline_util
+from sail.utils.pool import WorkerPool
+from sail.utils.throttle import Governor
+
+
+class CallStats(object):
+    """Wall time, time to first byte, size and retries of a call.
+
+    Calls that span several requests, like paginated reads, add up the
+    times and sizes of every request and keep the first time to first byte.
+    Time spent queued behind the service's rate limits is kept apart in
+    queue_wait and is not part of elapsed.
+    """
+
+    def __init__(self):
+        self.elapsed = 0.0
+        self.queue_wait = 0.0
+        self.ttfb = None
+        self.size = 0
+        self.retries = 0
+
+    def add_response(self, r, start):
+        queue_wait = getattr(r, 'queue_wait', 0.0)
+        self.queue_wait += queue_wait
+        self.elapsed += time.time() - start - queue_wait
+        if self.ttfb is None:
+            self.ttfb = r.elapsed.total_seconds()
+        try:
+            self.size += r.raw.tell()
+        except (AttributeError, ValueError):
+            self.size += len(r.content or b'')
+        self.retries += getattr(r, 'retries', 0)
+
+    def add(self, other):
+        self.elapsed += other.elapsed
+        self.queue_wait += other.queue_wait
+        if self.ttfb is None:
+            self.ttfb = other.ttfb
+        self.size += other.size
+        self.retries += other.retries
+
+
+def _created_ids(body):
+    """The ids in a create response, for single and list bodies alike."""
+    ids = []
+    if not isinstance(body, dict):
+        return ids
+    for value in body.values():
+        items = value if isinstance(value, list) else [value]
+        ids.extend(i['id'] for i in items
+                   if isinstance(i, dict) and 'id' in i)
+    return ids
+
+
+# Resources asked for per listing request. 0 asks for whole collections
+# at once, which holds every one of them in memory while it is read.
+DEFAULT_PAGE_SIZE = 100
+
+
+def _next_marker(links):
+    """The marker of the next page, from a collection's links."""
+    for link in links or []:
+        if isinstance(link, dict) and link.get('rel') == 'next':
+            markers = parse_qs(urlsplit(link.get('href', '')).query).get(
+                'marker')
+            if markers:
+                return markers[0]
+    return None
+
+
+def _page_end(items, links, page_size):
+    """The marker to read on from after a page, or None at the end.
+
+    The next link decides when the page has links at all, since endpoints
+    may cap the limit below what was asked for. Without links only a full
+    page is read on from.
+    """
+    if links is not None:
+        return _next_marker(links)
+    if page_size and len(items) == page_size and 'id' in items[-1]:
+        return items[-1]['id']
+    return None
+
+
+def _payload_names(info):
+    """The names in a create body, for single and list bodies alike."""
+    names = []
+    for value in info.values():
+        items = value if isinstance(value, list) else [value]
+        names.extend(i['name'] for i in items
+                     if isinstance(i, dict) and i.get('name'))
+    return names
 
 
 class ServiceResponse(object):
-    def __init__(self, success, status, body, raw):
+    def __init__(self, success, status, body, raw, stats=None):
         self.success = success
         self.status = status
         self.body = body
-        self.raw = raw
+        self._raw = raw
+        self.stats = stats or CallStats()
+
+    @property
+    def raw(self):
+        if self._raw is None and self.body is not None:
+            self._raw = json.dumps(self.body)
+        return self._raw
 
     def __str__(self):
+        if self.stats.retries:
+            return "%s:%s (retries: %d)" % (self.status, self.raw,
+                                            self.stats.retries)
         return "%s:%s" % (self.status, self.raw)
 
 
@@ -47,28 +174,355 @@ class ServiceController(object):
 
 class ServiceBase(object):
     def __init__(self):
-        pass
+        self.http = None
+        self.keep_alive = True
+        self.page_size = DEFAULT_PAGE_SIZE
+        self.bulk_chunk_size = 100
+        self.bulk_workers = 10
+        self.retry_policy = RetryPolicy()
+        self.governor = Governor()
+        self.read_cache = ReadCache()
+        self.recorder = None
+        self.poll_conf = None
+        self.pollers = {}
+        self.poll_lock = threading.Lock()
+        self.wait_timeout = 300.0
+        self.connect_timeout = 10.0
+        self.read_timeout = 60.0
 
-    def _get_collection(self, ctx, resource):
-        url = "%s/%s/%s" % (self.endpoint, self.version, resource)
+    def _configure(self, conf):
+        self._configure_http(conf)
+        self.retry_policy = RetryPolicy.from_conf(conf)
+        self.governor = Governor.from_conf(conf)
+        self.read_cache = ReadCache.from_conf(conf)
+        self.page_size = conf_util.get_int(conf, 'page_size',
+                                           DEFAULT_PAGE_SIZE)
+        self.bulk_chunk_size = conf_util.get_int(conf, 'bulk_chunk_size', 100)
+        self.bulk_workers = conf_util.get_int(conf, 'bulk_workers', 10)
+        self.poll_conf = conf
+        self.wait_timeout = conf_util.get_float(conf, 'wait_timeout', 300.0)
+        self.connect_timeout = conf_util.get_float(conf, 'connect_timeout',
+                                                   10.0)
+        self.read_timeout = conf_util.get_float(conf, 'read_timeout', 60.0)
+
+    def _configure_http(self, conf):
+        """Sets up the shared connection pool from the service conf section.
+
+        Setting pooled = false falls back to a one-shot connection for every
+        call, which is how sail used to behave.
+        """
+        self.keep_alive = conf_util.get_bool(conf, 'keep_alive', True)
+        if not conf_util.get_bool(conf, 'pooled', True):
+            self.http = None
+            return
+        adapter = HTTPAdapter(
+            pool_connections=conf_util.get_int(conf, 'pool_connections', 10),
+            pool_maxsize=conf_util.get_int(conf, 'pool_maxsize', 10),
+            pool_block=conf_util.get_bool(conf, 'pool_block', False))
+        self.http = requests.Session()
+        self.http.mount('http://', adapter)
+        self.http.mount('https://', adapter)
+
+    def close(self):
+        if self.http is not None:
+            self.http.close()
+            self.http = None
+
+    def _token(self, ctx):
+        if hasattr(ctx.auth_info, 'valid_token'):
+            return ctx.auth_info.valid_token()
+        return ctx.auth_info.token
+
+    def _deadline(self, ctx):
+        """The calling task's deadline, else the context's run budget."""
+        deadline = deadline_util.current() or getattr(ctx, 'budget', None)
+        return deadline or deadline_util.Deadline()
+
+    def _timeout(self, deadline):
+        # requests refuses a timeout of 0, which a deadline running out
+        # right after it was checked would give.
+        return (max(0.001, deadline.clamp(self.connect_timeout)),
+                max(0.001, deadline.clamp(self.read_timeout)))
+
+    def _headers(self, token):
         headers = {'Content-Type': 'application/json',
-                   'X-Auth-Token': ctx.auth_info.token}
-        r = requests.get(url, headers=headers)
-        res = None
-        success = True
+                   'X-Auth-Token': token}
+        if not self.keep_alive:
+            headers['Connection'] = 'close'
+        return headers
+
+    def _send(self, method, url, **kwargs):
+        if self.recorder is not None:
+            kwargs['hooks'] = self.recorder.hooks()
+        if self.http is None:
+            return requests.request(method, url, **kwargs)
+        return self.http.request(method, url, **kwargs)
+
+    def _request(self, method, url, deadline, **kwargs):
+        """Sends a request once the service's governor lets it through.
+
+        Waiting for the governor counts against the deadline, and the
+        request gets the timeouts of what is left of it after that.
+        """
+        queue_wait = self.governor.acquire(deadline)
         try:
-            res = json.loads(r.text)
+            r = self._send(method, url, timeout=self._timeout(deadline),
+                           **kwargs)
+        finally:
+            self.governor.release()
+        r.queue_wait = queue_wait
+        return r
+
+    def _call(self, ctx, method, url, retry=None, headers=None, **kwargs):
+        """Sends an authenticated request.
+
+        Re-authenticates once on 401 and retries transient failures as the
+        retry policy (the service's own unless one is given) allows. Every
+        request gets the service's connect and read timeouts, cut down to
+        what is left of the caller's deadline, and TimedOut is raised once
+        that deadline has passed or a request times out for good.
+        """
+        policy = retry or self.retry_policy
+        deadline = self._deadline(ctx)
+        attempt = 0
+        queue_wait = 0.0
+        reauthenticated = False
+        while True:
+            if deadline.expired():
+                raise exc.TimedOut("Out of time for %s %s" % (method, url))
+            token = self._token(ctx)
+            sent = self._headers(token)
+            sent.update(headers or {})
+            try:
+                r = self._request(method, url, deadline, headers=sent,
+                                  **kwargs)
+                queue_wait += r.queue_wait
+            except requests.RequestException as e:
+                if not policy.should_retry_error(method, e, attempt):
+                    if isinstance(e, requests.Timeout):
+                        raise exc.TimedOut("%s %s timed out: %s" %
+                                           (method, url, e))
+                    raise
+                time.sleep(deadline.clamp(policy.delay(attempt)))
+                attempt += 1
+                continue
+            if (r.status_code == 401 and not reauthenticated and
+                    hasattr(ctx.auth_info, 'refresh')):
+                reauthenticated = True
+                if ctx.auth_info.refresh(token):
+                    r.close()
+                    attempt += 1
+                    continue
+            if policy.should_retry(method, r.status_code, attempt):
+                delay = policy.delay(attempt, r.headers.get('Retry-After'))
+                r.close()
+                time.sleep(deadline.clamp(delay))
+                attempt += 1
+                continue
+            r.retries = attempt
+            r.queue_wait = queue_wait
+            return r
+
+    def _observe(self, ctx, verb, resource, r, start):
+        stats = CallStats()
+        stats.add_response(r, start)
+        if hasattr(ctx, 'record_call'):
+            ctx.record_call(self.name, verb, resource, stats)
+        return stats
+
+    def _journal(self, ctx, op, resource, ids):
+        if ids and hasattr(ctx, 'record_change'):
+            ctx.record_change(op, self, resource, ids)
+
+    def _decode_page(self, r, resource):
+        """The items of a collection page and its links (None if absent).
+        """
+        # A recorder has already read the whole body, so there is nothing
+        # left to stream.
+        if ijson is None or self.recorder is not None:
+            body = json.loads(r.text)
+            return body.get(resource, []), body.get(resource + '_links')
+        r.raw.decode_content = True
+        found = {resource + '.item': [], resource + '_links.item': []}
+        links = None
+        builder = None
+        for prefix, event, value in ijson.parse(r.raw, **IJSON_ARGS):
+            # Backends without use_float give decimals.
+            if isinstance(value, decimal.Decimal):
+                value = float(value)
+            if builder is not None:
+                builder.event(event, value)
+                if prefix == at and event in ('end_map', 'end_array'):
+                    found[at].append(builder.value)
+                    builder = None
+            elif prefix == resource + '_links' and event == 'start_array':
+                links = found[resource + '_links.item']
+            elif prefix in found:
+                if event in ('start_map', 'start_array'):
+                    builder, at = ijson.common.ObjectBuilder(), prefix
+                    builder.event(event, value)
+                else:
+                    found[prefix].append(value)
+        return found[resource + '.item'], links
+
+    def _collection_params(self, page_size, filters):
+        if page_size is None:
+            page_size = self.page_size
+        params = dict(filters)
+        if page_size:
+            params['limit'] = page_size
+        return page_size, params
+
+    def _iter_collection(self, ctx, resource, page_size=None, stats=None,
+                         retry=None, meta=None, **filters):
+        """Yields the resources of a collection one page at a time.
+
+        Pages are requested with limit/marker and decoded incrementally when
+        ijson is installed, so only a single page is ever held in memory.
+        A page is read in full before its items are yielded, which keeps
+        the caller's own work out of the time recorded for it. The next
+        page is the one the page's next link points at, so an endpoint
+        that caps the limit is still read to the end.
+        A page_size of 0 asks for the whole collection in one request. The
+        cost of every page is added to stats when one is given, and the
+        page count and first ETag are put in meta.
+        """
+        url = "%s/%s/%s" % (self.endpoint, self.version, resource)
+        page_size, params = self._collection_params(page_size, filters)
+        while True:
+            start = time.time()
+            r = self._call(ctx, 'GET', url, retry=retry, params=params,
+                           stream=True)
+            try:
+                if r.status_code != 200:
+                    body = None
+                    try:
+                        body = json.loads(r.text)
+                    except ValueError:
+                        pass
+                    resp = ServiceResponse(False, r.status_code, body,
+                                           r.text, stats)
+                    raise exc.ServiceError("Failed to list %s" % resource,
+                                           resp)
+                items, links = self._decode_page(r, resource)
+            finally:
+                r.close()
+                page = self._observe(ctx, 'GET', resource, r, start)
+                if stats is not None:
+                    stats.add(page)
+                if meta is not None:
+                    meta['pages'] = meta.get('pages', 0) + 1
+                    meta.setdefault('etag', r.headers.get('ETag'))
+            for item in items:
+                yield item
+            marker = _page_end(items, links, page_size)
+            if marker is None or params.get('marker') == marker:
+                return
+            params['marker'] = marker
+
+    def _fetch_collection(self, ctx, resource, retry=None, **filters):
+        """Reads a whole collection; returns the response and its ETag.
+
+        The ETag is only kept when the collection fit in a single page.
+        """
+        stats = CallStats()
+        meta = {}
+        try:
+            items = list(self._iter_collection(ctx, resource, stats=stats,
+                                               retry=retry, meta=meta,
+                                               **filters))
+        except exc.ServiceError as e:
+            return e.response, None
+        etag = meta.get('etag') if meta.get('pages') == 1 else None
+        return (ServiceResponse(True, 200, {resource: items}, None, stats),
+                etag)
+
+    def _revalidate(self, ctx, resource, etag, retry=None, **filters):
+        """Asks whether a cached read is current, with If-None-Match.
+
+        Returns (None, etag) on 304. Otherwise the answer is the new read,
+        returned as a (response, etag) pair like _fetch_collection does; a
+        first page with more after it is followed by the rest of the
+        collection.
+        """
+        url = "%s/%s/%s" % (self.endpoint, self.version, resource)
+        page_size, params = self._collection_params(None, filters)
+        start = time.time()
+        r = self._call(ctx, 'GET', url, retry=retry, params=params,
+                       headers={'If-None-Match': etag})
+        stats = self._observe(ctx, 'GET', resource, r, start)
+        if r.status_code == 304:
+            return None, etag
+        body = None
+        try:
+            body = json.loads(r.text)
         except ValueError:
-            if r.status_code != 200:
-                success = False
-        return ServiceResponse(success, r.status_code, res, r.text)
+            pass
+        if r.status_code != 200 or not isinstance(body, dict):
+            return ServiceResponse(False, r.status_code, body, r.text,
+                                   stats), None
+        items = body.get(resource, [])
+        etag = r.headers.get('ETag')
+        marker = _page_end(items, body.get(resource + '_links'), page_size)
+        if marker is not None:
+            rest = dict(filters, marker=marker)
+            try:
+                items.extend(self._iter_collection(ctx, resource,
+                                                   stats=stats, retry=retry,
+                                                   **rest))
+            except exc.ServiceError as e:
+                return e.response, None
+            etag = None
+        return (ServiceResponse(True, 200, {resource: items}, None, stats),
+                etag)
+
+    def poller(self, resource):
+        with self.poll_lock:
+            if resource not in self.pollers:
+                self.pollers[resource] = StatusPoller.from_conf(
+                    self, resource, self.poll_conf)
+            return self.pollers[resource]
+
+    def _wait_ready(self, ctx, resource, ids, timeout=None):
+        """Blocks until the resources are ready, failed or out of time.
+
+        Returns a WaitResult. How long each ready one took is recorded as
+        its time to converge.
+        """
+        if timeout is None:
+            timeout = self.wait_timeout
+        timeout = self._deadline(ctx).clamp(timeout)
+        result = self.poller(resource).wait(ctx, ids, timeout).result()
+        if hasattr(ctx, 'record_converge'):
+            for seconds in result.ready.values():
+                ctx.record_converge(self.name, resource, seconds)
+        return result
+
+    def _get_collection(self, ctx, resource, retry=None, **filters):
+        # The response can be shared with other callers through the read
+        # cache, so its body is read-only.
+        def fetch():
+            return self._fetch_collection(ctx, resource, retry, **filters)
 
-    def _create_resource(self, ctx, resource, info):
+        def revalidate(etag):
+            return self._revalidate(ctx, resource, etag, retry, **filters)
+        tenant = getattr(ctx.auth_info, 'tenant_id', None)
+        return self.read_cache.get(resource, filters, fetch, revalidate,
+                                   tenant)
+
+    def _create_resource(self, ctx, resource, info, retry=None):
         url = "%s/%s/%s" % (self.endpoint, self.version, resource)
-        headers = {'Content-Type': 'application/json',
-                   'X-Auth-Token': ctx.auth_info.token}
         payload = json.dumps(info)
-        r = requests.post(url, headers=headers, data=payload)
+        start = time.time()
+        try:
+            r = self._call(ctx, 'POST', url, retry=retry, data=payload)
+        except exc.TimedOut:
+            # The endpoint may have made it all the same, without anybody
+            # learning the ids; teardown looks for it by name.
+            if hasattr(ctx, 'record_unsure'):
+                ctx.record_unsure(self, resource, _payload_names(info))
+            raise
+        self.read_cache.invalidate(resource)
         res = None
         success = True
         try:
@@ -76,15 +530,51 @@ class ServiceBase(object):
         except ValueError:
             if r.status_code != 201:
                 success = False
-        return ServiceResponse(success, r.status_code, res, r.text)
+        stats = self._observe(ctx, 'POST', resource, r, start)
+        if success and r.status_code in (200, 201):
+            self._journal(ctx, 'create', resource, _created_ids(res))
+        return ServiceResponse(success, r.status_code, res, r.text, stats)
 
-    def _delete_resource(self, ctx, resource, id):
+    def _delete_resource(self, ctx, resource, id, retry=None):
         url = "%s/%s/%s/%s" % (self.endpoint, self.version, resource, id)
-        headers = {'Content-Type': 'application/json',
-                   'X-Auth-Token': ctx.auth_info.token}
-        r = requests.delete(url, headers=headers)
+        start = time.time()
+        r = self._call(ctx, 'DELETE', url, retry=retry)
+        self.read_cache.invalidate(resource)
         res = None
         success = True
         if r.status_code != 204:
             success = False
-        return ServiceResponse(success, r.status_code, res, r.text)
+        stats = self._observe(ctx, 'DELETE', resource, r, start)
+        if r.status_code in (204, 404):
+            self._journal(ctx, 'delete', resource, [id])
+        return ServiceResponse(success, r.status_code, res, r.text, stats)
+
+    def _create_resources(self, ctx, resource, infos, chunk_size=None,
+                          retry=None):
+        """Creates many resources with list bodies, one POST per chunk.
+
+        Returns a ServiceResponse for every chunk sent.
+        """
+        chunk_size = chunk_size or self.bulk_chunk_size
+        responses = []
+        for start in range(0, len(infos), chunk_size):
+            chunk = infos[start:start + chunk_size]
+            responses.append(self._create_resource(ctx, resource,
+                                                   {resource: chunk}, retry))
+        return responses
+
+    def _delete_resources(self, ctx, resource, ids, workers=None,
+                          retry=None):
+        """Deletes many resources concurrently, one DELETE per id.
+
+        Returns the ServiceResponses in the same order as ids.
+        """
+        ids = list(ids)
+        if not ids:
+            return []
+        workers = min(workers or self.bulk_workers, len(ids))
+        with WorkerPool(workers) as pool:
+            futures = [pool.submit(self._delete_resource, ctx, resource, id,
+                                   retry)
+                       for id in ids]
+            return [f.result() for f in futures]
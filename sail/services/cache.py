@@ -0,0 +1,127 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import sys
+import threading
+import time
+
+import sail.utils.conf as conf_util
+from sail.utils.pool import Future
+
+
+class _Entry(object):
+    __slots__ = ('stamp', 'response', 'etag')
+
+    def __init__(self, response, etag):
+        self.stamp = time.time()
+        self.response = response
+        self.etag = etag
+
+
+class ReadCache(object):
+    """Short-lived cache of collection reads, shared by a service's users.
+
+    A read is answered from the cache for ttl seconds. After that, a read
+    that came with an ETag is revalidated with If-None-Match, and any other
+    is fetched again. Identical reads in flight at the same time share one
+    request only when coalesce is set, since a load run is meant to send
+    every read it makes. Reads are keyed by tenant as well as by resource
+    and filters, so callers under different tenants never share one. Any
+    write to a resource type drops its entries, and reads already in
+    flight are then neither cached nor joined.
+
+    Cached and coalesced reads hand the same response to every caller, so
+    response bodies are read-only.
+    """
+
+    def __init__(self, ttl=0.0, coalesce=False):
+        self.ttl = ttl
+        self.coalesce = coalesce
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.inflight = {}
+        self.generations = {}
+        self.hits = 0
+        self.coalesced = 0
+        self.revalidated = 0
+
+    @classmethod
+    def from_conf(cls, conf):
+        return cls(ttl=conf_util.get_float(conf, 'cache_ttl', 0.0),
+                   coalesce=conf_util.get_bool(conf, 'coalesce_reads', False))
+
+    @staticmethod
+    def key(resource, filters, tenant=None):
+        return (resource, tenant,
+                tuple(sorted((k, str(v)) for k, v in filters.items())))
+
+    def invalidate(self, resource):
+        with self.lock:
+            self.generations[resource] = self.generations.get(resource,
+                                                              0) + 1
+            for key in list(self.entries):
+                if key[0] == resource:
+                    del self.entries[key]
+            for key in list(self.inflight):
+                if key[0] == resource:
+                    del self.inflight[key]
+
+    def get(self, resource, filters, fetch, revalidate, tenant=None):
+        """Returns the cached read or calls fetch() for a new one.
+
+        fetch returns a (response, etag) pair. revalidate(etag) returns
+        (None, etag) when the endpoint says the cached copy is still
+        current, and the new (response, etag) pair when it is not.
+        """
+        key = self.key(resource, filters, tenant)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.time() - entry.stamp < self.ttl:
+                self.hits += 1
+                return entry.response
+            future = self.inflight.get(key) if self.coalesce else None
+            leader = future is None
+            if leader:
+                future = Future()
+                self.inflight[key] = future
+                generation = self.generations.get(resource, 0)
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+        response = None
+        etag = None
+        try:
+            if entry is not None and entry.etag:
+                response, etag = revalidate(entry.etag)
+                if response is None:
+                    response, etag = entry.response, entry.etag
+                    with self.lock:
+                        self.revalidated += 1
+            else:
+                response, etag = fetch()
+            future.set_result(response)
+        except Exception:
+            future.set_exception(sys.exc_info())
+            raise
+        finally:
+            with self.lock:
+                if self.inflight.get(key) is future:
+                    del self.inflight[key]
+                if (response is not None and response.success and
+                        (self.ttl or etag) and
+                        generation == self.generations.get(resource, 0)):
+                    self.entries[key] = _Entry(response, etag)
+        return response
@@ -19,6 +19,7 @@ from sail.services.base import ServiceBase
 
 class NetworkService(ServiceBase):
     def __init__(self, conf):
+        super(NetworkService, self).__init__()
         self.name = 'network'
         if conf is None:
             raise exc.MissingRequiredInformation("Missing configuration")
@@ -32,39 +33,89 @@ class NetworkService(ServiceBase):
         if 'version' not in network:
             raise exc.MissingRequiredInformation("Missing endpoint in conf")
         self.version = network['version']
+        self._configure(network)
 
-    def get_networks(self, ctx):
-        return self._get_collection(ctx, "networks")
+    def get_networks(self, ctx, retry=None, **filters):
+        return self._get_collection(ctx, "networks", retry, **filters)
 
-    def create_network(self, ctx, net_info):
-        return self._create_resource(ctx, "networks", net_info)
+    def iter_networks(self, ctx, page_size=None, retry=None, **filters):
+        return self._iter_collection(ctx, "networks", page_size, retry=retry,
+                                     **filters)
 
-    def delete_network(self, ctx, id):
-        return self._delete_resource(ctx, "networks", id)
+    def create_network(self, ctx, net_info, retry=None):
+        return self._create_resource(ctx, "networks", net_info, retry)
 
-    def get_subnets(self, ctx):
-        return self._get_collection(ctx, "subnets")
+    def delete_network(self, ctx, id, retry=None):
+        return self._delete_resource(ctx, "networks", id, retry)
 
-    def create_subnet(self, ctx, subnet_info):
-        return self._create_resource(ctx, "subnets", subnet_info)
+    def create_networks(self, ctx, net_infos, chunk_size=None, retry=None):
+        return self._create_resources(ctx, "networks", net_infos, chunk_size,
+                                      retry)
 
-    def delete_subnet(self, ctx, id):
-        return self._delete_resource(ctx, "subnets", id)
+    def delete_networks(self, ctx, ids, workers=None, retry=None):
+        return self._delete_resources(ctx, "networks", ids, workers, retry)
 
-    def get_ports(self, ctx):
-        return self._get_collection(ctx, "ports")
+    def wait_for_networks(self, ctx, ids, timeout=None):
+        return self._wait_ready(ctx, "networks", ids, timeout)
 
-    def create_port(self, ctx, port_info):
-        return self._create_resource(ctx, "ports", port_info)
+    def get_subnets(self, ctx, retry=None, **filters):
+        return self._get_collection(ctx, "subnets", retry, **filters)
 
-    def delete_port(self, ctx, id):
-        return self._delete_resource(ctx, "ports", id)
+    def iter_subnets(self, ctx, page_size=None, retry=None, **filters):
+        return self._iter_collection(ctx, "subnets", page_size, retry=retry,
+                                     **filters)
 
-    def get_ip_addresses(self, ctx):
-        return self._get_collection(ctx, "ip_addresses")
+    def create_subnet(self, ctx, subnet_info, retry=None):
+        return self._create_resource(ctx, "subnets", subnet_info, retry)
 
-    def create_ip_addresses(self, ctx, ip_info):
-        return self._create_resource(ctx, "ip_addresses", ip_info)
+    def delete_subnet(self, ctx, id, retry=None):
+        return self._delete_resource(ctx, "subnets", id, retry)
 
-    def delete_ip_addresses(self, ctx, id):
-        return self._delete_resource(ctx, "ip_addresses", id)
+    def create_subnets(self, ctx, subnet_infos, chunk_size=None, retry=None):
+        return self._create_resources(ctx, "subnets", subnet_infos, chunk_size,
+                                      retry)
+
+    def delete_subnets(self, ctx, ids, workers=None, retry=None):
+        return self._delete_resources(ctx, "subnets", ids, workers, retry)
+
+    def wait_for_subnets(self, ctx, ids, timeout=None):
+        return self._wait_ready(ctx, "subnets", ids, timeout)
+
+    def get_ports(self, ctx, retry=None, **filters):
+        return self._get_collection(ctx, "ports", retry, **filters)
+
+    def iter_ports(self, ctx, page_size=None, retry=None, **filters):
+        return self._iter_collection(ctx, "ports", page_size, retry=retry,
+                                     **filters)
+
+    def create_port(self, ctx, port_info, retry=None):
+        return self._create_resource(ctx, "ports", port_info, retry)
+
+    def delete_port(self, ctx, id, retry=None):
+        return self._delete_resource(ctx, "ports", id, retry)
+
+    def create_ports(self, ctx, port_infos, chunk_size=None, retry=None):
+        return self._create_resources(ctx, "ports", port_infos, chunk_size,
+                                      retry)
+
+    def delete_ports(self, ctx, ids, workers=None, retry=None):
+        return self._delete_resources(ctx, "ports", ids, workers, retry)
+
+    def wait_for_ports(self, ctx, ids, timeout=None):
+        return self._wait_ready(ctx, "ports", ids, timeout)
+
+    def get_ip_addresses(self, ctx, retry=None, **filters):
+        return self._get_collection(ctx, "ip_addresses", retry, **filters)
+
+    def iter_ip_addresses(self, ctx, page_size=None, retry=None, **filters):
+        return self._iter_collection(ctx, "ip_addresses", page_size,
+                                     retry=retry, **filters)
+
+    def create_ip_addresses(self, ctx, ip_info, retry=None):
+        return self._create_resource(ctx, "ip_addresses", ip_info, retry)
+
+    def delete_ip_addresses(self, ctx, id, retry=None):
+        return self._delete_resource(ctx, "ip_addresses", id, retry)
+
+    def wait_for_ip_addresses(self, ctx, ids, timeout=None):
+        return self._wait_ready(ctx, "ip_addresses", ids, timeout)
@@ -0,0 +1,196 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import threading
+import time
+
+from sail import log
+import sail.utils.conf as conf_util
+from sail.utils.pool import Future
+
+
+class WaitResult(object):
+    """How the resources of one wait ended up.
+
+    ready maps ids to their seconds to converge, failed maps ids to the
+    status they failed with, and timed_out lists those still pending at
+    the deadline.
+    """
+
+    def __init__(self):
+        self.ready = {}
+        self.failed = {}
+        self.timed_out = []
+
+    @property
+    def success(self):
+        return not self.failed and not self.timed_out
+
+
+class _Wait(object):
+    def __init__(self, ctx, ids, deadline):
+        self.ctx = ctx
+        self.start = time.time()
+        self.pending = set(ids)
+        self.deadline = deadline
+        self.result = WaitResult()
+        self.future = Future()
+
+
+class StatusPoller(object):
+    """Waits for resources of one collection to reach a ready status.
+
+    Every poll is one filtered GET (id=...&id=..., split into batches) per
+    context for all resources anybody is waiting on in it. The interval
+    starts at interval and grows by backoff up to max_interval while
+    nothing changes; it drops back as soon as something converges or a
+    new wait comes in.
+    """
+
+    def __init__(self, service, collection, ready=('ACTIVE',),
+                 failed=('ERROR',), interval=0.2, max_interval=5.0,
+                 backoff=1.5, batch=100):
+        self.service = service
+        self.collection = collection
+        self.ready = set(ready)
+        self.failed = set(failed)
+        self.interval = interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.batch = max(1, batch)
+        self.cond = threading.Condition()
+        self.waits = []
+        self.current = interval
+        self.added = 0
+        self.thread = None
+        self.polls = 0
+
+    @classmethod
+    def from_conf(cls, service, collection, conf):
+        return cls(service, collection,
+                   ready=conf_util.get_list(conf, 'ready_statuses',
+                                            ['ACTIVE']),
+                   failed=conf_util.get_list(conf, 'failed_statuses',
+                                             ['ERROR']),
+                   interval=conf_util.get_float(conf, 'poll_interval', 0.2),
+                   max_interval=conf_util.get_float(conf,
+                                                    'poll_max_interval', 5.0),
+                   backoff=conf_util.get_float(conf, 'poll_backoff', 1.5),
+                   batch=conf_util.get_int(conf, 'poll_batch', 100))
+
+    def wait(self, ctx, ids, timeout=None):
+        """Returns a Future for the WaitResult of ids."""
+        deadline = time.time() + timeout if timeout is not None else None
+        wait = _Wait(ctx, ids, deadline)
+        if not wait.pending:
+            wait.future.set_result(wait.result)
+            return wait.future
+        with self.cond:
+            self.waits.append(wait)
+            self.added += 1
+            self.current = self.interval
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._loop)
+                self.thread.daemon = True
+                self.thread.start()
+            else:
+                self.cond.notify()
+        return wait.future
+
+    def _statuses(self, ctx, ids):
+        statuses = {}
+        ids = sorted(ids)
+        for index in range(0, len(ids), self.batch):
+            resp, _ = self.service._fetch_collection(
+                ctx, self.collection, id=ids[index:index + self.batch])
+            self.polls += 1
+            if not resp.success:
+                ctx.emit(log.DEBUG, "StatusPoller", "DEBUG",
+                         "poll of %s failed: %s", self.collection,
+                         resp.status)
+                continue
+            for item in resp.body.get(self.collection, []):
+                statuses[item.get('id')] = item.get('status')
+        return statuses
+
+    def _poll(self, ctx, ids):
+        try:
+            return self._statuses(ctx, ids)
+        except Exception as e:
+            # A failed poll counts as no progress; deadlines still apply.
+            ctx.emit(log.DEBUG, "StatusPoller", "EXCEPT(ignored)",
+                     "poll of %s: %s", self.collection, e)
+            return {}
+
+    def _settle(self, statuses, now):
+        """Settles what converged or ran out of time.
+
+        statuses maps each context to the statuses polled in that context.
+        Returns whether anything converged and the waits now done.
+        """
+        progress = False
+        for wait in self.waits:
+            polled = statuses.get(wait.ctx, {})
+            for id in list(wait.pending):
+                status = polled.get(id)
+                # Resources without a status are ready once listed.
+                if status in self.ready or (status is None and
+                                            id in polled):
+                    wait.result.ready[id] = now - wait.start
+                elif status in self.failed:
+                    wait.result.failed[id] = status
+                else:
+                    continue
+                wait.pending.discard(id)
+                progress = True
+            if wait.deadline is not None and now >= wait.deadline:
+                wait.result.timed_out = sorted(wait.pending)
+                wait.pending.clear()
+        done = [w for w in self.waits if not w.pending]
+        self.waits = [w for w in self.waits if w.pending]
+        return progress, done
+
+    def _loop(self):
+        while True:
+            with self.cond:
+                if not self.waits:
+                    self.thread = None
+                    return
+                # Each context (and so tenant) only sees its own resources.
+                pending = {}
+                for wait in self.waits:
+                    pending.setdefault(wait.ctx, set()).update(wait.pending)
+                added = self.added
+            statuses = dict((ctx, self._poll(ctx, ids))
+                            for ctx, ids in pending.items())
+            with self.cond:
+                now = time.time()
+                progress, done = self._settle(statuses, now)
+                if progress:
+                    self.current = self.interval
+                else:
+                    self.current = min(self.current * self.backoff,
+                                       self.max_interval)
+                delay = self.current
+                deadlines = [w.deadline for w in self.waits
+                             if w.deadline is not None]
+                if deadlines:
+                    delay = max(0.0, min(delay, min(deadlines) - now))
+            for wait in done:
+                wait.future.set_result(wait.result)
+            with self.cond:
+                # New waits are polled for straight away.
+                if self.waits and self.added == added:
+                    self.cond.wait(delay)
@@ -0,0 +1,109 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+from email.utils import mktime_tz
+from email.utils import parsedate_tz
+import random
+import time
+
+import requests
+
+import sail.utils.conf as conf_util
+
+
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')
+# Statuses that mean the endpoint turned the request away before acting on
+# it, so even a create can be sent again without risking a duplicate.
+REJECTED_STATUSES = (429, 503)
+
+
+class RetryPolicy(object):
+    """Decides whether and when a failed service request is sent again.
+
+    Idempotent requests are retried on any of the configured statuses and
+    on connection errors. Creates are only retried when the endpoint
+    rejected them outright (429/503) or the connection was never made, and
+    only while retry_creates is set. Delays grow exponentially with full
+    jitter, and a Retry-After header is honoured when it asks for longer.
+    """
+
+    def __init__(self, max_retries=3, backoff=0.5, max_backoff=30.0,
+                 jitter=True, statuses=(409, 429, 503), retry_creates=True):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.statuses = tuple(statuses)
+        self.retry_creates = retry_creates
+
+    @classmethod
+    def from_conf(cls, conf):
+        statuses = (409, 429, 503)
+        if conf is not None and 'retry_statuses' in conf:
+            statuses = conf['retry_statuses']
+            if not isinstance(statuses, (list, tuple)):
+                statuses = statuses.split(',')
+            statuses = [int(s) for s in statuses]
+        return cls(max_retries=conf_util.get_int(conf, 'retry_max', 3),
+                   backoff=conf_util.get_float(conf, 'retry_backoff', 0.5),
+                   max_backoff=conf_util.get_float(conf, 'retry_max_backoff',
+                                                   30.0),
+                   jitter=conf_util.get_bool(conf, 'retry_jitter', True),
+                   statuses=statuses,
+                   retry_creates=conf_util.get_bool(conf, 'retry_creates',
+                                                    True))
+
+    def _allowed(self, method, attempt):
+        if attempt >= self.max_retries:
+            return False
+        return method in IDEMPOTENT_METHODS or self.retry_creates
+
+    def should_retry(self, method, status, attempt):
+        if status not in self.statuses or not self._allowed(method, attempt):
+            return False
+        return method in IDEMPOTENT_METHODS or status in REJECTED_STATUSES
+
+    def should_retry_error(self, method, error, attempt):
+        if not self._allowed(method, attempt):
+            return False
+        if method in IDEMPOTENT_METHODS:
+            return isinstance(error, requests.ConnectionError)
+        return isinstance(error, requests.exceptions.ConnectTimeout)
+
+    def delay(self, attempt, retry_after=None):
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        wanted = parse_retry_after(retry_after)
+        if wanted is not None:
+            delay = max(delay, wanted)
+        return delay
+
+
+NO_RETRY = RetryPolicy(max_retries=0)
+
+
+def parse_retry_after(value):
+    """Returns the seconds a Retry-After header asks for, if it is valid."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parsed = parsedate_tz(value)
+    if parsed is None:
+        return None
+    return max(0.0, mktime_tz(parsed) - time.time())
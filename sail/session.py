@@ -14,11 +14,21 @@
 #   limitations under the License.
 #
 from functools import wraps
+import uuid
 
+from sail.context import set_current_context
 from sail.context import SetupContext
+from sail.journal import UndoJournal
+from sail import log
+from sail import metrics
+from sail.utils.allocator import AddressPools
 from sail.utils.generators import ArtifactGenerator
+from sail.utils.generators import DEFAULT_PREFIXLEN
+from sail.utils.generators import DEFAULT_SUPERNET
+from sail.utils.generators import IPAddressGenerator
 from sail.utils.generators import NetworkGenerator
-from sail.tasks.task import Task
+from sail.utils.generators import PortGenerator
+from sail.utils.generators import SubnetGenerator
 
 #TODO(roaet): might be dead code here
 def doublewrap(f):
@@ -48,22 +58,48 @@ def sessionwrap(f):
     return wrap
 
 class Session(object):
-    def __init__(self):
+    def __init__(self, log_level=log.INFO, log_history=1000, log_file=None,
+                 log_stream=None, journal_dir=None, supernet=DEFAULT_SUPERNET,
+                 subnet_prefixlen=DEFAULT_PREFIXLEN):
         self.context = None
-        self.logs = []
-        self.generator = ArtifactGenerator()
+        self.journal = None
+        if journal_dir is not None:
+            self.journal = UndoJournal.create(journal_dir)
+        self.logger = log.SessionLogger(level=log_level, history=log_history,
+                                        stream=log_stream, json_path=log_file)
+        self.logs = self.logger.history
+        self.metrics = metrics.MetricsRegistry()
+        # Names carry the run, so a create that timed out can be found.
+        self.run = uuid.uuid4().hex[:8]
+        self.generator = ArtifactGenerator(run=self.run)
+        # Ports and IPs draw their addresses from the subnets made here.
+        pools = AddressPools()
         self.generator.register_generator(NetworkGenerator())
+        self.generator.register_generator(
+            SubnetGenerator(supernet, subnet_prefixlen, pools))
+        self.generator.register_generator(PortGenerator(pools))
+        self.generator.register_generator(IPAddressGenerator(pools))
 
     def ignore_errors(self):
         return False if self.context is None else self.context.ignore_errors
 
-    def setUp(self, auth_info, services):
-        self.context = SetupContext(auth_info, services)
-        self.context.session = self
-        #TODO(roaet): This is probably not safe to do. Find better way.
-        Task.context = self.context
+    def new_context(self, auth_info, services, **kwargs):
+        context = SetupContext(auth_info, services, **kwargs)
+        context.session = self
+        return context
+
+    def setUp(self, auth_info, services, **kwargs):
+        self.context = self.new_context(auth_info, services, **kwargs)
+        set_current_context(self.context)
         return self.context
 
-    def log(self, msg):
-        print msg
-        self.logs.append(msg)
+    def export_metrics(self, path, fmt='json'):
+        metrics.export(self.metrics, path, fmt)
+
+    def log(self, msg, level=log.INFO, state=None, source=None):
+        self.logger.log(level, state, source, None, msg)
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+        self.logger.close()
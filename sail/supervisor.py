@@ -0,0 +1,208 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import multiprocessing
+import os
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from sail import metrics
+from sail.services import SERVICES
+import sail.session as session
+
+
+class WorkerSpec(object):
+    """What one worker process runs: a plan slice as one tenant."""
+
+    def __init__(self, index, plan, tenant, auth_info, net_conf,
+                 session_args=None, context_args=None, workers=8):
+        self.index = index
+        self.plan = plan
+        self.tenant = tenant
+        self.auth_info = auth_info
+        self.net_conf = net_conf
+        self.session_args = session_args or {}
+        self.context_args = context_args or {}
+        self.workers = workers
+
+
+def run_worker(spec):
+    """Runs a spec in this process and returns what the supervisor merges.
+
+    The worker has its own Session and SetupContext, so its journal, logs
+    and artifacts are its own. Only plain data goes back.
+    """
+    result = {'index': spec.index, 'pid': os.getpid(),
+              'tenant': spec.tenant, 'plan': spec.plan.name, 'tasks': 0,
+              'failed': 0, 'timed_out': 0, 'artifacts': {}, 'undone': 0,
+              'undo_failures': [], 'undo_timeouts': [], 'calls': {},
+              'converge': {}, 'error': None}
+    start = time.time()
+    sess = session.Session(**spec.session_args)
+    service = SERVICES.get('network')(spec.net_conf)
+    context = sess.setUp(spec.auth_info, [service], **spec.context_args)
+    try:
+        with context:
+            try:
+                spec.plan.run(spec.workers)
+            finally:
+                tasks = list(context.tasks)
+                result['tasks'] = len(tasks)
+                result['timed_out'] = len([t for t in tasks if t.timed_out])
+                result['failed'] = len([t for t in tasks
+                                        if not t.was_successful() and
+                                        not t.timed_out])
+                with context.artifacts.lock:
+                    result['artifacts'] = dict(
+                        (key, len(items)) for key, items in
+                        context.artifacts.by_key.items())
+    except Exception as e:
+        result['error'] = "%s: %s" % (e.__class__.__name__, e)
+    finally:
+        result['undone'] = context.undone
+        result['undo_failures'] = context.undo_failures
+        result['undo_timeouts'] = context.undo_timeouts
+        service.close()
+        sess.close()
+    with sess.metrics.lock:
+        result['calls'] = dict(sess.metrics.calls)
+        result['converge'] = dict(sess.metrics.converge)
+    result['elapsed'] = time.time() - start
+    return result
+
+
+def _worker_main(spec, results):
+    try:
+        result = run_worker(spec)
+    except BaseException as e:
+        result = {'index': spec.index, 'pid': os.getpid(),
+                  'error': "%s: %s" % (e.__class__.__name__, e)}
+    results.put(result)
+
+
+class SupervisorReport(object):
+    def __init__(self, results, elapsed):
+        self.results = sorted(results, key=lambda r: r['index'])
+        self.elapsed = elapsed
+        self.metrics = metrics.MetricsRegistry()
+        self.artifacts = {}
+        for result in self.results:
+            self.metrics.merge(result.get('calls', {}),
+                               result.get('converge'))
+            for key, count in result.get('artifacts', {}).items():
+                self.artifacts[key] = self.artifacts.get(key, 0) + count
+
+    def total(self, field):
+        return sum(r.get(field, 0) for r in self.results)
+
+    def failures(self):
+        return [r for r in self.results if r['error'] or r.get('failed') or
+                r.get('timed_out') or r.get('undo_failures') or
+                r.get('undo_timeouts')]
+
+    def lines(self):
+        lines = []
+        for r in self.results:
+            line = ("worker %d pid %d %s %s: %d tasks (%d failed, %d timed "
+                    "out), undid %d (%d failed, %d timed out) in %.2fs" %
+                    (r['index'], r['pid'], r.get('tenant', '-'),
+                     r.get('plan', '-'), r.get('tasks', 0),
+                     r.get('failed', 0), r.get('timed_out', 0),
+                     r.get('undone', 0), len(r.get('undo_failures', [])),
+                     len(r.get('undo_timeouts', [])), r.get('elapsed', 0.0)))
+            if r['error']:
+                line += " ERROR %s" % r['error']
+            lines.append(line)
+        calls = self.metrics.summary()
+        requests = sum(c['count'] for c in calls.values())
+        elapsed = self.elapsed or 1e-9
+        lines.append("%d workers: %d tasks (%d failed, %d timed out), undid "
+                     "%d (%d failed, %d timed out) in %.2fs: %.2f req/s" %
+                     (len(self.results), self.total('tasks'),
+                      self.total('failed'), self.total('timed_out'),
+                      self.total('undone'),
+                      sum(len(r.get('undo_failures', []))
+                          for r in self.results),
+                      sum(len(r.get('undo_timeouts', []))
+                          for r in self.results),
+                      self.elapsed, requests / elapsed))
+        if self.artifacts:
+            lines.append("artifacts: %s" %
+                         ", ".join("%s %d" % (key, self.artifacts[key])
+                                   for key in sorted(self.artifacts)))
+        lines.append("%-32s %8s %10s %10s %10s" %
+                     ("call", "count", "p50(ms)", "p95(ms)", "p99(ms)"))
+        for key in sorted(calls):
+            call = calls[key]
+            lines.append("%-32s %8d %10.1f %10.1f %10.1f" %
+                         (" ".join(key), call['count'], call['p50'] * 1000,
+                          call['p95'] * 1000, call['p99'] * 1000))
+        return lines
+
+
+class Supervisor(object):
+    """Runs worker specs in processes of their own and merges the results.
+
+    Every worker gets its own interpreter, so JSON and HTTP work spreads
+    over the cores. A worker that dies without reporting is counted as
+    failed with its exit code.
+    """
+
+    def __init__(self, specs):
+        self.specs = specs
+
+    def _collect(self, processes, results):
+        collected = {}
+        dead = set()
+        while len(collected) < len(processes):
+            try:
+                result = results.get(timeout=0.5)
+                collected[result['index']] = result
+                continue
+            except queue.Empty:
+                pass
+            for index, process in processes.items():
+                if index in collected or process.is_alive():
+                    continue
+                # Give a result written just before exiting one more round
+                # to arrive before giving up on it.
+                if index not in dead:
+                    dead.add(index)
+                    continue
+                collected[index] = {
+                    'index': index, 'pid': process.pid,
+                    'error': "exited with %s" % process.exitcode}
+        return list(collected.values())
+
+    def run(self):
+        start = time.time()
+        results = multiprocessing.Queue()
+        processes = {}
+        try:
+            for spec in self.specs:
+                process = multiprocessing.Process(target=_worker_main,
+                                                  args=(spec, results))
+                process.daemon = True
+                process.start()
+                processes[spec.index] = process
+            collected = self._collect(processes, results)
+        finally:
+            for process in processes.values():
+                process.join()
+        return SupervisorReport(collected, time.time() - start)
@@ -0,0 +1,195 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import threading
+import time
+
+import sail.exceptions.common as exc
+from sail.utils.auth import parse_expires
+from sail.utils.generators import BaseGenerator
+from sail.utils.pool import WorkerPool
+
+
+# Dependents first, so nothing is still in use when it is deleted.
+TIERS = (
+    ('ip_addresses', 'delete_ip_addresses'),
+    ('ports', 'delete_port'),
+    ('subnets', 'delete_subnet'),
+    ('networks', 'delete_network'),
+)
+
+# Resources that can match by name, not only by the network they are on.
+NAMED = ('ports', 'subnets', 'networks')
+
+
+def default_prefix():
+    generator = BaseGenerator()
+    return generator.prefix + generator.join
+
+
+class TierReport(object):
+    def __init__(self, resource):
+        self.resource = resource
+        self.matched = 0
+        self.deleted = 0
+        self.gone = 0
+        self.failures = []
+        self.elapsed = 0.0
+
+    def line(self):
+        rate = self.deleted / self.elapsed if self.elapsed else 0.0
+        return ("%-14s %6d matched %6d deleted %6d gone %6d failed "
+                "%8.2fs %8.1f/s" % (self.resource, self.matched,
+                                    self.deleted, self.gone,
+                                    len(self.failures), self.elapsed, rate))
+
+
+class SweepReport(object):
+    def __init__(self, tiers, elapsed, dry_run=False):
+        self.tiers = tiers
+        self.elapsed = elapsed
+        self.dry_run = dry_run
+
+    def failures(self):
+        return [(t.resource, id, reason) for t in self.tiers
+                for id, reason in t.failures]
+
+    def lines(self, max_failures=20):
+        lines = [t.line() for t in self.tiers]
+        deleted = sum(t.deleted for t in self.tiers)
+        elapsed = self.elapsed or 1e-9
+        verb = "would delete" if self.dry_run else "deleted"
+        lines.append("%s %d resources in %.2fs: %.1f/s" %
+                     (verb, deleted, self.elapsed, deleted / elapsed))
+        failures = self.failures()
+        for resource, id, reason in failures[:max_failures]:
+            lines.append("FAILED %s %s: %s" % (resource, id, reason))
+        if len(failures) > max_failures:
+            lines.append("... and %d more failures" %
+                         (len(failures) - max_failures))
+        return lines
+
+
+class Sweeper(object):
+    """Finds and deletes resources leaked by earlier runs.
+
+    Networks, subnets and ports match when their name starts with the
+    generator prefix (an empty prefix matches no names). Anything on a
+    matched network matches as well, since the network cannot go while it
+    is in use. With older_than, resources that are too young, or that do
+    not say when they were created, are left alone. Each collection is
+    streamed a page at a time and only the matching ids are kept; they are
+    deleted concurrently once the listing is done, as deleting the last
+    item of a page would pull the marker out from under the next one.
+    """
+
+    def __init__(self, context, service, prefix=None, older_than=None,
+                 workers=16, page_size=None, dry_run=False):
+        self.context = context
+        self.service = service
+        self.prefix = default_prefix() if prefix is None else prefix
+        self.older_than = older_than
+        self.workers = workers
+        self.page_size = page_size
+        self.dry_run = dry_run
+        self.now = time.time()
+        self.networks = set()
+
+    def _old_enough(self, item):
+        if not self.older_than:
+            return True
+        try:
+            created = parse_expires(item.get('created_at'))
+        except exc.ParsingError:
+            return False
+        return created is not None and self.now - created >= self.older_than
+
+    def _matches(self, item):
+        if item.get('network_id') in self.networks:
+            return True
+        name = item.get('name') or ''
+        return (bool(self.prefix) and name.startswith(self.prefix) and
+                self._old_enough(item))
+
+    def _matching_ids(self, resource):
+        # Networks were matched up front; only those are deleted.
+        if resource == 'networks':
+            return sorted(self.networks)
+        # Nothing can match without a matched network or a name to go by.
+        if not self.networks and not (self.prefix and resource in NAMED):
+            return []
+        iterate = getattr(self.service, 'iter_%s' % resource)
+        return [item['id'] for item in
+                iterate(self.context, page_size=self.page_size)
+                if self._matches(item)]
+
+    def _find_networks(self):
+        for item in self.service.iter_networks(self.context,
+                                               page_size=self.page_size):
+            if self._matches(item):
+                self.networks.add(item['id'])
+
+    def _delete(self, delete, id, report, lock):
+        resp = delete(self.context, id)
+        with lock:
+            if resp.success:
+                report.deleted += 1
+            elif resp.status == 404:
+                report.gone += 1
+            else:
+                report.failures.append((id, "%s %s" % (resp.status,
+                                                       resp.raw)))
+
+    def _failed(self, report, lock, id):
+        def done(future):
+            error = future.exception()
+            if error is not None:
+                with lock:
+                    report.failures.append((id, error))
+        return done
+
+    def _sweep_tier(self, resource, method):
+        report = TierReport(resource)
+        delete = getattr(self.service, method)
+        lock = threading.Lock()
+        start = time.time()
+        pool = WorkerPool(self.workers)
+        try:
+            for id in self._matching_ids(resource):
+                report.matched += 1
+                if self.dry_run:
+                    report.deleted += 1
+                    continue
+                future = pool.submit(self._delete, delete, id, report, lock)
+                future.add_done_callback(self._failed(report, lock, id))
+        except exc.ServiceError as e:
+            report.failures.append(('*', e))
+        finally:
+            pool.shutdown()
+        report.elapsed = time.time() - start
+        return report
+
+    def sweep(self):
+        start = time.time()
+        tiers = []
+        try:
+            self._find_networks()
+        except exc.ServiceError as e:
+            report = TierReport('networks')
+            report.failures.append(('*', e))
+            return SweepReport([report], time.time() - start, self.dry_run)
+        for resource, method in TIERS:
+            tiers.append(self._sweep_tier(resource, method))
+        return SweepReport(tiers, time.time() - start, self.dry_run)
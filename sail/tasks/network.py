@@ -14,11 +14,59 @@
 #   limitations under the License.
 #
 
+import sail.exceptions.common as exc
 from sail.tasks import task
+from sail.utils.pool import WorkerPool
+
+
+def _network_args(network):
+    return {'network_id': network['id']}
+
+
+def _subnet_args(subnet):
+    return {'network_id': subnet['network_id'], 'subnet_id': subnet['id']}
+
+
+def _port_args(port):
+    args = {'network_id': port['network_id'], 'port_ids': [port['id']]}
+    fixed_ips = port.get('fixed_ips') or []
+    if fixed_ips:
+        args['subnet_id'] = fixed_ips[0]['subnet_id']
+    return args
+
+
+# Generator arguments that put a resource on what its parent created.
+PARENT_ARGS = {
+    'network': _network_args,
+    'subnet': _subnet_args,
+    'port': _port_args,
+}
+
+
+def _with_parent(kwargs, parent):
+    if parent is not None:
+        kwargs['depends_on'] = list(kwargs.get('depends_on', [])) + [parent]
+    return kwargs
+
+
+def _parent_args(task):
+    """Returns the generator arguments from the task's parent, or None
+    when the parent did not create what the task needs.
+    """
+    if task.parent is None:
+        return {}
+    key = task.parent.artifact_key
+    artifacts = task.context.find_artifacts(key, task.parent)
+    if len(artifacts) <= task.parent_index:
+        task.log_fail("No ['%s'] %d from parent", key, task.parent_index)
+        return None
+    body = artifacts[task.parent_index].body
+    return PARENT_ARGS[key](body.get(key, body))
 
 
 class CreateNetwork(task.NetworkingTask):
     def __init__(self, status=201, **kwargs):
+        kwargs.setdefault('produces', ['network'])
         super(CreateNetwork, self).__init__(status, **kwargs)
         self.net_id = None
         self.artifact_key = 'network'
@@ -26,33 +74,39 @@ class CreateNetwork(task.NetworkingTask):
     def __call__(self, net_info=None):
         if net_info is None:
             net_info = self.context.session.generator.generate('network')
-        resp = self.net.create_network(self.context, net_info)
+        resp = self.net.create_network(self.context, net_info,
+                                       retry=self.retry_policy)
         self.log_debug(resp)
         self.check_response(resp)
         try:
             new_net = resp.body
             self.net_id = new_net['network']['id']
             self.store_artifact(new_net)
+            if self.wait and self.success:
+                self.wait_until_ready('networks', [self.net_id])
             return self
-        except KeyError as e:
+        except (KeyError, TypeError) as e:
             self.log_ignored_exception(e)
 
     def undo(self):
         if self.perform_undo and self.net_id is not None:
             try:
-                resp = self.net.delete_network(self.context, self.net_id)
+                resp = self.net.delete_network(self.context, self.net_id,
+                                               retry=self.retry_policy)
                 self.check_response(resp, 204)
                 self.log_debug(resp)
+            except exc.TimedOut:
+                raise
             except Exception as e:
                 self.log_ignored_exception(e)
 
 
 class GetNetworks(task.NetworkingTask):
-    def __init__(self, status=200):
-        super(GetNetworks, self).__init__(status)
+    def __init__(self, status=200, **kwargs):
+        super(GetNetworks, self).__init__(status, **kwargs)
 
     def __call__(self):
-        resp = self.net.get_networks(self.context)
+        resp = self.net.get_networks(self.context, retry=self.retry_policy)
         self.log_debug(resp)
         self.check_response(resp)
         return self
@@ -60,20 +114,418 @@ class GetNetworks(task.NetworkingTask):
 
 class DeleteNetwork(task.NetworkingTask):
     def __init__(self, status=204, **kwargs):
+        kwargs.setdefault('consumes', ['network'])
         super(DeleteNetwork, self).__init__(status, **kwargs)
         self.net_id = None
         self.artifact_key = 'network'
 
-    def __call__(self, id=None):
+    def __call__(self, id=None, producer=None):
+        if producer is None and len(self.notify_success_list) == 1:
+            producer = self.notify_success_list[0]
         if id is None:
-            net = self.get_artifact(self.artifact_key)
+            net = self.find_artifact(self.artifact_key, producer)
             if net is None:
                 self.log_fail("No id found for delete")
                 return self
-            id = net['network']['id']
-        resp = self.net.delete_network(self.context, id)
+            self.log_retrieve("['%s'] -> %s", self.artifact_key, net)
+            id = net.id
+        resp = self.net.delete_network(self.context, id,
+                                       retry=self.retry_policy)
         self.log_debug(resp)
         self.check_response(resp)
         if self.success:
             self.notify_success("undone")
         return self
+
+
+class BulkCreateTask(task.NetworkingTask):
+    """Creates many resources of one type with list-bodied POSTs.
+
+    Every created resource is stored as its own artifact and deleted
+    individually on undo.
+    """
+    resource = None
+    collection = None
+
+    def __init__(self, status=201, chunk_size=None, parent=None,
+                 parent_index=0, **kwargs):
+        kwargs.setdefault('produces', [self.resource])
+        super(BulkCreateTask, self).__init__(status,
+                                             **_with_parent(kwargs, parent))
+        self.artifact_key = self.resource
+        self.chunk_size = chunk_size
+        self.parent = parent
+        self.parent_index = parent_index
+        self.ids = []
+        self.items = []
+
+    def _create(self, infos):
+        create = getattr(self.net, 'create_%s' % self.collection)
+        return create(self.context, infos, self.chunk_size,
+                      retry=self.retry_policy)
+
+    def _chunks(self, infos):
+        """The infos grouped as _create sends them, one group a response."""
+        size = self.chunk_size or self.net.bulk_chunk_size
+        return [infos[i:i + size] for i in range(0, len(infos), size)]
+
+    def _created(self, resp):
+        return resp.body[self.collection]
+
+    def _delete(self, ids):
+        delete = getattr(self.net, 'delete_%s' % self.collection)
+        return delete(self.context, ids, retry=self.retry_policy)
+
+    def __call__(self, infos=None, count=1, **generate_args):
+        generator = self.context.session.generator
+        generated = []
+        if infos is None:
+            parent_args = _parent_args(self)
+            if parent_args is None:
+                self.success = False
+                return self
+            generate_args.update(parent_args)
+            generated = generator.generate_batch(self.resource, count,
+                                                 **generate_args)
+            infos = generated
+        infos = [i.get(self.resource, i) for i in infos]
+        chunks = self._chunks(generated)
+        # Generated payloads the endpoint made, by identity; each response
+        # lists what it made in the order its chunk was sent.
+        made = set()
+        success = True
+        try:
+            for index, resp in enumerate(self._create(infos)):
+                self.log_debug(resp)
+                self.check_response(resp)
+                success = success and self.success
+                if not self.success:
+                    continue
+                stored = len(self.items)
+                try:
+                    for item in self._created(resp):
+                        self.ids.append(item['id'])
+                        self.items.append(item)
+                        self.store_artifact({self.resource: item})
+                except (KeyError, TypeError) as e:
+                    self.log_ignored_exception(e)
+                if index < len(chunks):
+                    made.update(id(g) for g in
+                                chunks[index][:len(self.items) - stored])
+        finally:
+            generator.created(self.resource, self.items)
+            # Whatever the endpoint did not create goes straight back.
+            generator.release(self.resource,
+                              [g for g in generated if id(g) not in made])
+        self.success = success
+        if self.wait and self.ids:
+            self.wait_until_ready(self.collection, self.ids)
+        return self
+
+    def forget(self, ids):
+        """Drops ids deleted elsewhere from undo; returns how many remain."""
+        kept = [(i, item) for i, item in zip(self.ids, self.items)
+                if i not in ids]
+        self.ids = [i for i, _ in kept]
+        self.items = [item for _, item in kept]
+        return len(self.ids)
+
+    def undo(self):
+        if not self.perform_undo or not self.ids:
+            return
+        generator = self.context.session.generator
+        try:
+            resps = self._delete(self.ids)
+            for resp in resps:
+                self.check_response(resp, 204)
+                self.log_debug(resp)
+            # Only what is really gone goes back to the allocators.
+            generator.release(self.resource,
+                              [item for item, resp in zip(self.items, resps)
+                               if resp.success or resp.status == 404])
+        except exc.TimedOut:
+            raise
+        except Exception as e:
+            self.log_ignored_exception(e)
+
+
+class BulkDeleteTask(task.NetworkingTask):
+    """Deletes many resources of one type concurrently.
+
+    Without explicit ids every stored artifact of the resource is deleted,
+    or only those of the producer (by default the single task notified on
+    success) when there is one. Deleted ids are dropped from the undo of
+    the tasks notified on success.
+    """
+    resource = None
+    collection = None
+
+    def __init__(self, status=204, **kwargs):
+        kwargs.setdefault('consumes', [self.resource])
+        super(BulkDeleteTask, self).__init__(status, **kwargs)
+        self.artifact_key = self.resource
+
+    def _delete(self, ids):
+        delete = getattr(self.net, 'delete_%s' % self.collection)
+        return delete(self.context, ids, retry=self.retry_policy)
+
+    def __call__(self, ids=None, producer=None):
+        if producer is None and len(self.notify_success_list) == 1:
+            producer = self.notify_success_list[0]
+        if ids is None:
+            artifacts = self.context.find_artifacts(self.artifact_key,
+                                                    producer)
+            if not artifacts:
+                self.log_fail("No ids found for delete")
+                return self
+            ids = [a.id for a in artifacts]
+        deleted = set()
+        success = True
+        for id, resp in zip(ids, self._delete(ids)):
+            self.log_debug(resp)
+            self.check_response(resp)
+            success = success and self.success
+            if self.success:
+                deleted.add(id)
+        self.success = success
+        for target in self.notify_success_list:
+            forget = getattr(target, 'forget', None)
+            if forget is None:
+                if self.success:
+                    target.notify("undone")
+            # A producer only skips undo once none of its ids are left.
+            elif deleted and not forget(deleted):
+                target.notify("undone")
+        return self
+
+
+class BulkCreateNetworks(BulkCreateTask):
+    resource = 'network'
+    collection = 'networks'
+
+
+class BulkDeleteNetworks(BulkDeleteTask):
+    resource = 'network'
+    collection = 'networks'
+
+
+class BulkCreateSubnets(BulkCreateTask):
+    resource = 'subnet'
+    collection = 'subnets'
+
+
+class BulkDeleteSubnets(BulkDeleteTask):
+    resource = 'subnet'
+    collection = 'subnets'
+
+
+class BulkCreatePorts(BulkCreateTask):
+    resource = 'port'
+    collection = 'ports'
+
+
+class BulkDeletePorts(BulkDeleteTask):
+    resource = 'port'
+    collection = 'ports'
+
+
+class CreateTask(task.NetworkingTask):
+    """Creates one resource and deletes it on undo.
+
+    With a parent task, the resource is made on the parent_index-th
+    resource the parent created.
+    """
+    resource = None
+    collection = None
+    create_method = None
+    delete_method = None
+
+    def __init__(self, status=201, parent=None, parent_index=0, **kwargs):
+        kwargs.setdefault('produces', [self.resource])
+        super(CreateTask, self).__init__(status,
+                                         **_with_parent(kwargs, parent))
+        self.artifact_key = self.resource
+        self.parent = parent
+        self.parent_index = parent_index
+        self.id = None
+        self.item = None
+
+    def __call__(self, info=None, **generate_args):
+        generator = self.context.session.generator
+        generated = None
+        if info is None:
+            parent_args = _parent_args(self)
+            if parent_args is None:
+                self.success = False
+                return self
+            generate_args.update(parent_args)
+            info = generated = generator.generate(self.resource,
+                                                  **generate_args)
+        resp = getattr(self.net, self.create_method)(self.context, info,
+                                                     retry=self.retry_policy)
+        self.log_debug(resp)
+        self.check_response(resp)
+        try:
+            if self.success:
+                self.item = resp.body[self.resource]
+                self.id = self.item['id']
+                self.store_artifact(resp.body)
+                generator.created(self.resource, [self.item])
+        except (KeyError, TypeError) as e:
+            self.log_ignored_exception(e)
+        if self.item is None and generated is not None:
+            generator.release(self.resource, [generated])
+        if self.wait and self.id is not None:
+            self.wait_until_ready(self.collection, [self.id])
+        return self
+
+    def undo(self):
+        if self.perform_undo and self.id is not None:
+            try:
+                resp = getattr(self.net, self.delete_method)(
+                    self.context, self.id, retry=self.retry_policy)
+                self.check_response(resp, 204)
+                self.log_debug(resp)
+                if resp.success or resp.status == 404:
+                    self.context.session.generator.release(self.resource,
+                                                           [self.item])
+            except exc.TimedOut:
+                raise
+            except Exception as e:
+                self.log_ignored_exception(e)
+
+
+class ListTask(task.NetworkingTask):
+    list_method = None
+
+    def __init__(self, status=200, **kwargs):
+        super(ListTask, self).__init__(status, **kwargs)
+
+    def __call__(self, **filters):
+        resp = getattr(self.net, self.list_method)(self.context,
+                                                   retry=self.retry_policy,
+                                                   **filters)
+        self.log_debug(resp)
+        self.check_response(resp)
+        return self
+
+
+class DeleteTask(task.NetworkingTask):
+    resource = None
+    delete_method = None
+
+    def __init__(self, status=204, **kwargs):
+        kwargs.setdefault('consumes', [self.resource])
+        super(DeleteTask, self).__init__(status, **kwargs)
+        self.artifact_key = self.resource
+
+    def __call__(self, id=None, producer=None):
+        if producer is None and len(self.notify_success_list) == 1:
+            producer = self.notify_success_list[0]
+        if id is None:
+            artifact = self.find_artifact(self.artifact_key, producer)
+            if artifact is None:
+                self.log_fail("No id found for delete")
+                return self
+            self.log_retrieve("['%s'] -> %s", self.artifact_key, artifact)
+            id = artifact.id
+        resp = getattr(self.net, self.delete_method)(self.context, id,
+                                                     retry=self.retry_policy)
+        self.log_debug(resp)
+        self.check_response(resp)
+        if self.success:
+            self.notify_success("undone")
+        return self
+
+
+class _SingleCalls(object):
+    """For resources the service only creates and deletes one at a time.
+
+    The bulk tasks send the single calls concurrently instead.
+    """
+    create_method = None
+    delete_method = None
+
+    def _map(self, fn, items):
+        if not items:
+            return []
+        with WorkerPool(min(len(items), self.net.bulk_workers)) as pool:
+            return pool.map(fn, items)
+
+    def _create(self, infos):
+        create = getattr(self.net, self.create_method)
+        return self._map(lambda info: create(self.context,
+                                             {self.resource: info},
+                                             retry=self.retry_policy), infos)
+
+    def _chunks(self, infos):
+        return [[info] for info in infos]
+
+    def _created(self, resp):
+        return [resp.body[self.resource]]
+
+    def _delete(self, ids):
+        delete = getattr(self.net, self.delete_method)
+        return self._map(lambda id: delete(self.context, id,
+                                           retry=self.retry_policy), ids)
+
+
+class CreateSubnet(CreateTask):
+    resource = 'subnet'
+    collection = 'subnets'
+    create_method = 'create_subnet'
+    delete_method = 'delete_subnet'
+
+
+class GetSubnets(ListTask):
+    list_method = 'get_subnets'
+
+
+class DeleteSubnet(DeleteTask):
+    resource = 'subnet'
+    delete_method = 'delete_subnet'
+
+
+class CreatePort(CreateTask):
+    resource = 'port'
+    collection = 'ports'
+    create_method = 'create_port'
+    delete_method = 'delete_port'
+
+
+class GetPorts(ListTask):
+    list_method = 'get_ports'
+
+
+class DeletePort(DeleteTask):
+    resource = 'port'
+    delete_method = 'delete_port'
+
+
+class CreateIPAddress(CreateTask):
+    resource = 'ip_address'
+    collection = 'ip_addresses'
+    create_method = 'create_ip_addresses'
+    delete_method = 'delete_ip_addresses'
+
+
+class GetIPAddresses(ListTask):
+    list_method = 'get_ip_addresses'
+
+
+class DeleteIPAddress(DeleteTask):
+    resource = 'ip_address'
+    delete_method = 'delete_ip_addresses'
+
+
+class BulkCreateIPAddresses(_SingleCalls, BulkCreateTask):
+    resource = 'ip_address'
+    collection = 'ip_addresses'
+    create_method = 'create_ip_addresses'
+    delete_method = 'delete_ip_addresses'
+
+
+class BulkDeleteIPAddresses(_SingleCalls, BulkDeleteTask):
+    resource = 'ip_address'
+    collection = 'ip_addresses'
+    delete_method = 'delete_ip_addresses'
@@ -0,0 +1,164 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from sail.context import current_context
+import sail.exceptions.common as exc
+from sail.utils.deadline import Deadline
+from sail.utils.pool import WorkerPool
+
+
+class Scheduler(object):
+    """Runs tasks concurrently while honouring their dependencies.
+
+    A task depends on every scheduled task that produces an artifact key it
+    consumes, on the tasks it notifies on success and on anything listed in
+    its depends_on. Independent tasks run side by side on a bounded pool.
+
+    When the budget (the current context's unless one is given) runs out,
+    nothing more is started and what never started is cancelled. Calls
+    made under the budget never wait past it, so tasks still running stop
+    straight away and are counted as timed out.
+    """
+
+    def __init__(self, workers=8, budget=None):
+        self.workers = workers
+        self.budget = budget
+        self.entries = []
+        self.calls = {}
+        self.completed = []
+        self.failed = []
+        self.skipped = []
+        self.timed_out = []
+        self.cancelled = []
+
+    def add(self, task, *args, **kwargs):
+        self.entries.append(task)
+        self.calls[task] = (args, kwargs)
+        return task
+
+    def dependencies(self, task):
+        return task.dependencies_in(self.entries)
+
+    def stages(self):
+        """Groups the scheduled tasks into levels that can run together."""
+        remaining = dict((t, set(self.dependencies(t))) for t in self.entries)
+        stages = []
+        while remaining:
+            ready = [t for t in self.entries
+                     if t in remaining and not remaining[t]]
+            if not ready:
+                names = ", ".join(t.__class__.__name__ for t in remaining)
+                raise exc.DependencyCycle("Task dependency cycle: %s" % names)
+            for task in ready:
+                del remaining[task]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+            stages.append(ready)
+        return stages
+
+    def _run_task(self, task):
+        args, kwargs = self.calls[task]
+        task.run(*args, **kwargs)
+
+    def _budget(self):
+        if self.budget is not None:
+            return self.budget
+        context = current_context()
+        return context.budget if context is not None else Deadline()
+
+    def run(self):
+        self.stages()
+        waiting = dict((t, set(self.dependencies(t))) for t in self.entries)
+        dependents = dict((t, []) for t in self.entries)
+        for task, deps in waiting.items():
+            for dep in deps:
+                dependents[dep].append(task)
+
+        budget = self._budget()
+        finished = queue.Queue()
+        first_error = None
+        outstanding = 0
+        pool = WorkerPool(self.workers)
+        try:
+            ready = [t for t in self.entries if not waiting[t]]
+            while ready or outstanding:
+                if budget.expired():
+                    self._cancel(waiting)
+                    ready = []
+                for task in ready:
+                    del waiting[task]
+                    future = pool.submit(self._run_task, task)
+                    future.add_done_callback(
+                        lambda f, task=task: finished.put((task, f)))
+                    outstanding += 1
+                ready = []
+                if not outstanding:
+                    break
+                try:
+                    # Once out of time only running tasks are waited for.
+                    task, future = finished.get(
+                        timeout=budget.remaining() or None)
+                except queue.Empty:
+                    continue
+                outstanding -= 1
+                error = future.exception()
+                if error is None and task.was_successful():
+                    self.completed.append(task)
+                    for child in dependents[task]:
+                        if child not in waiting:
+                            continue
+                        waiting[child].discard(task)
+                        if not waiting[child]:
+                            ready.append(child)
+                    continue
+                if error is not None:
+                    task.log_ignored_exception(error)
+                    if first_error is None:
+                        first_error = error
+                if task.timed_out:
+                    self.timed_out.append(task)
+                else:
+                    self.failed.append(task)
+                self._skip_dependents(task, dependents, waiting)
+        finally:
+            pool.shutdown()
+        if first_error is not None:
+            raise first_error
+        return self
+
+    def _cancel(self, waiting):
+        for task in self.entries:
+            if task not in waiting:
+                continue
+            del waiting[task]
+            task.success = False
+            task.log_fail("Cancelled, the run is out of time")
+            self.cancelled.append(task)
+
+    def _skip_dependents(self, task, dependents, waiting):
+        for child in dependents[task]:
+            if child not in waiting:
+                continue
+            del waiting[child]
+            child.success = False
+            child.log_fail("Skipped, %s did not succeed",
+                           task.__class__.__name__)
+            self.skipped.append(child)
+            self._skip_dependents(child, dependents, waiting)
@@ -13,22 +13,63 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 #
+from sail.context import current_context
+import sail.exceptions.common as exc
+from sail import log
+
 
 class Task(object):
-    context = None
     def __init__(self, **kwargs):
         self.output = "" 
         self.success = True
         self.perform_undo = True
-        self.context = Task.context
+        self.context = kwargs.get('context') or current_context()
+        if self.context is None:
+            raise exc.FatalException("%s created outside of a context" %
+                                     self.__class__.__name__)
         self.context.register(self)
         self.logs = []
         self.artifact_key = 'unnamed'
         self.notify_success_list = kwargs.get('notify_success', [])
+        self.depends_on = kwargs.get('depends_on', [])
+        self.produces = kwargs.get('produces', [])
+        self.consumes = kwargs.get('consumes', [])
+        self.deadline = kwargs.get('deadline')
+        self.timed_out = False
 
     def undo(self):
         pass
 
+    def run(self, *args, **kwargs):
+        """Calls the task under its deadline.
+
+        deadline is in seconds (the context's task_deadline if unset) and
+        never outlasts the run's budget. Running out of time fails the
+        task and marks it timed_out rather than raising.
+        """
+        with self.context.deadline(self.deadline):
+            try:
+                return self(*args, **kwargs)
+            except exc.TimedOut as e:
+                self.success = False
+                self.timed_out = True
+                self.log_timeout("%s", e)
+
+    def dependencies_in(self, tasks):
+        """Returns the tasks in the given list this task has to follow."""
+        candidates = set(tasks)
+        deps = []
+        for dep in self.depends_on + self.notify_success_list:
+            if dep in candidates and dep is not self and dep not in deps:
+                deps.append(dep)
+        for key in self.consumes:
+            for other in tasks:
+                if other is self or other in deps:
+                    continue
+                if key in other.produces:
+                    deps.append(other)
+        return deps
+
     def was_successful(self):
         return self.success
 
@@ -41,56 +82,106 @@ class Task(object):
             self.perform_undo = False
 
     def store_artifact(self, artifact):
-        self.log_store("['%s'] <- %s" % (self.artifact_key, artifact))
-        self.context.add_artifact(self.artifact_key, artifact)
-
-    def get_artifact(self, artifact):
-        artifacts = self.context.get_artifacts(artifact)
-        if artifacts is None:
-            self.log_fail("No artifact named ['%s']" % artifact)
+        self.log_store("['%s'] <- %s", self.artifact_key, artifact)
+        return self.context.add_artifact(self.artifact_key, artifact, self)
+
+    def find_artifact(self, artifact, producer=None):
+        """Returns the single Artifact record stored under a key.
+
+        Passing the producing task narrows the lookup to what that task
+        stored, which keeps it unambiguous when many tasks share a key.
+        """
+        artifacts = self.context.find_artifacts(artifact, producer)
+        if not artifacts:
+            self.log_fail("No artifact named ['%s']", artifact)
             return None
         if len(artifacts) > 1:
-            self.log_fail("Ambiguous retrieve for artifact ['%s']" % artifact)
+            self.log_fail("Ambiguous retrieve for artifact ['%s']", artifact)
+            return None
+        return artifacts[0]
+
+    def get_artifact(self, artifact, producer=None):
+        a = self.find_artifact(artifact, producer)
+        if a is None:
             return None
-        a = artifacts[0]
-        self.log_retrieve("['%s'] -> %s" % (artifact, a))
+        a = a.body
+        self.log_retrieve("['%s'] -> %s", artifact, a)
         return a
 
-    def log(self, msg):
-        self.context.log("%s]%s" % (self.__class__.__name__, msg))
+    def _emit(self, level, tag, msg, args):
+        # Formatting is left to the logger, which skips it entirely for
+        # records below its level.
+        if not args:
+            msg, args = "%s", (msg,)
+        self.context.emit(level, self.__class__.__name__, tag, msg, *args)
+
+    def log(self, msg, *args):
+        self._emit(log.INFO, None, msg, args)
+
+    def log_debug(self, msg, *args):
+        self._emit(log.DEBUG, "DEBUG", msg, args)
+
+    def log_ignored_exception(self, msg, *args):
+        self._emit(log.WARNING, "EXCEPT(ignored)", msg, args)
 
-    def log_debug(self, msg):
-        self.log("DEBUG: %s" % (msg))
+    def log_fail(self, msg, *args):
+        self._emit(log.ERROR, "FAIL", msg, args)
 
-    def log_ignored_exception(self, msg):
-        self.log("EXCEPT(ignored): %s" % msg)
+    def log_store(self, msg, *args):
+        self._emit(log.DEBUG, "STORE", msg, args)
 
-    def log_fail(self, msg):
-        self.log("FAIL: %s" % msg)
+    def log_retrieve(self, msg, *args):
+        self._emit(log.DEBUG, "RETRIEVE", msg, args)
 
-    def log_store(self, msg):
-        self.log("STORE: %s" % msg)
+    def log_retry(self, msg, *args):
+        self._emit(log.INFO, "RETRY", msg, args)
 
-    def log_retrieve(self, msg):
-        self.log("RETRIEVE: %s" % msg)
+    def log_timeout(self, msg, *args):
+        self._emit(log.ERROR, "TIMEOUT", msg, args)
 
 
 class RestfulTask(Task):
-    def __init__(self, status, **kwargs):
+    def __init__(self, status, retry=None, **kwargs):
         super(RestfulTask, self).__init__(**kwargs)
         self.expected_status = status
+        self.retry_policy = retry
 
     def check_response(self, service_response, override=None):
+        if service_response.stats.retries:
+            self.log_retry("%d retries before %s",
+                           service_response.stats.retries,
+                           service_response.status)
         srv_status = service_response.status
         check = self.expected_status if override is None else override
         self.success = check == srv_status
         if not self.success:
-            self.log_fail("Status mismatch. %s != %s" %
-                          (check, service_response.status))
+            self.log_fail("Status mismatch. %s != %s", check,
+                          service_response.status)
         return service_response
 
 
 class NetworkingTask(RestfulTask):
-    def __init__(self, status, **kwargs):
+    def __init__(self, status, wait=False, wait_timeout=None, **kwargs):
         super(NetworkingTask, self).__init__(status, **kwargs)
         self.net = self.context.request_service('network')
+        self.wait = wait
+        self.wait_timeout = wait_timeout
+
+    def wait_until_ready(self, collection, ids):
+        """Waits for created resources to become usable.
+
+        The task fails when any of them goes to an error status or is not
+        ready by its wait_timeout (the service's wait_timeout if unset).
+        """
+        result = self.net._wait_ready(self.context, collection, ids,
+                                      self.wait_timeout)
+        for id, status in sorted(result.failed.items()):
+            self.log_fail("%s %s went %s", collection, id, status)
+        if result.timed_out:
+            self.timed_out = True
+            self.log_timeout("%d %s not ready in time: %s",
+                             len(result.timed_out), collection,
+                             ", ".join(result.timed_out))
+        if not result.success:
+            self.success = False
+        return result
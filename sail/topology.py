@@ -0,0 +1,100 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import re
+
+import sail.exceptions.common as exc
+import sail.tasks.network as net
+from sail.tasks.scheduler import Scheduler
+
+
+# Each level is made on the resources of the one before it.
+LEVELS = (
+    ('network', net.BulkCreateNetworks),
+    ('subnet', net.BulkCreateSubnets),
+    ('port', net.BulkCreatePorts),
+    ('ip_address', net.BulkCreateIPAddresses),
+)
+
+
+def parse_shape(shape):
+    """Parses a shape such as '10x4x8' into [10, 4, 8].
+
+    The numbers are networks, subnets per network, ports per subnet and IP
+    addresses per port; trailing levels can be left out.
+    """
+    try:
+        counts = [int(c) for c in re.split(r'\s*[xX*]\s*', shape.strip())]
+    except (AttributeError, ValueError):
+        raise exc.ParsingError("Invalid topology shape %s" % shape)
+    if not 1 <= len(counts) <= len(LEVELS) or min(counts) < 1:
+        raise exc.ParsingError("Topology shape %s needs 1 to %d positive "
+                               "counts" % (shape, len(LEVELS)))
+    return counts
+
+
+class Topology(object):
+    """Builds networks, then subnets on each, then ports on each subnet.
+
+    Every parent resource gets one bulk create task for its children, which
+    depends on the task that made the parent and reads the parent's id from
+    its artifacts when it runs. The scheduler starts children as soon as
+    their parent is done, so each level fans out concurrently, and undo
+    runs the other way round: children go before the parents they sit on.
+    """
+
+    def __init__(self, shape, chunk_size=None, workers=8, wait=None):
+        self.counts = parse_shape(shape) if not isinstance(
+            shape, (list, tuple)) else list(shape)
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.wait = wait
+        self.levels = []
+
+    def totals(self):
+        """Resources made per level, and the create tasks for each."""
+        totals = []
+        parents = 1
+        for (resource, _), count in zip(LEVELS, self.counts):
+            totals.append((resource, parents * count, parents))
+            parents *= count
+        return totals
+
+    def lines(self):
+        lines = ["topology %s" % "x".join(str(c) for c in self.counts)]
+        for resource, total, tasks in self.totals():
+            lines.append("  %-12s %8d in %6d tasks" % (resource, total, tasks))
+        return lines
+
+    def schedule(self, scheduler):
+        """Builds the tasks of every level in the current context."""
+        self.levels = []
+        parents = [(None, 0)]
+        for (resource, task_class), count in zip(LEVELS, self.counts):
+            level = []
+            for parent, index in parents:
+                task = task_class(chunk_size=self.chunk_size, parent=parent,
+                                  parent_index=index, wait=bool(self.wait),
+                                  wait_timeout=self.wait)
+                scheduler.add(task, count=count)
+                level.append(task)
+            self.levels.append(level)
+            parents = [(task, i) for task in level for i in range(count)]
+        return self.levels
+
+    def run(self, workers=None):
+        scheduler = Scheduler(workers=workers or self.workers)
+        self.schedule(scheduler)
+        return scheduler.run()
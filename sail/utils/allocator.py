@@ -0,0 +1,216 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import heapq
+import socket
+import struct
+import threading
+
+import sail.exceptions.common as exc
+
+
+def parse_address(address):
+    """Returns (ip_version, integer value) of an IPv4 or IPv6 address."""
+    address = address.strip()
+    try:
+        if ':' in address:
+            high, low = struct.unpack('!QQ', socket.inet_pton(
+                socket.AF_INET6, address))
+            return 6, (high << 64) | low
+        return 4, struct.unpack('!I', socket.inet_pton(socket.AF_INET,
+                                                       address))[0]
+    except (socket.error, ValueError, struct.error):
+        raise exc.DataFormatError("Invalid IP address %s" % address)
+
+
+def format_address(version, value):
+    if version == 6:
+        return socket.inet_ntop(socket.AF_INET6, struct.pack(
+            '!QQ', value >> 64, value & (2 ** 64 - 1)))
+    return socket.inet_ntop(socket.AF_INET, struct.pack('!I', value))
+
+
+def parse_cidr(cidr):
+    """Returns (ip_version, network value, prefix length) of a CIDR."""
+    try:
+        address, prefixlen = cidr.split('/')
+        prefixlen = int(prefixlen)
+    except (AttributeError, ValueError):
+        raise exc.DataFormatError("Invalid CIDR %s" % cidr)
+    version, value = parse_address(address)
+    bits = 32 if version == 4 else 128
+    if not 0 <= prefixlen <= bits:
+        raise exc.DataFormatError("Invalid prefix length in %s" % cidr)
+    host_bits = bits - prefixlen
+    return version, value >> host_bits << host_bits, prefixlen
+
+
+class IndexAllocator(object):
+    """Hands out the integers 0..size-1, lowest free first.
+
+    A bitmap records what is taken. It only grows up to the highest index
+    handed out so far, so a huge range costs nothing until it is used.
+    Released indexes go on a heap and are handed out again before fresh
+    ones.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.bitmap = bytearray()
+        self.fresh = 0
+        self.released = []
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def _taken(self, index):
+        byte = index >> 3
+        return (byte < len(self.bitmap) and
+                self.bitmap[byte] & (1 << (index & 7)))
+
+    def _take(self, index):
+        byte = index >> 3
+        if byte >= len(self.bitmap):
+            self.bitmap.extend(bytearray(byte + 1 - len(self.bitmap)))
+        self.bitmap[byte] |= 1 << (index & 7)
+
+    def allocate(self, count=1):
+        with self.lock:
+            if count > self.size - self.used:
+                raise exc.ResourceExhausted(
+                    "Cannot allocate %d of %d, %d are in use" %
+                    (count, self.size, self.used))
+            indexes = []
+            while len(indexes) < count:
+                if self.released:
+                    index = heapq.heappop(self.released)
+                else:
+                    index = self.fresh
+                    self.fresh += 1
+                self._take(index)
+                indexes.append(index)
+            self.used += count
+            return indexes
+
+    def release(self, indexes):
+        with self.lock:
+            for index in indexes:
+                if not 0 <= index < self.size or not self._taken(index):
+                    continue
+                self.bitmap[index >> 3] &= ~(1 << (index & 7)) & 0xff
+                heapq.heappush(self.released, index)
+                self.used -= 1
+
+
+class CidrAllocator(object):
+    """Non-overlapping blocks of one prefix length carved out of a
+    supernet.
+    """
+
+    def __init__(self, supernet, prefixlen):
+        self.version, self.base, self.superlen = parse_cidr(supernet)
+        self.bits = 32 if self.version == 4 else 128
+        if not self.superlen <= prefixlen <= self.bits:
+            raise exc.DataFormatError("Cannot carve /%d blocks out of %s" %
+                                      (prefixlen, supernet))
+        self.prefixlen = prefixlen
+        self.shift = self.bits - prefixlen
+        self.blocks = IndexAllocator(2 ** (prefixlen - self.superlen))
+
+    def _cidr(self, index):
+        return "%s/%d" % (format_address(self.version,
+                                         self.base + (index << self.shift)),
+                          self.prefixlen)
+
+    def _index(self, cidr):
+        version, value, prefixlen = parse_cidr(cidr)
+        if version != self.version or prefixlen != self.prefixlen:
+            return None
+        index = (value - self.base) >> self.shift
+        if not 0 <= index < self.blocks.size:
+            return None
+        return index
+
+    def allocate(self, count=1):
+        return [self._cidr(i) for i in self.blocks.allocate(count)]
+
+    def release(self, cidrs):
+        indexes = [self._index(c) for c in cidrs]
+        self.blocks.release([i for i in indexes if i is not None])
+
+
+class AddressPool(object):
+    """Host addresses of one subnet.
+
+    For IPv4 the network and broadcast addresses are never handed out, and
+    neither is the first host, which is left for the gateway.
+    """
+
+    def __init__(self, cidr):
+        self.cidr = cidr
+        self.version, self.base, prefixlen = parse_cidr(cidr)
+        bits = 32 if self.version == 4 else 128
+        size = 2 ** (bits - prefixlen)
+        # Network address and gateway, and broadcast for IPv4.
+        self.first = 2 if size > 2 else 0
+        reserved = self.first + (1 if self.version == 4 and size > 2 else 0)
+        self.hosts = IndexAllocator(size - reserved)
+
+    def allocate(self, count=1):
+        return [format_address(self.version, self.base + self.first + i)
+                for i in self.hosts.allocate(count)]
+
+    def release(self, addresses):
+        indexes = []
+        for address in addresses:
+            version, value = parse_address(address)
+            index = value - self.base - self.first
+            if version == self.version and 0 <= index < self.hosts.size:
+                indexes.append(index)
+        self.hosts.release(indexes)
+
+
+class AddressPools(object):
+    """The address pools of the subnets generators know about, by id."""
+
+    def __init__(self):
+        self.pools = {}
+        self.lock = threading.Lock()
+
+    def add_subnet(self, subnet_id, cidr):
+        with self.lock:
+            if subnet_id not in self.pools:
+                self.pools[subnet_id] = AddressPool(cidr)
+            return self.pools[subnet_id]
+
+    def remove_subnet(self, subnet_id):
+        with self.lock:
+            self.pools.pop(subnet_id, None)
+
+    def __contains__(self, subnet_id):
+        return subnet_id in self.pools
+
+    def allocate(self, subnet_id, count=1):
+        with self.lock:
+            pool = self.pools.get(subnet_id)
+        if pool is None:
+            raise exc.MissingRequiredInformation("Unknown subnet %s" %
+                                                 subnet_id)
+        return pool.allocate(count)
+
+    def release(self, subnet_id, addresses):
+        with self.lock:
+            pool = self.pools.get(subnet_id)
+        if pool is not None:
+            pool.release(addresses)
@@ -13,10 +13,23 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 #
-import requests
+import calendar
+import hashlib
 import json
+import os
+import re
+import tempfile
+import threading
+import time
 
 import sail.exceptions.common as exc
+import sail.utils.conf as conf_util
+from sail.utils.registry import load_object
+
+
+DEFAULT_TOKEN_CACHE = os.path.join('~', '.sail', 'token_cache.json')
+EXPIRES_RE = re.compile(r'^(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)'
+                        r'(?:\.\d+)?(Z|[+-]\d\d:?\d\d)?$')
 
 
 class RackspaceAuth(object):
@@ -36,23 +49,150 @@ class RackspaceAuth(object):
 
 
 def _load_auth_method_class(name):
-    components = name.split('.')
-    mod = __import__(components[0])
-    for comp in components[1:]:
-        mod = getattr(mod, comp)
-    return mod
+    return load_object(name)
+
+
+def parse_expires(expires):
+    """Converts an identity 'expires' timestamp to epoch seconds."""
+    if not expires:
+        return None
+    match = EXPIRES_RE.match(expires)
+    if match is None:
+        raise exc.ParsingError("Could not parse token expiry %s" % expires)
+    fields = [int(f) for f in match.groups()[:6]]
+    seconds = calendar.timegm(fields + [0, 0, 0])
+    zone = match.group(7)
+    if zone and zone != 'Z':
+        sign = -1 if zone[0] == '-' else 1
+        zone = zone[1:].replace(':', '')
+        seconds -= sign * (int(zone[:2]) * 3600 + int(zone[2:]) * 60)
+    return seconds
 
 
 class AuthResponse(object):
-    def __init__(self, json_resp):
+    def __init__(self, json_resp, refresher=None, refresh_margin=300):
+        self.refresher = refresher
+        self.refresh_margin = refresh_margin
+        self.lock = threading.Lock()
+        self._load(json_resp)
+
+    def _load(self, json_resp):
         self.access = json_resp['access']
         self.raw = json_resp
         self.token = self.access['token']['id']
         self.catalog = self.access['serviceCatalog']
         self.tenant_id = self.access['token']['tenant']['id']
+        self.expires = parse_expires(self.access['token'].get('expires'))
+
+    def expires_soon(self, margin=None):
+        if self.expires is None:
+            return False
+        if margin is None:
+            margin = self.refresh_margin
+        return self.expires - margin <= time.time()
+
+    def refresh(self, stale_token=None):
+        """Re-authenticates in place so every holder sees the new token.
+
+        When stale_token is given and another caller already replaced it,
+        the refresh is skipped.
+        """
+        if self.refresher is None:
+            return False
+        with self.lock:
+            if stale_token is not None and stale_token != self.token:
+                return True
+            self._load(self.refresher().raw)
+        return True
+
+    def valid_token(self):
+        if self.expires_soon():
+            self.refresh(self.token)
+        return self.token
+
+
+class TokenCache(object):
+    """Keeps identity responses on disk until shortly before they expire."""
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(endpoint, username, auth_method):
+        ident = "%s|%s|%s" % (endpoint, username, auth_method)
+        return hashlib.sha1(ident.encode('utf-8')).hexdigest()
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def get(self, key, margin):
+        raw = self._read().get(key)
+        if raw is None:
+            return None
+        try:
+            resp = AuthResponse(raw, refresh_margin=margin)
+        except (KeyError, exc.ParsingError):
+            return None
+        if resp.expires is None or resp.expires_soon():
+            return None
+        return resp
+
+    def store(self, key, resp):
+        with self.lock:
+            entries = self._read()
+            now = time.time()
+            for k in list(entries):
+                try:
+                    expires = entries[k]['access']['token'].get('expires')
+                    if parse_expires(expires) <= now:
+                        del entries[k]
+                except (KeyError, TypeError, exc.ParsingError):
+                    del entries[k]
+            entries[key] = resp.raw
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory, 0o700)
+            fd, tmp = tempfile.mkstemp(dir=directory or None)
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(entries, f)
+                os.chmod(tmp, 0o600)
+                os.rename(tmp, self.path)
+            except (IOError, OSError):
+                if os.path.exists(tmp):
+                    os.unlink(tmp)
+                raise
+
+
+def _authenticate(auth_endpoint, auth, auth_method, recorder=None):
+    # requests is only needed once there is something to send, which keeps
+    # it out of runs that stop at config validation.
+    import requests
+    headers = {'Content-Type': auth.get('content_type', 'application/json')}
+    hooks = recorder.hooks() if recorder is not None else None
+    timeout = (conf_util.get_float(auth, 'connect_timeout', 10.0),
+               conf_util.get_float(auth, 'read_timeout', 60.0))
+    try:
+        r = requests.post(auth_endpoint, headers=headers,
+                          data=str(auth_method), hooks=hooks, timeout=timeout)
+    except requests.Timeout as e:
+        raise exc.TimedOut("Authentication timed out: %s" % e)
+    try:
+        json_resp = json.loads(r.text)
+    except ValueError as e:
+        raise exc.ParsingError(e)
+    try:
+        return AuthResponse(json_resp)
+    except KeyError as e:
+        raise exc.ParsingError(e)
 
 
-def do_auth(ctx, conf):
+def do_auth(ctx, conf, recorder=None):
     if conf is None:
         raise exc.MissingRequiredInformation("Missing configuration")
     if 'auth' not in conf:
@@ -65,17 +205,32 @@ def do_auth(ctx, conf):
         raise exc.MissingRequiredInformation("Missing auth_method in conf")
     try:
         auth_method = _load_auth_method_class(auth['auth_method'])(auth)
-    except AttributeError as e:
+    except (AttributeError, ImportError) as e:
         msg = "Could not load auth_method. %s"
         raise exc.MissingRequiredInformation(msg % e)
-    
-    headers = {'Content-Type': auth.get('content_type', 'application/json')}
-    r = requests.post(auth_endpoint, headers=headers, data=str(auth_method))
-    try:
-        json_resp = json.loads(r.text)
-    except ValueError as e:
-        raise exc.ParsingError(e)
-    try:
-        return AuthResponse(json_resp)
-    except KeyError as e:
-        raise exc.ParsingError(e)
+
+    margin = conf_util.get_int(auth, 'token_refresh_margin', 300)
+    cache = None
+    if conf_util.get_bool(auth, 'cache_token', True):
+        cache = TokenCache(auth.get('token_cache', DEFAULT_TOKEN_CACHE))
+        cache_key = TokenCache.key(auth_endpoint,
+                                   getattr(auth_method, 'username', ''),
+                                   auth['auth_method'])
+
+    def refresher():
+        resp = _authenticate(auth_endpoint, auth, auth_method, recorder)
+        if cache is not None:
+            try:
+                cache.store(cache_key, resp)
+            except (IOError, OSError):
+                pass
+        return resp
+
+    resp = None
+    if cache is not None:
+        resp = cache.get(cache_key, margin)
+    if resp is None:
+        resp = refresher()
+    resp.refresher = refresher
+    resp.refresh_margin = margin
+    return resp
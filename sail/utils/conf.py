@@ -0,0 +1,65 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import sail.exceptions.common as exc
+
+
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+FALSE_VALUES = ('0', 'false', 'no', 'off')
+
+
+def get_bool(conf, key, default):
+    if conf is None or key not in conf:
+        return default
+    value = conf[key]
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise exc.DataFormatError("Expected boolean for %s in conf, got %s" %
+                              (key, conf[key]))
+
+
+def get_int(conf, key, default):
+    if conf is None or key not in conf:
+        return default
+    try:
+        return int(conf[key])
+    except (TypeError, ValueError):
+        raise exc.DataFormatError("Expected integer for %s in conf, got %s" %
+                                  (key, conf[key]))
+
+
+def get_float(conf, key, default):
+    if conf is None or key not in conf:
+        return default
+    try:
+        return float(conf[key])
+    except (TypeError, ValueError):
+        raise exc.DataFormatError("Expected number for %s in conf, got %s" %
+                                  (key, conf[key]))
+
+
+def get_list(conf, key, default):
+    """Comma separated values, or the list configobj already made."""
+    if conf is None or key not in conf:
+        return default
+    value = conf[key]
+    if isinstance(value, (list, tuple)):
+        return [str(v).strip() for v in value]
+    return [v.strip() for v in str(value).split(',') if v.strip()]
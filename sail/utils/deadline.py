@@ -0,0 +1,88 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import threading
+import time
+
+
+_local = threading.local()
+
+
+def current():
+    """Returns the deadline the calling thread works under, if any."""
+    return getattr(_local, 'deadline', None)
+
+
+def set_current(deadline):
+    _local.deadline = deadline
+
+
+class Deadline(object):
+    """A point in time by which some work has to be done.
+
+    seconds of None never runs out on its own. A deadline made with a
+    parent runs out when the parent does, and cancelling one runs it and
+    every deadline under it out straight away. Entering one makes it the
+    calling thread's current deadline until the block ends.
+    """
+
+    def __init__(self, seconds=None, parent=None):
+        self.seconds = seconds
+        self.expires = None
+        if seconds is not None:
+            self.expires = time.time() + seconds
+        self.parent = parent
+        self.cancelled = False
+
+    def child(self, seconds=None):
+        return Deadline(seconds, parent=self)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def remaining(self):
+        """Seconds left, or None when there is no limit."""
+        if self.cancelled:
+            return 0.0
+        remaining = None
+        if self.expires is not None:
+            remaining = max(0.0, self.expires - time.time())
+        if self.parent is not None:
+            outer = self.parent.remaining()
+            if outer is not None and (remaining is None or
+                                      outer < remaining):
+                remaining = outer
+        return remaining
+
+    def expired(self):
+        return self.remaining() == 0.0
+
+    def clamp(self, timeout):
+        """The smaller of timeout and the time left; None is no limit."""
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        if timeout is None:
+            return remaining
+        return min(timeout, remaining)
+
+    def __enter__(self):
+        _local.__dict__.setdefault('outer', []).append(current())
+        set_current(self)
+        return self
+
+    def __exit__(self, type, value, tb):
+        set_current(_local.outer.pop())
+        return False
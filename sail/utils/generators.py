@@ -14,22 +14,56 @@
 #   limitations under the License.
 #
 import json
+import threading
+
+from sail.utils.allocator import AddressPools
+from sail.utils.allocator import CidrAllocator
+
+
+DEFAULT_SUPERNET = '10.0.0.0/8'
+DEFAULT_PREFIXLEN = 24
 
 
 class ArtifactGenerator(object):
-    def __init__(self):
+    """Payload generators by resource.
+
+    With a run, every generated name carries it, so what one run makes
+    can be told from what any other makes.
+    """
+
+    def __init__(self, run=None):
         self.generators = {}
+        self.run = run
 
     def register_generator(self, generator):
         if not hasattr(generator, 'name'):
             return
         if generator.name not in self.generators:
+            generator.run = self.run
             self.generators[generator.name] = generator
 
-    def generate(self, resource):
+    def generate(self, resource, **kwargs):
+        if resource not in self.generators:
+            return None
+        return self.generators[resource].generate(**kwargs)
+
+    def generate_batch(self, resource, count, **kwargs):
+        """Returns count payloads for resource in one call."""
         if resource not in self.generators:
             return None
-        return self.generators[resource].generate()
+        return self.generators[resource].generate_batch(count, **kwargs)
+
+    def created(self, resource, payloads):
+        """Tells the generator what the endpoint made of its payloads."""
+        if resource in self.generators:
+            self.generators[resource].created(payloads)
+
+    def release(self, resource, payloads):
+        """Gives back what the payloads were allocated once their
+        resources are gone.
+        """
+        if resource in self.generators:
+            self.generators[resource].release(payloads)
 
 
 class BaseGenerator(object):
@@ -37,11 +71,43 @@ class BaseGenerator(object):
         self.generation_number = 0
         self.prefix = 'sail'
         self.join = '_'
+        self.run = None
+        self.lock = threading.Lock()
+
+    def _name_prefix(self, resource):
+        parts = [self.prefix, self.run, resource]
+        return self.join.join(p for p in parts if p) + self.join
 
     def _generate_name(self, resource):
-        self.generation_number += 1
-        return "%s%s%s%s%d" % (self.prefix, self.join, resource, self.join,
-                               self.generation_number)
+        with self.lock:
+            self.generation_number += 1
+            number = self.generation_number
+        return "%s%d" % (self._name_prefix(resource), number)
+
+    def _generate_names(self, resource, count):
+        with self.lock:
+            first = self.generation_number + 1
+            self.generation_number += count
+        prefix = self._name_prefix(resource)
+        return ["%s%d" % (prefix, number)
+                for number in range(first, first + count)]
+
+    def generate(self, **kwargs):
+        return self.generate_batch(1, **kwargs)[0]
+
+    def generate_batch(self, count, **kwargs):
+        return [self.generate(**kwargs) for _ in range(count)]
+
+    def created(self, payloads):
+        pass
+
+    def release(self, payloads):
+        pass
+
+    def _body(self, payload):
+        # Payloads are accepted with or without their resource wrapper.
+        body = payload.get(self.name)
+        return body if isinstance(body, dict) else payload
 
 
 class NetworkGenerator(BaseGenerator):
@@ -51,3 +117,97 @@ class NetworkGenerator(BaseGenerator):
 
     def generate(self):
         return {"network": {"name": self._generate_name("network")}}
+
+    def generate_batch(self, count):
+        return [{"network": {"name": name}}
+                for name in self._generate_names("network", count)]
+
+
+class SubnetGenerator(BaseGenerator):
+    """Subnets whose CIDRs never overlap, carved out of a supernet."""
+
+    def __init__(self, supernet=DEFAULT_SUPERNET,
+                 prefixlen=DEFAULT_PREFIXLEN, pools=None):
+        super(SubnetGenerator, self).__init__()
+        self.name = "subnet"
+        self.cidrs = CidrAllocator(supernet, prefixlen)
+        self.pools = pools
+
+    def generate_batch(self, count, network_id=None):
+        cidrs = self.cidrs.allocate(count)
+        names = self._generate_names("subnet", count)
+        return [{"subnet": {"name": name, "network_id": network_id,
+                            "cidr": cidr,
+                            "ip_version": self.cidrs.version}}
+                for name, cidr in zip(names, cidrs)]
+
+    def created(self, payloads):
+        """Opens the address pools of created subnets."""
+        if self.pools is None:
+            return
+        for payload in payloads:
+            body = self._body(payload)
+            if body.get('id') is not None and body.get('cidr'):
+                self.pools.add_subnet(body['id'], body['cidr'])
+
+    def release(self, payloads):
+        bodies = [self._body(p) for p in payloads]
+        self.cidrs.release([b['cidr'] for b in bodies if b.get('cidr')])
+        if self.pools is not None:
+            for body in bodies:
+                if body.get('id') is not None:
+                    self.pools.remove_subnet(body['id'])
+
+
+class PortGenerator(BaseGenerator):
+    """Ports, with a fixed IP from the subnet's pool when given one."""
+
+    def __init__(self, pools=None):
+        super(PortGenerator, self).__init__()
+        self.name = "port"
+        self.pools = pools if pools is not None else AddressPools()
+
+    def generate_batch(self, count, network_id=None, subnet_id=None):
+        names = self._generate_names("port", count)
+        if subnet_id is None or subnet_id not in self.pools:
+            return [{"port": {"name": name, "network_id": network_id}}
+                    for name in names]
+        addresses = self.pools.allocate(subnet_id, count)
+        return [{"port": {"name": name, "network_id": network_id,
+                          "fixed_ips": [{"subnet_id": subnet_id,
+                                         "ip_address": address}]}}
+                for name, address in zip(names, addresses)]
+
+    def release(self, payloads):
+        for payload in payloads:
+            for fixed_ip in self._body(payload).get('fixed_ips') or []:
+                self.pools.release(fixed_ip.get('subnet_id'),
+                                   [fixed_ip.get('ip_address')])
+
+
+class IPAddressGenerator(BaseGenerator):
+    """IP address requests, taken from the subnet's pool when given one.
+    """
+
+    def __init__(self, pools=None):
+        super(IPAddressGenerator, self).__init__()
+        self.name = "ip_address"
+        self.pools = pools if pools is not None else AddressPools()
+
+    def generate_batch(self, count, network_id=None, port_ids=None,
+                       subnet_id=None, version=4):
+        base = {"network_id": network_id, "version": version,
+                "port_ids": list(port_ids or [])}
+        if subnet_id is None or subnet_id not in self.pools:
+            return [{"ip_address": dict(base)} for _ in range(count)]
+        addresses = self.pools.allocate(subnet_id, count)
+        return [{"ip_address": dict(base, subnet_id=subnet_id,
+                                    ip_address=address)}
+                for address in addresses]
+
+    def release(self, payloads):
+        for payload in payloads:
+            body = self._body(payload)
+            address = body.get('ip_address') or body.get('address')
+            if body.get('subnet_id') and address:
+                self.pools.release(body['subnet_id'], [address])
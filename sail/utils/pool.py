@@ -0,0 +1,146 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import sys
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import sail.utils.deadline as deadline_util
+
+
+class Future(object):
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._done = False
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+
+    def done(self):
+        return self._done
+
+    def set_result(self, result):
+        self._finish(result, None)
+
+    def set_exception(self, exc_info):
+        self._finish(None, exc_info)
+
+    def _finish(self, result, exc_info):
+        with self._cond:
+            self._result = result
+            self._exc_info = exc_info
+            self._done = True
+            callbacks = self._callbacks
+            self._callbacks = []
+            self._cond.notify_all()
+        for callback in callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback):
+        with self._cond:
+            if not self._done:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def wait(self, timeout=None):
+        with self._cond:
+            if not self._done:
+                self._cond.wait(timeout)
+            return self._done
+
+    def exception(self, timeout=None):
+        self.wait(timeout)
+        if self._exc_info is None:
+            return None
+        return self._exc_info[1]
+
+    def result(self, timeout=None):
+        if not self.wait(timeout):
+            raise RuntimeError("Future did not complete in %ss" % timeout)
+        if self._exc_info is not None:
+            raise self._exc_info[1]
+        return self._result
+
+
+def wait_all(futures, timeout=None):
+    """Waits for every future and returns their results in order."""
+    return [f.result(timeout) for f in futures]
+
+
+class WorkerPool(object):
+    """A bounded pool of daemon threads that hands back Futures.
+
+    Work runs under the deadline of the thread that submitted it.
+    """
+
+    def __init__(self, size):
+        self.size = max(1, int(size))
+        self._work = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Cannot submit to a closed pool")
+            self._work.put((future, fn, args, kwargs,
+                            deadline_util.current()))
+            if len(self._threads) < self.size:
+                thread = threading.Thread(target=self._worker)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+        return future
+
+    def map(self, fn, items):
+        return wait_all([self.submit(fn, item) for item in items])
+
+    def _worker(self):
+        while True:
+            item = self._work.get()
+            if item is None:
+                return
+            future, fn, args, kwargs, deadline = item
+            deadline_util.set_current(deadline)
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception:
+                future.set_exception(sys.exc_info())
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            threads = list(self._threads)
+        for _ in threads:
+            self._work.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.shutdown()
+        return False
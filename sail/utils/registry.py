@@ -0,0 +1,90 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import importlib
+import threading
+
+
+def _missing(error, name):
+    """Whether an ImportError says module name itself is missing.
+
+    Errors raised by imports inside an existing module are not.
+    """
+    missing = getattr(error, 'name', None)
+    if missing is None:
+        # Python 2 only names the module in the message, sometimes by its
+        # last component alone.
+        message = str(error)
+        if not message.startswith('No module named '):
+            return False
+        missing = message[len('No module named '):].strip("'")
+    return (name == missing or name.startswith(missing + '.') or
+            name.endswith('.' + missing))
+
+
+def load_object(path):
+    """Imports and returns the object named by a dotted path.
+
+    The longest importable module prefix is imported and the rest of the
+    path is looked up as attributes, so both 'pkg.module.Class' and
+    'pkg.module.Class.attr' work. An ImportError from inside a module that
+    exists is raised as is.
+    """
+    components = path.split('.')
+    for index in range(len(components) - 1, 0, -1):
+        name = '.'.join(components[:index])
+        try:
+            obj = importlib.import_module(name)
+        except ImportError as e:
+            if not _missing(e, name):
+                raise
+            continue
+        for comp in components[index:]:
+            obj = getattr(obj, comp)
+        return obj
+    raise ImportError("Could not import %s" % path)
+
+
+class Registry(object):
+    """Names mapped to dotted paths, imported the first time they are used.
+
+    Keeps modules that pull in heavy dependencies from loading until
+    something actually needs them.
+    """
+
+    def __init__(self, entries=None):
+        self.entries = dict(entries or {})
+        self.loaded = {}
+        self.lock = threading.Lock()
+
+    def register(self, name, path):
+        with self.lock:
+            self.entries[name] = path
+            self.loaded.pop(name, None)
+
+    def names(self):
+        return sorted(self.entries)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def path(self, name):
+        return self.entries[name]
+
+    def get(self, name):
+        with self.lock:
+            if name not in self.loaded:
+                self.loaded[name] = load_object(self.entries[name])
+            return self.loaded[name]
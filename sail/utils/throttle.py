@@ -0,0 +1,116 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import threading
+import time
+
+import sail.exceptions.common as exc
+import sail.utils.conf as conf_util
+
+
+class TokenBucket(object):
+    """Token bucket that hands out send times instead of refusing.
+
+    Every reservation takes a token, letting the bucket go into debt, and
+    returns how long the caller has to wait for that token to exist. That
+    keeps callers in arrival order without holding a lock while sleeping.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(1.0, rate))
+        self.tokens = self.burst
+        self.stamp = time.time()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def refund(self):
+        """Gives back a reserved token that will not be used."""
+        with self.lock:
+            self.tokens = min(self.burst, self.tokens + 1)
+
+
+class Governor(object):
+    """Limits the rate and the number of in-flight requests of a service.
+
+    acquire blocks until the request may go out and returns the seconds
+    spent queued; every acquire has to be paired with a release. Given a
+    deadline, it raises TimedOut instead of waiting past it, holding
+    nothing.
+    """
+
+    # Seconds between checks of a deadline while waiting for a slot, so a
+    # cancelled one is noticed.
+    poll_interval = 0.1
+
+    def __init__(self, rate=None, burst=None, max_in_flight=None):
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.max_in_flight = max_in_flight or None
+        self.in_flight = 0
+        self.cond = threading.Condition()
+
+    @classmethod
+    def from_conf(cls, conf):
+        return cls(rate=conf_util.get_float(conf, 'rate_limit', None),
+                   burst=conf_util.get_float(conf, 'rate_burst', None),
+                   max_in_flight=conf_util.get_int(conf, 'max_in_flight',
+                                                   None))
+
+    def _take_slot(self, deadline):
+        with self.cond:
+            while self.in_flight >= self.max_in_flight:
+                if deadline is None:
+                    self.cond.wait()
+                    continue
+                if deadline.expired():
+                    raise exc.TimedOut("Out of time waiting for a request "
+                                       "slot")
+                self.cond.wait(deadline.clamp(self.poll_interval))
+            self.in_flight += 1
+
+    def _give_slot(self):
+        with self.cond:
+            self.in_flight -= 1
+            self.cond.notify()
+
+    def acquire(self, deadline=None):
+        start = time.time()
+        if self.max_in_flight is not None:
+            self._take_slot(deadline)
+        if self.bucket is not None:
+            wait = self.bucket.reserve()
+            remaining = deadline.remaining() if deadline is not None else None
+            if remaining is not None and wait >= remaining:
+                self.bucket.refund()
+                if self.max_in_flight is not None:
+                    self._give_slot()
+                raise exc.TimedOut("Out of time waiting for the rate limit")
+            if wait > 0:
+                time.sleep(wait)
+        return time.time() - start
+
+    def release(self):
+        if self.max_in_flight is not None:
+            self._give_slot()
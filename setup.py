@@ -23,7 +23,9 @@ required_packages = [
     "requests",
 ]
 
-optional_packages = {}
+optional_packages = {
+    "streaming": ["ijson"],
+}
 
 setup(
     name='sail',
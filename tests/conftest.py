@@ -0,0 +1,49 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import pytest
+
+from sail import log
+from sail.services.network import NetworkService
+from sail import session as session_mod
+from tests.stub import StubEndpoint
+
+
+@pytest.fixture
+def stub():
+    endpoint = StubEndpoint().start()
+    yield endpoint
+    endpoint.stop()
+
+
+@pytest.fixture
+def session():
+    sess = session_mod.Session(log_level=log.ERROR)
+    yield sess
+    sess.close()
+
+
+@pytest.fixture
+def connect(stub, session):
+    """Makes a context on the stub with a network service of options."""
+    services = []
+
+    def connect(**options):
+        service = NetworkService(stub.network_conf(**options))
+        services.append(service)
+        return session.setUp(stub.auth_info(), [service])
+    yield connect
+    for service in services:
+        service.close()
@@ -0,0 +1,211 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+"""A small in-memory networking endpoint for the tests.
+
+It answers token requests and keeps networks, subnets, ports and IP
+addresses in memory. Every request is recorded with its decoded body.
+Listings honour id and name filters, limit and marker. They are capped
+at max_limit and, unless links is off, link to the next page when there
+is more.
+"""
+import json
+import threading
+import uuid
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlsplit
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlsplit
+
+from sail.utils import auth
+
+
+COLLECTIONS = {'networks': 'network', 'subnets': 'subnet', 'ports': 'port',
+               'ip_addresses': 'ip_address'}
+
+
+class Request(object):
+    def __init__(self, method, path, query, body, headers):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.body = body
+        self.headers = headers
+        self.reply = None
+
+    @property
+    def collection(self):
+        parts = self.path.rstrip('/').split('/')
+        return parts[-1] if parts[-1] in COLLECTIONS else parts[-2]
+
+    @property
+    def id(self):
+        parts = self.path.rstrip('/').split('/')
+        return None if parts[-1] in COLLECTIONS else parts[-1]
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self, method):
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else None
+        if body:
+            body = json.loads(body.decode('utf-8'))
+        request = Request(method, url.path, parse_qs(url.query), body,
+                          dict(self.headers.items()))
+        status, reply = self.server.stub.handle(request)
+        request.reply = reply
+        self._send(status, reply)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+
+class StubEndpoint(object):
+    def __init__(self, max_limit=None, tenant='tenant-1', links=True):
+        self.max_limit = max_limit
+        self.links = links
+        self.tenant = tenant
+        self.store = dict((c, {}) for c in COLLECTIONS)
+        self.requests = []
+        self.lock = threading.Lock()
+        # Hook called with every request before it is answered.
+        self.before = None
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        self.server.stub = self
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       args=(0.05,))
+        self.thread.daemon = True
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d" % self.server.server_address[1]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def made(self, method, collection):
+        """The recorded requests of one method on one collection."""
+        return [r for r in self.requests
+                if r.method == method and r.collection == collection]
+
+    def network_conf(self, **options):
+        conf = {'endpoint': self.url, 'version': 'v2.0'}
+        conf.update(options)
+        return {'network': conf}
+
+    def auth_info(self):
+        conf = {'auth': {'endpoint': self.url + '/v2.0/tokens',
+                         'auth_method': 'sail.utils.auth.RackspaceAuth',
+                         'username': 'user', 'api_key': 'key',
+                         'cache_token': 'false'}}
+        return auth.do_auth(None, conf)
+
+    def add(self, collection, **item):
+        item.setdefault('id', str(uuid.uuid4()))
+        item.setdefault('status', 'ACTIVE')
+        with self.lock:
+            self.store[collection][item['id']] = item
+        return item
+
+    def handle(self, request):
+        with self.lock:
+            self.requests.append(request)
+        if self.before is not None:
+            self.before(request)
+        if request.path.endswith('/tokens'):
+            return 200, {'access': {
+                'token': {'id': 'token-' + uuid.uuid4().hex[:8],
+                          'expires': '2099-01-01T00:00:00Z',
+                          'tenant': {'id': self.tenant}},
+                'serviceCatalog': []}}
+        if request.collection not in COLLECTIONS:
+            return 404, None
+        return getattr(self, '_' + request.method.lower())(
+            request, request.collection, request.id)
+
+    def _post(self, request, collection, id):
+        single = COLLECTIONS[collection]
+        if isinstance(request.body.get(collection), list):
+            return 201, {collection: [self.add(collection, **dict(info))
+                                      for info in request.body[collection]]}
+        return 201, {single: self.add(collection,
+                                      **dict(request.body[single]))}
+
+    def _delete(self, request, collection, id):
+        with self.lock:
+            found = self.store[collection].pop(id, None)
+        return (204, None) if found is not None else (404, None)
+
+    def _get(self, request, collection, id):
+        with self.lock:
+            items = sorted(self.store[collection].values(),
+                           key=lambda i: i['id'])
+        if id is not None:
+            for item in items:
+                if item['id'] == id:
+                    return 200, {COLLECTIONS[collection]: item}
+            return 404, None
+        query = request.query
+        for key in ('id', 'name'):
+            if key in query:
+                items = [i for i in items if i.get(key) in query[key]]
+        if 'marker' in query:
+            items = [i for i in items if i['id'] > query['marker'][0]]
+        limit = int(query['limit'][0]) if 'limit' in query else None
+        if self.max_limit is not None:
+            limit = min(limit or self.max_limit, self.max_limit)
+        body = {collection: items[:limit] if limit else items}
+        if self.links and limit:
+            body[collection + '_links'] = []
+            if len(items) > limit:
+                body[collection + '_links'].append({
+                    'rel': 'next',
+                    'href': "%s/v2.0/%s?limit=%d&marker=%s" % (
+                        self.url, collection, limit, items[limit - 1]['id'])})
+        return 200, body
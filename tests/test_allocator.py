@@ -0,0 +1,91 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import pytest
+
+import sail.exceptions.common as exc
+from sail.utils import allocator
+
+
+def test_indexes_are_lowest_free_first():
+    indexes = allocator.IndexAllocator(8)
+    assert indexes.allocate(4) == [0, 1, 2, 3]
+    indexes.release([2, 0])
+    assert indexes.allocate(3) == [0, 2, 4]
+
+
+def test_releasing_what_is_not_taken_is_ignored():
+    indexes = allocator.IndexAllocator(4)
+    indexes.allocate(2)
+    indexes.release([1, 1, 3, 9])
+    assert indexes.used == 1
+
+
+def test_huge_range_only_grows_as_far_as_it_is_used():
+    indexes = allocator.IndexAllocator(2 ** 64)
+    indexes.allocate(10)
+    assert len(indexes.bitmap) == 2
+
+
+def test_allocating_more_than_is_free_fails_whole():
+    indexes = allocator.IndexAllocator(3)
+    indexes.allocate(2)
+    with pytest.raises(exc.ResourceExhausted):
+        indexes.allocate(2)
+    assert indexes.allocate(1) == [2]
+
+
+def test_cidr_blocks_do_not_overlap():
+    blocks = allocator.CidrAllocator('10.0.0.0/16', 24)
+    assert blocks.allocate(3) == ['10.0.0.0/24', '10.0.1.0/24',
+                                  '10.0.2.0/24']
+    blocks.release(['10.0.1.0/24', '192.168.0.0/24', '10.0.5.0/25'])
+    assert blocks.allocate() == ['10.0.1.0/24']
+
+
+def test_cidr_blocks_of_ipv6():
+    blocks = allocator.CidrAllocator('fd00::/48', 64)
+    assert blocks.allocate(2) == ['fd00::/64', 'fd00:0:0:1::/64']
+
+
+def test_cidr_blocks_bigger_than_the_supernet_are_refused():
+    with pytest.raises(exc.DataFormatError):
+        allocator.CidrAllocator('10.0.0.0/24', 16)
+
+
+@pytest.mark.parametrize('cidr', ['10.0.0.0', '10.0.0.0/33', '10.0.0/8',
+                                  'nonsense/8', None])
+def test_invalid_cidrs_are_refused(cidr):
+    with pytest.raises(exc.DataFormatError):
+        allocator.parse_cidr(cidr)
+
+
+def test_address_pool_keeps_network_gateway_and_broadcast():
+    pool = allocator.AddressPool('10.0.0.0/29')
+    addresses = pool.allocate(5)
+    assert addresses == ['10.0.0.%d' % n for n in range(2, 7)]
+    with pytest.raises(exc.ResourceExhausted):
+        pool.allocate()
+    pool.release(['10.0.0.4', '10.0.1.4'])
+    assert pool.allocate() == ['10.0.0.4']
+
+
+def test_address_pools_need_a_known_subnet():
+    pools = allocator.AddressPools()
+    pools.add_subnet('s1', '10.0.0.0/24')
+    assert pools.allocate('s1', 2) == ['10.0.0.2', '10.0.0.3']
+    pools.remove_subnet('s1')
+    with pytest.raises(exc.MissingRequiredInformation):
+        pools.allocate('s1')
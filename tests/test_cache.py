@@ -0,0 +1,89 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import threading
+import time
+
+from sail.services.cache import ReadCache
+from sail.utils.pool import WorkerPool
+
+
+class Response(object):
+    success = True
+
+
+def _slow_fetch(calls):
+    lock = threading.Lock()
+
+    def fetch():
+        with lock:
+            calls.append(None)
+        time.sleep(0.1)
+        return Response(), None
+    return fetch
+
+
+def _unused(etag):
+    raise AssertionError("nothing was cached with an ETag")
+
+
+def _read_together(cache, fetch, count, **kwargs):
+    with WorkerPool(count) as pool:
+        futures = [pool.submit(cache.get, 'networks', {}, fetch, _unused,
+                               **kwargs) for _ in range(count)]
+        return [f.result() for f in futures]
+
+
+def test_identical_reads_are_all_sent_by_default():
+    calls = []
+    cache = ReadCache()
+    _read_together(cache, _slow_fetch(calls), 4)
+    assert len(calls) == 4
+    assert cache.coalesced == 0
+
+
+def test_identical_reads_share_a_request_when_asked():
+    calls = []
+    cache = ReadCache(coalesce=True)
+    responses = _read_together(cache, _slow_fetch(calls), 4)
+    assert len(calls) == 1
+    assert cache.coalesced == 3
+    assert all(r is responses[0] for r in responses)
+
+
+def test_coalescing_is_opt_in_from_conf():
+    assert not ReadCache.from_conf({}).coalesce
+    assert ReadCache.from_conf({'coalesce_reads': 'true'}).coalesce
+
+
+def test_reads_under_other_tenants_are_not_shared():
+    calls = []
+    cache = ReadCache(ttl=60)
+    fetch = _slow_fetch(calls)
+    first = cache.get('networks', {}, fetch, _unused, tenant='a')
+    assert cache.get('networks', {}, fetch, _unused, tenant='a') is first
+    assert cache.get('networks', {}, fetch, _unused, tenant='b') is not first
+    assert len(calls) == 2
+
+
+def test_a_write_drops_cached_reads_for_every_tenant():
+    calls = []
+    cache = ReadCache(ttl=60)
+    fetch = _slow_fetch(calls)
+    for tenant in ('a', 'b', 'a', 'b'):
+        cache.get('networks', {}, fetch, _unused, tenant=tenant)
+    cache.invalidate('networks')
+    cache.get('networks', {}, fetch, _unused, tenant='a')
+    assert len(calls) == 3
@@ -0,0 +1,120 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import gzip
+import json
+
+import pytest
+import requests
+
+from sail import cassette
+import sail.exceptions.common as exc
+
+
+ID = '0b5b8a3e-1c7d-4a8f-9d6e-2f4a7c9b1e3d'
+
+
+def _interaction(key, body, status=200):
+    return {'key': key, 'status': status,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps(body), 'elapsed': 0.01}
+
+
+@pytest.fixture
+def replay():
+    replayers = []
+
+    def replay(interactions, **kwargs):
+        replayer = cassette.Replayer(cassette.Cassette(interactions),
+                                     **kwargs).start()
+        replayers.append(replayer)
+        return replayer
+    yield replay
+    for replayer in replayers:
+        replayer.stop()
+
+
+def test_request_key_sorts_the_query():
+    assert cassette.request_key('get', 'http://h/v2.0/ports?b=2&a=1') == \
+        'GET /v2.0/ports?a=1&b=2'
+
+
+def test_template_key_blanks_ids():
+    key = 'DELETE /v2.0/networks/%s' % ID
+    assert cassette.template_key(key) == 'DELETE /v2.0/networks/{id}'
+
+
+def test_recording_scrubs_the_token_and_round_trips(tmpdir, stub):
+    tape = cassette.Cassette()
+    requests.post(stub.url + '/v2.0/tokens', data='{}', hooks=tape.hooks())
+    requests.get(stub.url + '/v2.0/networks?name=a', hooks=tape.hooks())
+    path = str(tmpdir.join('tape.json.gz'))
+    tape.save(path)
+
+    loaded = cassette.Cassette.load(path)
+    assert [i['key'] for i in loaded.interactions] == \
+        ['POST /v2.0/tokens', 'GET /v2.0/networks?name=a']
+    token = json.loads(loaded.interactions[0]['body'])['access']['token']
+    assert token['id'] == cassette.REPLAYED_TOKEN
+    assert 'expires' not in token
+
+
+def test_other_cassette_versions_are_refused(tmpdir):
+    path = str(tmpdir.join('tape.json.gz'))
+    with gzip.open(path, 'wb') as f:
+        f.write(b'{"version": 99, "interactions": []}')
+    with pytest.raises(exc.ParsingError):
+        cassette.Cassette.load(path)
+    with pytest.raises(exc.ParsingError):
+        cassette.Cassette.load(str(tmpdir.join('missing.json.gz')))
+
+
+def test_replay_hands_out_recorded_responses_in_turn(replay):
+    replayer = replay([_interaction('GET /v2.0/networks', {'n': 1}),
+                       _interaction('GET /v2.0/networks', {'n': 2})])
+    bodies = [requests.get(replayer.url + '/v2.0/networks').json()['n']
+              for _ in range(3)]
+    assert bodies == [1, 2, 1]
+
+
+def test_replay_matches_new_ids_by_template(replay):
+    replayer = replay([_interaction('DELETE /v2.0/networks/%s' % ID, None,
+                                    status=204)])
+    url = replayer.url + '/v2.0/networks/6f1c2d3e-4b5a-4c6d-8e7f-9a0b1c2d3e4f'
+    assert requests.delete(url).status_code == 204
+    assert requests.get(replayer.url + '/v2.0/ports').status_code == 404
+
+
+def test_rewrite_keeps_the_path(replay):
+    replayer = replay([])
+    assert replayer.rewrite('https://example.com:9696/v2.0?x=1') == \
+        replayer.url + '/v2.0?x=1'
+
+
+def test_latency_is_added_to_every_response():
+    replayer = cassette.Replayer(cassette.Cassette(), latency='recorded')
+    try:
+        assert replayer.delay({'elapsed': 0.25}) == 0.25
+        replayer.latency, replayer.jitter = 0.1, 0.05
+        assert 0.1 <= replayer.delay({}) <= 0.15
+    finally:
+        replayer.stop()
+
+
+def test_parse_latency():
+    assert cassette.parse_latency('0.5') == 0.5
+    assert cassette.parse_latency('recorded') == 'recorded'
+    with pytest.raises(exc.DataFormatError):
+        cassette.parse_latency('slow')
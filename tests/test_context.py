@@ -0,0 +1,73 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import time
+
+import sail.exceptions.common as exc
+import sail.tasks.network as net
+from sail.tasks.scheduler import Scheduler
+
+
+def _slow_posts(stub, seconds):
+    def before(request):
+        if request.method == 'POST' and request.collection == 'networks':
+            time.sleep(seconds)
+    stub.before = before
+
+
+def test_teardown_deletes_what_timed_out_creates_made(stub, connect):
+    _slow_posts(stub, 0.3)
+    stub.add('networks', name='sail_network_1')
+    context = connect(read_timeout=0.1)
+    with context:
+        task = net.BulkCreateNetworks()
+        try:
+            task(count=3)
+        except exc.TimedOut:
+            pass
+        # The endpoint finishes the create after the client gave up.
+        time.sleep(0.4)
+        assert len(stub.store['networks']) == 4
+    assert context.reaped == 3
+    # Only names of this run are looked for; another run's are kept.
+    assert [n['name'] for n in stub.store['networks'].values()] == \
+        ['sail_network_1']
+
+
+def test_teardown_undoes_dependents_first(stub, connect):
+    context = connect()
+    with context:
+        scheduler = Scheduler(workers=4)
+        network = scheduler.add(net.BulkCreateNetworks(), count=2)
+        for index in range(2):
+            scheduler.add(net.BulkCreateSubnets(parent=network,
+                                                parent_index=index),
+                          count=2)
+        scheduler.run()
+    deletes = [r.collection for r in stub.requests if r.method == 'DELETE']
+    assert deletes == ['subnets'] * 4 + ['networks'] * 2
+    assert context.undone == 3 and not context.undo_failures
+
+
+def test_run_budget_times_out_tasks(stub, connect):
+    _slow_posts(stub, 0.5)
+    context = connect()
+    context.run_budget = 0.2
+    with context:
+        scheduler = Scheduler(workers=2)
+        task = scheduler.add(net.CreateNetwork())
+        scheduler.run()
+    assert task.timed_out
+    assert scheduler.timed_out == [task]
@@ -0,0 +1,52 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import time
+
+import sail.utils.deadline as deadline_util
+from sail.utils.deadline import Deadline
+
+
+def test_child_deadline_runs_out_with_its_parent():
+    parent = Deadline(0.05)
+    child = parent.child(60)
+    assert child.remaining() <= 0.05
+    time.sleep(0.06)
+    assert child.expired()
+
+
+def test_cancel_runs_out_every_deadline_under_it():
+    parent = Deadline()
+    child = parent.child()
+    assert child.remaining() is None
+    parent.cancel()
+    assert child.expired()
+
+
+def test_clamp_takes_the_smaller_limit():
+    assert Deadline().clamp(5) == 5
+    assert Deadline().clamp(None) is None
+    assert Deadline(1).clamp(5) <= 1
+    assert Deadline(60).clamp(5) == 5
+    assert 0 < Deadline(1).clamp(None) <= 1
+
+
+def test_entering_deadlines_nests():
+    outer, inner = Deadline(), Deadline()
+    with outer:
+        with inner:
+            assert deadline_util.current() is inner
+        assert deadline_util.current() is outer
+    assert deadline_util.current() is None
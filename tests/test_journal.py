@@ -0,0 +1,99 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import os
+
+from sail import journal
+
+
+def _journal_path(directory, pid):
+    return os.path.join(str(directory), "1-%d-abcdef12.jsonl" % pid)
+
+
+def test_only_creates_never_deleted_are_outstanding(tmpdir):
+    path = _journal_path(tmpdir, os.getpid())
+    undo = journal.UndoJournal(path)
+    undo.record(journal.CREATE, 'network', 'http://a', 'networks',
+                ['n1', 'n2'])
+    undo.record(journal.CREATE, 'network', 'http://b', 'networks', ['n1'])
+    undo.record(journal.DELETE, 'network', 'http://a', 'networks', ['n1'])
+    undo.close()
+    entries = journal.read_journal(path)
+    assert [(e['endpoint'], e['id']) for e in entries] == \
+        [('http://a', 'n2'), ('http://b', 'n1')]
+
+
+def test_torn_last_line_is_ignored(tmpdir):
+    path = _journal_path(tmpdir, os.getpid())
+    undo = journal.UndoJournal(path)
+    undo.record(journal.CREATE, 'network', 'http://a', 'networks', ['n1'])
+    undo.close()
+    with open(path, 'a') as f:
+        f.write('{"op": "delete", "resource": "netw')
+    assert [e['id'] for e in journal.read_journal(path)] == ['n1']
+
+
+def test_settled_journal_is_removed_on_close(tmpdir):
+    path = _journal_path(tmpdir, os.getpid())
+    undo = journal.UndoJournal(path)
+    undo.record(journal.CREATE, 'network', 'http://a', 'ports', ['p1'])
+    undo.record(journal.DELETE, 'network', 'http://a', 'ports', ['p1'])
+    undo.close()
+    assert not os.path.exists(path)
+
+
+def test_reopened_journal_knows_what_is_outstanding(tmpdir):
+    path = _journal_path(tmpdir, os.getpid())
+    undo = journal.UndoJournal(path)
+    undo.record(journal.CREATE, 'network', 'http://a', 'ports', ['p1'])
+    undo.close()
+    undo = journal.UndoJournal(path)
+    assert undo.outstanding == set([('http://a', 'ports', 'p1')])
+    undo.close()
+    assert os.path.exists(path)
+
+
+def test_resume_deletes_dependents_first(tmpdir, stub, connect):
+    context = connect()
+    service = context.request_service('network')
+    network = stub.add('networks')
+    subnet = stub.add('subnets', network_id=network['id'])
+    path = _journal_path(tmpdir, os.getpid())
+    undo = journal.UndoJournal(path)
+    undo.record(journal.CREATE, 'network', service.endpoint, 'networks',
+                [network['id'], 'gone'])
+    undo.record(journal.CREATE, 'network', service.endpoint, 'subnets',
+                [subnet['id']])
+    undo.record(journal.CREATE, 'network', 'http://elsewhere', 'networks',
+                ['n9'])
+    undo.close()
+
+    report = journal.Resumer(context, str(tmpdir), force=True).resume()
+    deletes = [r.collection for r in stub.requests if r.method == 'DELETE']
+    assert deletes[0] == 'subnets'
+    assert (report.deleted, report.gone, report.skipped) == (2, 1, 1)
+    assert not report.failures
+    # Only what was skipped is still outstanding.
+    assert [e['id'] for e in journal.read_journal(path)] == ['n9']
+
+
+def test_journals_of_live_runs_are_left_alone(tmpdir, connect):
+    path = _journal_path(tmpdir, os.getpid())
+    undo = journal.UndoJournal(path)
+    undo.record(journal.CREATE, 'network', 'http://a', 'networks', ['n1'])
+    undo.close()
+    report = journal.Resumer(connect(), str(tmpdir)).resume()
+    assert report.busy == [path]
+    assert report.outstanding == 0
@@ -0,0 +1,92 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import json
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from sail import log
+
+
+class Formatted(object):
+    """Counts how often it is formatted."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __str__(self):
+        self.count += 1
+        return "formatted"
+
+
+class Unwritable(object):
+    def __str__(self):
+        raise ValueError("cannot format")
+
+
+def test_records_below_the_level_are_never_formatted():
+    stream = StringIO()
+    logger = log.SessionLogger(level=log.INFO, stream=stream)
+    value = Formatted()
+    logger.log(log.DEBUG, None, "Task", "DEBUG", "%s", value)
+    logger.log(log.INFO, None, "Task", None, "%s", value)
+    logger.close()
+    assert value.count == 1
+    assert stream.getvalue() == "[Task]formatted\n"
+
+
+def test_records_are_streamed_as_json_lines(tmpdir):
+    path = str(tmpdir.join('log.jsonl'))
+    logger = log.SessionLogger(stream=StringIO(), json_path=path)
+    logger.log(log.ERROR, None, "Task", "FAIL", "%d != %d", 201, 409)
+    logger.close()
+    with open(path) as f:
+        records = [json.loads(line) for line in f]
+    assert [(r['level'], r['tag'], r['message']) for r in records] == \
+        [('ERROR', 'FAIL', '201 != 409')]
+
+
+def test_unwritable_record_is_dropped_alone(capsys):
+    stream = StringIO()
+    logger = log.SessionLogger(stream=stream)
+    logger.log(log.INFO, None, "A", None, "first")
+    logger.log(log.INFO, None, "B", None, "%s", Unwritable())
+    logger.log(log.INFO, None, "C", None, "last")
+    logger.close()
+    assert stream.getvalue().splitlines() == ["[A]first", "[C]last"]
+    assert "dropped log record: ValueError" in capsys.readouterr().err
+
+
+def test_history_keeps_the_latest_records():
+    logger = log.SessionLogger(history=2, stream=StringIO())
+    for n in range(5):
+        logger.log(log.INFO, None, "Task", None, "%d", n)
+    logger.close()
+    assert [r.message for r in logger.history] == ["3", "4"]
+
+
+def test_flush_waits_for_the_writer():
+    stream = StringIO()
+    logger = log.SessionLogger(stream=stream, batch_size=2)
+    for n in range(10):
+        logger.log(log.INFO, None, "Task", None, "%d", n)
+    logger.flush()
+    assert len(stream.getvalue().splitlines()) == 10
+    logger.close()
+    logger.log(log.INFO, None, "Task", None, "after close")
+    assert len(stream.getvalue().splitlines()) == 10
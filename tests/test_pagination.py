@@ -0,0 +1,93 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import pytest
+
+from sail.services import base
+
+
+@pytest.fixture(params=['streamed', 'parsed'])
+def decoding(request, monkeypatch):
+    if request.param == 'parsed':
+        monkeypatch.setattr(base, 'ijson', None)
+    elif base.ijson is None:
+        pytest.skip("ijson is not installed")
+    return request.param
+
+
+def _networks(stub, count):
+    return sorted(stub.add('networks', name='net-%d' % i, mtu=1.5)['id']
+                  for i in range(count))
+
+
+def test_iter_follows_next_links_past_a_capped_limit(stub, connect,
+                                                     decoding):
+    stub.max_limit = 3
+    ids = _networks(stub, 12)
+    context = connect(page_size=5)
+    service = context.request_service('network')
+    items = list(service.iter_networks(context))
+    assert [n['id'] for n in items] == ids
+    assert all(type(n['mtu']) is float for n in items)
+    assert len(stub.made('GET', 'networks')) == 4
+
+
+def test_get_reads_the_whole_collection_past_a_capped_limit(stub, connect,
+                                                            decoding):
+    stub.max_limit = 3
+    ids = _networks(stub, 12)
+    context = connect(page_size=5)
+    resp = context.request_service('network').get_networks(context)
+    assert [n['id'] for n in resp.body['networks']] == ids
+
+
+def test_without_links_full_pages_are_read_on(stub, connect, decoding):
+    stub.links = False
+    ids = _networks(stub, 10)
+    context = connect(page_size=5)
+    items = list(context.request_service('network').iter_networks(context))
+    assert [n['id'] for n in items] == ids
+    # Two full pages and the empty one that ends it.
+    assert len(stub.made('GET', 'networks')) == 3
+
+
+def test_last_page_has_no_next_link(stub, connect, decoding):
+    ids = _networks(stub, 6)
+    context = connect(page_size=3)
+    items = list(context.request_service('network').iter_networks(context))
+    assert [n['id'] for n in items] == ids
+    assert len(stub.made('GET', 'networks')) == 2
+
+
+def test_filters_go_with_every_page(stub, connect, decoding):
+    stub.max_limit = 2
+    _networks(stub, 6)
+    wanted = sorted(stub.add('networks', name='wanted')['id']
+                    for _ in range(5))
+    context = connect(page_size=10)
+    items = list(context.request_service('network').iter_networks(
+        context, name='wanted'))
+    assert [n['id'] for n in items] == wanted
+    assert all(r.query['name'] == ['wanted']
+               for r in stub.made('GET', 'networks'))
+
+
+def test_listings_are_paged_by_default(stub, connect, decoding):
+    ids = _networks(stub, 250)
+    context = connect()
+    items = list(context.request_service('network').iter_networks(context))
+    assert [n['id'] for n in items] == ids
+    requests = stub.made('GET', 'networks')
+    assert [r.query['limit'] for r in requests] == [['100']] * 3
@@ -0,0 +1,96 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import time
+
+from sail.services.poller import StatusPoller
+
+
+def _poller(context, **kwargs):
+    kwargs.setdefault('interval', 0.02)
+    return StatusPoller(context.request_service('network'), 'networks',
+                        **kwargs)
+
+
+def _activate_after(stub, polls):
+    """Turns every network ACTIVE once polled that many times."""
+    def before(request):
+        if request.method != 'GET' or request.collection != 'networks':
+            return
+        if len(stub.made('GET', 'networks')) >= polls:
+            for item in stub.store['networks'].values():
+                item['status'] = 'ACTIVE'
+    stub.before = before
+
+
+def test_waits_until_every_resource_is_ready(stub, connect):
+    context = connect()
+    ids = [stub.add('networks', status='BUILD')['id'] for _ in range(3)]
+    _activate_after(stub, 3)
+    result = _poller(context).wait(context, ids, 5).result()
+    assert result.success
+    assert sorted(result.ready) == sorted(ids)
+    assert len(stub.made('GET', 'networks')) == 3
+
+
+def test_waits_in_one_context_share_each_poll(stub, connect):
+    context = connect()
+    first, second = [stub.add('networks', status='BUILD')['id']
+                     for _ in range(2)]
+    _activate_after(stub, 2)
+    poller = _poller(context, interval=0.2)
+    futures = [poller.wait(context, [first], 5),
+               poller.wait(context, [second], 5)]
+    assert all(f.result().success for f in futures)
+    polled = [sorted(r.query['id']) for r in stub.made('GET', 'networks')]
+    assert sorted([first, second]) in polled
+
+
+def test_polls_are_split_into_batches(stub, connect):
+    context = connect()
+    ids = [stub.add('networks')['id'] for _ in range(5)]
+    result = _poller(context, batch=2).wait(context, ids, 5).result()
+    assert result.success
+    assert [len(r.query['id']) for r in stub.made('GET', 'networks')] == \
+        [2, 2, 1]
+
+
+def test_error_status_fails_the_wait(stub, connect):
+    context = connect()
+    good = stub.add('networks')['id']
+    bad = stub.add('networks', status='ERROR')['id']
+    result = _poller(context).wait(context, [good, bad], 5).result()
+    assert not result.success
+    assert result.failed == {bad: 'ERROR'}
+    assert list(result.ready) == [good]
+
+
+def test_resources_still_pending_at_the_deadline_time_out(stub, connect):
+    context = connect()
+    id = stub.add('networks', status='BUILD')['id']
+    start = time.time()
+    result = _poller(context).wait(context, [id], 0.2).result()
+    assert 0.15 < time.time() - start < 1.0
+    assert result.timed_out == [id]
+
+
+def test_interval_backs_off_while_nothing_changes(stub, connect):
+    context = connect()
+    id = stub.add('networks', status='BUILD')['id']
+    poller = _poller(context, interval=0.01, backoff=2, max_interval=0.08)
+    poller.wait(context, [id], 0.5).result()
+    assert poller.current == 0.08
+    # Without backing off it would have polled about fifty times.
+    assert len(stub.made('GET', 'networks')) < 15
@@ -0,0 +1,83 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import threading
+import time
+
+import pytest
+
+import sail.utils.deadline as deadline_util
+from sail.utils.deadline import Deadline
+from sail.utils.pool import Future, WorkerPool
+
+
+def test_map_keeps_the_order_of_its_items():
+    with WorkerPool(4) as pool:
+        assert pool.map(lambda n: n * n, range(10)) == [n * n for n in
+                                                         range(10)]
+
+
+def test_pool_runs_no_more_than_its_size_at_once():
+    lock = threading.Lock()
+    running = [0, 0]
+
+    def work(_):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+    with WorkerPool(3) as pool:
+        pool.map(work, range(9))
+    assert running[1] == 3
+
+
+def test_failure_is_raised_from_result():
+    with WorkerPool(1) as pool:
+        future = pool.submit(int, 'not a number')
+        with pytest.raises(ValueError):
+            future.result()
+        assert isinstance(future.exception(), ValueError)
+
+
+def test_work_runs_under_the_submitters_deadline():
+    deadline = Deadline(10)
+    with WorkerPool(1) as pool:
+        with deadline:
+            future = pool.submit(deadline_util.current)
+        assert future.result() is deadline
+        assert pool.submit(deadline_util.current).result() is None
+
+
+def test_closed_pool_refuses_work():
+    pool = WorkerPool(1)
+    pool.shutdown()
+    with pytest.raises(RuntimeError):
+        pool.submit(int, 1)
+
+
+def test_callback_added_after_completion_runs_at_once():
+    future = Future()
+    seen = []
+    future.add_done_callback(seen.append)
+    future.set_result(1)
+    future.add_done_callback(seen.append)
+    assert seen == [future, future]
+
+
+def test_result_gives_up_after_its_timeout():
+    with pytest.raises(RuntimeError):
+        Future().result(0.01)
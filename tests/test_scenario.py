@@ -0,0 +1,202 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import configobj
+import pytest
+
+import sail.exceptions.common as exc
+from sail import scenario
+
+
+TREE = """
+[steps]
+    [[nets]]
+    task = CreateNetworks
+    count = 2
+    [[subs]]
+    task = CreateSubnets
+    count = 3
+    from = nets
+    [[ports]]
+    task = CreatePorts
+    count = 4
+    from = subs
+"""
+
+
+def _plan(text):
+    conf = configobj.ConfigObj(text.strip().splitlines())
+    return scenario.compile_scenario(conf)
+
+
+def _created(stub, collection):
+    """The resources the stub made, as it answered the POSTs."""
+    items = []
+    for request in stub.made('POST', collection):
+        reply = request.reply
+        items.extend(reply[collection] if collection in reply
+                     else [reply[collection[:-1]]])
+    return items
+
+
+def test_creates_go_on_the_resources_of_their_source(stub, connect):
+    with connect():
+        _plan(TREE).run()
+    networks = set(n['id'] for n in _created(stub, 'networks'))
+    subnets = _created(stub, 'subnets')
+    ports = _created(stub, 'ports')
+    assert len(subnets) == 3 and len(ports) == 4
+    # Spread evenly: 2 + 1 subnets, and 2 + 1 + 1 ports.
+    per_network = [s['network_id'] for s in subnets]
+    assert set(per_network) == networks
+    assert sorted(per_network.count(n) for n in networks) == [1, 2]
+    per_subnet = [p['fixed_ips'][0]['subnet_id'] for p in ports]
+    assert set(per_subnet) == set(s['id'] for s in subnets)
+    by_id = dict((s['id'], s) for s in subnets)
+    assert all(p['network_id'] == by_id[p['fixed_ips'][0]['subnet_id']]
+               ['network_id'] for p in ports)
+
+
+def test_children_are_undone_before_their_parents(stub, connect):
+    with connect():
+        _plan(TREE).run()
+    deletes = [r.collection for r in stub.requests if r.method == 'DELETE']
+    assert deletes == ['ports'] * 4 + ['subnets'] * 3 + ['networks'] * 2
+    assert not any(stub.store.values())
+
+
+def test_delete_from_a_spread_create_empties_every_task(stub, connect):
+    plan = _plan("""
+[steps]
+    [[nets]]
+    task = CreateNetworks
+    count = 2
+    [[subs]]
+    task = CreateSubnets
+    count = 3
+    from = nets
+    [[drop]]
+    task = DeleteSubnets
+    from = subs
+""")
+    assert plan.estimate() == ({'POST': 3, 'DELETE': 3}, 2)
+    with connect():
+        plan.run()
+    # Nothing is deleted twice: undo leaves the dropped subnets alone.
+    assert len(stub.made('DELETE', 'subnets')) == 3
+    assert len(stub.made('DELETE', 'networks')) == 2
+    assert not any(stub.store.values())
+
+
+@pytest.mark.parametrize('task, source', [
+    ('CreateNetworks', 'nets'),
+    ('CreatePorts', 'nets'),
+    ('CreateSubnets', 'list'),
+])
+def test_create_from_rejects_what_it_cannot_go_on(task, source):
+    with pytest.raises(exc.ParsingError):
+        _plan("""
+[steps]
+    [[list]]
+    task = GetNetworks
+    [[nets]]
+    task = CreateNetworks
+    count = 2
+    [[child]]
+    task = %s
+    from = %s
+""" % (task, source))
+
+
+def test_slice_keeps_children_with_their_parents():
+    plan = _plan(TREE.replace('count = 2', 'count = 1'))
+    counts = []
+    for index in range(3):
+        part = plan.slice(index, 3)
+        counts.append(dict((s.name, s.count) for s in part.steps))
+    assert counts[0] == {'nets': 1, 'subs': 3, 'ports': 4}
+    assert counts[1] == counts[2] == {}
+
+
+def test_steps_compile_into_stages_and_call_estimates():
+    plan = _plan("""
+[scenario]
+    name = small
+    workers = 3
+[steps]
+    [[list]]
+    task = GetNetworks
+    count = 2
+    [[nets]]
+    task = CreateNetwork
+    count = 250
+    chunk_size = 100
+    status = 201
+    [[one]]
+    task = CreateNetwork
+    after = list
+    [[cleanup]]
+    task = DeleteNetwork
+    from = nets
+""")
+    assert (plan.name, plan.workers) == ('small', 3)
+    # A delete follows every create of its resource, not only its source.
+    assert [[s.name for s in stage] for stage in plan.stages] == \
+        [['list', 'nets'], ['one'], ['cleanup']]
+    nets = plan.by_name['nets']
+    assert (nets.task_name, nets.status, nets.calls()) == \
+        ('BulkCreateNetworks', 201, 3)
+    assert plan.by_name['one'].task_name == 'CreateNetwork'
+    # A delete takes its count from the create it empties.
+    assert plan.by_name['cleanup'].count == 250
+    assert plan.estimate() == ({'GET': 2, 'POST': 4, 'DELETE': 250}, 1)
+
+
+def test_args_are_decoded_as_json_where_they_can_be():
+    plan = _plan("""
+[steps]
+    [[nets]]
+    task = CreateNetwork
+        [[[args]]]
+        admin_state_up = false
+        tags = '["a", "b"]'
+        description = plain text
+""")
+    assert plan.by_name['nets'].args == {'admin_state_up': False,
+                                         'tags': ['a', 'b'],
+                                         'description': 'plain text'}
+
+
+@pytest.mark.parametrize('steps, error', [
+    ("", exc.MissingRequiredInformation),
+    ("[[a]]\ncount = 1", exc.MissingRequiredInformation),
+    ("[[a]]\ntask = MakeCoffee", exc.ParsingError),
+    ("[[a]]\ntask = GetNetworks\ncolour = blue", exc.ParsingError),
+    ("[[a]]\ntask = GetNetworks\ncount = many", exc.DataFormatError),
+    ("[[a]]\ntask = CreateNetwork\nwait = soon", exc.DataFormatError),
+    ("[[a]]\ntask = GetNetworks\nafter = b", exc.ParsingError),
+    ("[[a]]\ntask = DeleteSubnet\nfrom = b\n[[b]]\ntask = CreateNetwork",
+     exc.ParsingError),
+    ("[[a]]\ntask = GetNetworks\nafter = b\n"
+     "[[b]]\ntask = GetNetworks\nafter = a", exc.DependencyCycle),
+])
+def test_invalid_scenarios_are_refused(steps, error):
+    with pytest.raises(error):
+        _plan("[steps]\n" + steps)
+
+
+def test_missing_scenario_file_is_a_parsing_error(tmpdir):
+    with pytest.raises(exc.ParsingError):
+        scenario.load_scenario(str(tmpdir.join('missing.conf')))
@@ -0,0 +1,127 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import threading
+import time
+
+import pytest
+
+import sail.exceptions.common as exc
+from sail.tasks.scheduler import Scheduler
+from sail.tasks.task import Task
+from sail.utils.deadline import Deadline
+
+
+class Step(Task):
+    """Records when it ran; fails when told to, or sleeps."""
+
+    lock = threading.Lock()
+
+    def __init__(self, log, fail=False, sleep=0, **kwargs):
+        super(Step, self).__init__(**kwargs)
+        self.ran = log
+        self.fail = fail
+        self.sleep = sleep
+
+    def __call__(self):
+        time.sleep(self.sleep)
+        with self.lock:
+            self.ran.append(self)
+        if self.fail:
+            self.success = False
+
+
+@pytest.fixture
+def context(session):
+    return session.setUp(None, [])
+
+
+def test_stages_follow_produces_and_consumes(context):
+    ran = []
+    network = Step(ran, produces=['network'])
+    subnet = Step(ran, consumes=['network'], produces=['subnet'])
+    other = Step(ran)
+    port = Step(ran, consumes=['subnet'])
+    scheduler = Scheduler()
+    for task in (port, subnet, network, other):
+        scheduler.add(task)
+    assert scheduler.stages() == [[network, other], [subnet], [port]]
+    scheduler.run()
+    assert ran.index(network) < ran.index(subnet) < ran.index(port)
+    assert set(scheduler.completed) == set([network, subnet, other, port])
+
+
+def test_independent_tasks_run_side_by_side(context):
+    ran = []
+    scheduler = Scheduler(workers=4)
+    for _ in range(4):
+        scheduler.add(Step(ran, sleep=0.2))
+    start = time.time()
+    scheduler.run()
+    assert time.time() - start < 0.5
+    assert len(ran) == 4
+
+
+def test_cycle_is_refused(context):
+    ran = []
+    first = Step(ran, produces=['a'], consumes=['b'])
+    second = Step(ran, produces=['b'], consumes=['a'])
+    scheduler = Scheduler()
+    scheduler.add(first)
+    scheduler.add(second)
+    with pytest.raises(exc.DependencyCycle):
+        scheduler.run()
+    assert not ran
+
+
+def test_failure_skips_what_depends_on_it(context):
+    ran = []
+    broken = Step(ran, fail=True, produces=['a'])
+    child = Step(ran, consumes=['a'], produces=['b'])
+    grandchild = Step(ran, depends_on=[child])
+    other = Step(ran)
+    scheduler = Scheduler()
+    for task in (broken, child, grandchild, other):
+        scheduler.add(task)
+    scheduler.run()
+    assert scheduler.failed == [broken]
+    assert scheduler.skipped == [child, grandchild]
+    assert scheduler.completed == [other]
+    assert not child.was_successful()
+
+
+def test_exception_is_raised_after_the_run(context):
+    class Raising(Task):
+        def __call__(self):
+            raise ValueError("boom")
+    ran = []
+    scheduler = Scheduler()
+    scheduler.add(Raising())
+    scheduler.add(Step(ran))
+    with pytest.raises(ValueError):
+        scheduler.run()
+    assert len(ran) == 1
+
+
+def test_out_of_budget_cancels_what_has_not_started(context):
+    ran = []
+    slow = Step(ran, sleep=0.3, produces=['a'])
+    later = Step(ran, consumes=['a'])
+    scheduler = Scheduler(budget=Deadline(0.1))
+    scheduler.add(slow)
+    scheduler.add(later)
+    scheduler.run()
+    assert scheduler.cancelled == [later]
+    assert later not in ran
@@ -0,0 +1,115 @@
+#
+# Copyright 2015 Justin Hammond
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+import threading
+import time
+
+import pytest
+
+import sail.exceptions.common as exc
+from sail.utils.deadline import Deadline
+from sail.utils.pool import WorkerPool
+from sail.utils.throttle import Governor, TokenBucket
+
+
+def test_bucket_hands_out_send_times_in_order():
+    bucket = TokenBucket(10, burst=2)
+    waits = [bucket.reserve() for _ in range(4)]
+    assert waits[:2] == [0.0, 0.0]
+    assert 0.05 < waits[2] < waits[3] <= 0.2
+
+
+def test_refunded_token_is_handed_out_again():
+    bucket = TokenBucket(1, burst=1)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() > 0.9
+    bucket.refund()
+    assert bucket.reserve() > 0.9
+
+
+def test_rate_wait_past_the_deadline_times_out():
+    governor = Governor(rate=0.5)
+    governor.acquire(Deadline(1.0))
+    start = time.time()
+    with pytest.raises(exc.TimedOut):
+        governor.acquire(Deadline(1.0))
+    assert time.time() - start < 0.1
+    # The refused token went back: the next caller is not pushed later.
+    assert governor.bucket.reserve() <= 2.0
+
+
+def test_slot_wait_past_the_deadline_times_out():
+    governor = Governor(max_in_flight=1)
+    governor.acquire()
+    start = time.time()
+    with pytest.raises(exc.TimedOut):
+        governor.acquire(Deadline(0.2))
+    assert 0.15 < time.time() - start < 1.0
+    governor.release()
+    # Nothing is held after the timeout.
+    assert governor.acquire(Deadline(0.2)) < 0.1
+    governor.release()
+
+
+def test_cancelled_deadline_stops_a_slot_wait():
+    governor = Governor(max_in_flight=1)
+    governor.acquire()
+    deadline = Deadline(10.0)
+    threading.Timer(0.1, deadline.cancel).start()
+    start = time.time()
+    with pytest.raises(exc.TimedOut):
+        governor.acquire(deadline)
+    assert time.time() - start < 1.0
+
+
+def test_slots_limit_requests_in_flight():
+    governor = Governor(max_in_flight=2)
+    lock = threading.Lock()
+    state = {'now': 0, 'peak': 0}
+
+    def work():
+        governor.acquire()
+        with lock:
+            state['now'] += 1
+            state['peak'] = max(state['peak'], state['now'])
+        time.sleep(0.02)
+        with lock:
+            state['now'] -= 1
+        governor.release()
+    with WorkerPool(6) as pool:
+        for f in [pool.submit(work) for _ in range(12)]:
+            f.result()
+    assert state['peak'] == 2
+
+
+def test_requests_queued_past_the_budget_time_out(stub, connect):
+    context = connect(rate_limit=0.5)
+    service = context.request_service('network')
+    results = []
+
+    def create():
+        with Deadline(1.0):
+            try:
+                service.create_network(context, {'network': {}})
+                results.append('created')
+            except exc.TimedOut:
+                results.append('timed out')
+    start = time.time()
+    with WorkerPool(5) as pool:
+        for f in [pool.submit(create) for _ in range(5)]:
+            f.result()
+    assert time.time() - start < 1.5
+    assert sorted(results) == ['created'] + ['timed out'] * 4
+    assert len(stub.made('POST', 'networks')) == 1